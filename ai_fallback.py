@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import sqlite3
+import threading
+
+from invoice_store import user_data_dir
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+AI_MODEL = "gpt-4.1-mini"
+SCHEMA_PATH = os.path.join(BASE_DIR, "invoice_schema.json")
+
+INSTRUCTIONS = (
+    "Wyciągnij z treści faktury: seller_name, netto, vat, currency. "
+    "Zwróć WYŁĄCZNIE JSON zgodny ze schematem. "
+    "Jeśli nie masz pewności, ustaw null i daj confidence=low. "
+    "W evidence.seller_line wklej linię, z której wziąłeś sprzedawcę. "
+    "W evidence.totals_line wklej linię/fragment z sumami netto/VAT."
+)
+
+# safety: nie wysyłamy za dużo tekstu nawet jeśli ktoś poda śmietnik
+MAX_INPUT_CHARS = 8000
+
+
+def load_schema(path: str = SCHEMA_PATH) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)  # {"name": "...", "schema": {...}}
+
+
+def make_ai_key(text: str, model: str, schema_pack: dict, instructions: str = INSTRUCTIONS) -> str:
+    """Klucz cache = hash (tekst po extract_relevant_lines + model + schemat + instrukcje)."""
+    h = hashlib.sha256()
+    for part in (
+        text[:MAX_INPUT_CHARS],
+        model,
+        json.dumps(schema_pack, sort_keys=True, ensure_ascii=False),
+        instructions,
+    ):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AICache:
+    """Trwały cache odpowiedzi AI w SQLite (tylko udane odpowiedzi)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # dostęp z wątku GUI/workera i z pętli asyncio -> jedna blokada na połączenie
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, model: str, response: dict):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created) VALUES (?, ?, ?, ?)",
+                (key, model, json.dumps(response, ensure_ascii=False), time.time()),
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def default_ai_cache_path() -> str:
+    # folder danych użytkownika, nie folder programu (Program Files / udział sieciowy bywają tylko do odczytu)
+    return os.path.join(user_data_dir(), "ai_cache.sqlite")
+
+
+def _is_retryable(e: Exception) -> bool:
+    # 429 / 5xx / problemy z połączeniem -> ponawiamy; 400/401/... -> nie ma sensu
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(e).__name__ in ("APIConnectionError", "APITimeoutError") or isinstance(
+        e, (asyncio.TimeoutError, ConnectionError)
+    )
+
+
+class AIFallback:
+    """
+    Warstwa AI dla niekompletnych faktur:
+    - jeden klient (sync + async) i jeden wczytany schemat na cały proces,
+    - trwały cache odpowiedzi (ten sam tekst = zero kosztu przy kolejnym przebiegu),
+    - extract_many: zapytania współbieżnie (asyncio, max `concurrency` naraz) z ponowieniami.
+    base_url (albo OPENAI_BASE_URL) pozwala podpiąć lokalny serwer testowy (serve_stub).
+    """
+
+    def __init__(
+        self,
+        model: str = AI_MODEL,
+        schema_path: str = SCHEMA_PATH,
+        cache_path: str | None = None,
+        base_url: str | None = None,
+        api_key: str | None = None,
+        concurrency: int = 4,
+        max_retries: int = 4,
+        backoff: float = 1.0,
+        timeout: float = 60.0,
+    ):
+        self.model = model
+        self.schema_pack = load_schema(schema_path)
+        self.cache = AICache(cache_path or default_ai_cache_path())
+        self.base_url = base_url or os.environ.get("OPENAI_BASE_URL") or None
+        self.api_key = api_key
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.stats = {"cached": 0, "calls": 0, "retries": 0, "failed": 0}
+
+        self._client = None
+        self._aclient = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _client_kwargs(self) -> dict:
+        api_key = self.api_key or os.environ.get("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("Brak zmiennej środowiskowej OPENAI_API_KEY")
+        # ponowienia robimy sami (backoff + jitter), SDK ma nie powtarzać drugi raz
+        kwargs = {"api_key": api_key, "max_retries": 0, "timeout": self.timeout}
+        if self.base_url:
+            kwargs["base_url"] = self.base_url
+        return kwargs
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(**self._client_kwargs())
+            return self._client
+
+    def _async_client(self):
+        # klient async jest związany z pętlą -> trzymamy własną pętlę przez cały czas życia obiektu
+        if self._aclient is None:
+            from openai import AsyncOpenAI
+            self._aclient = AsyncOpenAI(**self._client_kwargs())
+        return self._aclient
+
+    def key(self, text: str) -> str:
+        return make_ai_key(text, self.model, self.schema_pack)
+
+    def _request(self, text: str) -> dict:
+        return {
+            "model": self.model,
+            "instructions": INSTRUCTIONS,
+            "input": text[:MAX_INPUT_CHARS],
+            "text": {
+                "format": {
+                    "type": "json_schema",
+                    "name": self.schema_pack["name"],
+                    "schema": self.schema_pack["schema"],
+                    "strict": True,
+                }
+            },
+        }
+
+    def _delay(self, attempt: int) -> float:
+        return min(30.0, self.backoff * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+    def extract(self, text: str) -> dict:
+        """Jedno zapytanie (synchronicznie) z cache i ponowieniami; błąd -> wyjątek."""
+        key = self.key(text)
+        hit = self.cache.get(key)
+        if hit is not None:
+            self.stats["cached"] += 1
+            return hit
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.stats["calls"] += 1
+                resp = self.client.responses.create(**self._request(text))
+                result = json.loads(resp.output_text)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(self._delay(attempt))
+
+        self.cache.put(key, self.model, result)
+        return result
+
+    async def _extract_async(self, text: str, key: str, sem: asyncio.Semaphore):
+        client = self._async_client()
+        async with sem:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.stats["calls"] += 1
+                    resp = await client.responses.create(**self._request(text))
+                    result = json.loads(resp.output_text)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retries or not _is_retryable(e):
+                        self.stats["failed"] += 1
+                        return None
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self._delay(attempt))
+
+        self.cache.put(key, self.model, result)
+        return result
+
+    async def _gather(self, pending: dict) -> dict:
+        sem = asyncio.Semaphore(self.concurrency)
+        keys = list(pending)
+        results = await asyncio.gather(*(self._extract_async(pending[k], k, sem) for k in keys))
+        return dict(zip(keys, results))
+
+    def extract_many(self, texts: list) -> list:
+        """
+        Odpowiedzi dla listy tekstów (w tej samej kolejności); None = brak odpowiedzi po ponowieniach.
+        Duplikaty w paczce idą do API raz, trafienia z cache wcale.
+        """
+        keys = [self.key(t) for t in texts]
+        answers = {}
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key in answers or key in pending:
+                continue
+            hit = self.cache.get(key)
+            if hit is not None:
+                self.stats["cached"] += 1
+                answers[key] = hit
+            else:
+                pending[key] = text
+
+        if pending:
+            try:
+                if self._loop is None:
+                    self._loop = asyncio.new_event_loop()
+                answers.update(self._loop.run_until_complete(self._gather(pending)))
+            except (RuntimeError, ImportError):
+                # brak klucza API / pakietu openai -> jak dotychczas: brak odpowiedzi AI, bez przerywania
+                self.stats["failed"] += len(pending)
+
+        return [answers.get(k) for k in keys]
+
+    def close(self):
+        if self._loop is not None:
+            if self._aclient is not None:
+                self._loop.run_until_complete(self._aclient.close())
+            self._loop.close()
+            self._loop = None
+        if self._client is not None:
+            self._client.close()
+        self.cache.close()
+
+
+# ===================== SERWER TESTOWY (bez prawdziwego API) =====================
+
+def serve_stub(host: str = "127.0.0.1", port: int = 8765, answer: dict | None = None, delay: float = 0.0,
+               fail_first: int = 0, fail_status: int = 429):
+    """
+    Minimalny serwer udający POST /v1/responses (Responses API) - do testów bez kosztów:
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=test ...
+    Zwraca serwer (serve_forever w osobnym wątku); odpowiedź stała albo `answer`.
+    fail_first=N -> pierwsze N zapytań dostaje fail_status (429 / 5xx) - test ponowień z backoffem.
+    server.requests = treści wszystkich zapytań (także odrzuconych), port=0 -> wolny port (server.server_port).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    answer = answer or {
+        "seller_name": "STUB SP. Z O.O.",
+        "netto": 100.0,
+        "vat": 23.0,
+        "currency": "PLN",
+        "confidence": "low",
+        "evidence": {"seller_line": None, "totals_line": None},
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if delay:
+                time.sleep(delay)
+            with self.server.lock:
+                self.server.requests.append(body)
+                failing = len(self.server.requests) <= fail_first
+            if failing:
+                self._send(fail_status, {"error": {
+                    "message": "stub: sztuczny błąd", "type": "server_error", "param": None, "code": None,
+                }})
+                return
+            self._send(200, {
+                "id": "resp_stub",
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": body.get("model", AI_MODEL),
+                "status": "completed",
+                "output": [{
+                    "type": "message",
+                    "id": "msg_stub",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [{"type": "output_text", "text": json.dumps(answer), "annotations": []}],
+                }],
+            })
+
+        def _send(self, status: int, data: dict):
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.requests = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lokalny serwer testowy udający Responses API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-first", type=int, default=0, help="pierwsze N zapytań kończy się błędem")
+    parser.add_argument("--fail-status", type=int, default=429)
+    args = parser.parse_args()
+    srv = serve_stub(port=args.port, fail_first=args.fail_first, fail_status=args.fail_status)
+    print(f"Stub AI: http://127.0.0.1:{args.port}/v1 (Ctrl+C kończy)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        srv.shutdown()
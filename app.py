@@ -1,6 +1,9 @@
 import sys
 import os
 import subprocess
+import threading
+import multiprocessing
+from datetime import datetime
 
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout,
@@ -14,7 +17,7 @@ class OCRWorker(QObject):
     finished = Signal(dict)
     failed = Signal(str)
 
-    def __init__(self, folder_path, ocr_out, poppler_bin, tesseract_exe, tessdata_dir, dpi=300, first_page_only=True):
+    def __init__(self, folder_path, ocr_out, poppler_bin, tesseract_exe, tessdata_dir, dpi=300, first_page_only=True, workers=1, low_dpi=None):
         super().__init__()
         self.folder_path = folder_path
         self.ocr_out = ocr_out
@@ -23,6 +26,10 @@ class OCRWorker(QObject):
         self.tessdata_dir = tessdata_dir
         self.dpi = dpi
         self.first_page_only = first_page_only
+        self.workers = workers
+        self.low_dpi = low_dpi
+        # przerwanie na granicy pliku (przycisk "Przerwij"); reszta zostaje w dzienniku OCR
+        self.cancel_event = threading.Event()
 
     def run(self):
         try:
@@ -44,43 +51,123 @@ class OCRWorker(QObject):
                 dpi=self.dpi,
                 first_page_only=self.first_page_only,
                 on_progress=cb,
+                workers=self.workers,
+                low_dpi=self.low_dpi,
+                cancel=self.cancel_event,
             )
             self.finished.emit(stats)
         except Exception as e:
             self.failed.emit(repr(e))
 
 class XlsxWorker(QObject):
-    finished = Signal(str)
+    progress = Signal(int, int, str)  # current, total, filename
+    finished = Signal(dict)
     failed = Signal(str)
 
-    def __init__(self, script_path, folder_path, output_dir):
+    def __init__(self, folder_path, output_dir, workers=1):
         super().__init__()
-        self.script_path = script_path
         self.folder_path = folder_path
         self.output_dir = output_dir
+        self.workers = workers
 
     def run(self):
         try:
-            result = subprocess.run(
-                [sys.executable, self.script_path, "--folder", self.folder_path, "--output", self.output_dir],
-                check=True,
-                capture_output=True,
-                text=True
+            # generate_xlsx w tym samym procesie (bez nowego interpretera i ponownego importu pandas)
+            from generate_excel import build_xlsx
+            from invoice_store import default_store_path
+
+            timer = QElapsedTimer()
+            timer.start()
+
+            def cb(filename, current, total):
+                # przy tysiącach plików nie zalewamy GUI sygnałami: max ~20/s + ostatni plik
+                if current == total or timer.elapsed() >= 50:
+                    timer.restart()
+                    self.progress.emit(int(current), int(total), str(filename))
+
+            stats = build_xlsx(
+                self.folder_path,
+                self.output_dir,
+                workers=self.workers,
+                on_progress=cb,
+                store=default_store_path(),
             )
+            self.finished.emit(stats)
+        except Exception as e:
+            self.failed.emit(repr(e))
+
+
+class PipelineWorker(QObject):
+    progress = Signal(int, int, str)  # current, total, filename (OCR)
+    finished = Signal(dict)
+    failed = Signal(str)
+
+    def __init__(self, folder_path, ocr_out, output_dir, tessdata_dir, ocr_kwargs):
+        super().__init__()
+        self.folder_path = folder_path
+        self.ocr_out = ocr_out
+        self.output_dir = output_dir
+        self.tessdata_dir = tessdata_dir
+        self.ocr_kwargs = ocr_kwargs
+        self.cancel_event = threading.Event()
 
-            out = (result.stdout or "") + "\n" + (result.stderr or "")
+    def run(self):
+        try:
+            os.environ["TESSDATA_PREFIX"] = self.tessdata_dir
 
-            # generate_excel.py printuje: "Gotowe. Plik zapisany: <path>"
-            output_path = ""
-            for line in out.splitlines():
-                if "Gotowe. Plik zapisany:" in line:
-                    output_path = line.split("Gotowe. Plik zapisany:", 1)[1].strip()
-                    break
+            # OCR i ekstrakcja jednocześnie (kolejka z limitem), xlsx zaraz po ostatnim PDF-ie
+            from pipeline import ocr_to_xlsx
+            from invoice_store import default_store_path
 
-            self.finished.emit(output_path)
+            def cb(filename, current, total):
+                self.progress.emit(int(current), int(total), str(filename))
 
-        except subprocess.CalledProcessError as e:
-            self.failed.emit(f"generate_excel.py zakończył się błędem.\n\n{repr(e)}")
+            result = ocr_to_xlsx(
+                self.folder_path,
+                self.output_dir,
+                out_txt_folder=self.ocr_out,
+                on_progress=cb,
+                cancel=self.cancel_event,
+                store=default_store_path(),
+                **self.ocr_kwargs,
+            )
+            self.finished.emit(result)
+        except Exception as e:
+            self.failed.emit(repr(e))
+
+
+class WatchWorker(QObject):
+    batch = Signal(dict)  # info partii z watch.watch_folder
+    finished = Signal()
+    failed = Signal(str)
+
+    def __init__(self, folder_path, ocr_out, output_dir, tessdata_dir, ocr_kwargs):
+        super().__init__()
+        self.folder_path = folder_path
+        self.ocr_out = ocr_out
+        self.output_dir = output_dir
+        self.tessdata_dir = tessdata_dir
+        self.ocr_kwargs = ocr_kwargs
+        self.stop_event = threading.Event()
+
+    def run(self):
+        try:
+            os.environ["TESSDATA_PREFIX"] = self.tessdata_dir
+
+            # pętla do czasu stop_event: nowe PDF-y -> OCR + ekstrakcja -> wynik_na_zywo.xlsx
+            from watch import watch_folder
+            from invoice_store import default_store_path
+
+            watch_folder(
+                self.folder_path,
+                self.output_dir,
+                out_txt_folder=self.ocr_out,
+                stop=self.stop_event,
+                on_batch=self.batch.emit,
+                store=default_store_path(),
+                **self.ocr_kwargs,
+            )
+            self.finished.emit()
         except Exception as e:
             self.failed.emit(repr(e))
 
@@ -133,9 +220,22 @@ class FakturyApp(QWidget):
         self.btn_main.setEnabled(False)
         self.btn_main.clicked.connect(self.run_ocr_and_xlsx)
 
+        # przerwanie OCR po bieżącym pliku; ponowne uruchomienie wznawia z dziennika
+        self.btn_cancel = QPushButton("Przerwij")
+        self.btn_cancel.setVisible(False)
+        self.btn_cancel.clicked.connect(self.cancel_ocr)
+
         layout.addWidget(self.btn_ocr)
         layout.addWidget(self.btn_xlsx)
+        # tryb ciągły: OCR + xlsx dla każdego nowego PDF-a w folderze (watch.py)
+        self.btn_watch = QPushButton("Obserwuj folder (na żywo)")
+        self.btn_watch.setCheckable(True)
+        self.btn_watch.setEnabled(False)
+        self.btn_watch.toggled.connect(self.toggle_watch)
+
         layout.addWidget(self.btn_main)
+        layout.addWidget(self.btn_watch)
+        layout.addWidget(self.btn_cancel)
 
         self.progress = QProgressBar()
         self.progress.setVisible(False)
@@ -156,9 +256,14 @@ class FakturyApp(QWidget):
         self.xlsx_worker = None
         self._ocr_stats = None
         self._ocr_error = None
-        self._after_ocr = None
         self._xlsx_error = None
         self._xlsx_done = False
+        self._xlsx_stats = None
+        self._xlsx_cancelled = False
+        self._cancel_event = None
+        self.watch_thread = None
+        self.watch_worker = None
+        self._watch_rows = 0
 
 
     def choose_folder(self):
@@ -180,6 +285,23 @@ class FakturyApp(QWidget):
     def update_buttons_state(self):
         ready = bool(self.folder_path) and bool(self.output_dir)
         self.btn_main.setEnabled(ready)
+        self.btn_watch.setEnabled(ready)
+
+    def _show_cancel(self, event):
+        self._cancel_event = event
+        self.btn_cancel.setEnabled(True)
+        self.btn_cancel.setVisible(True)
+
+    def _hide_cancel(self):
+        self._cancel_event = None
+        self.btn_cancel.setVisible(False)
+
+    def cancel_ocr(self):
+        if self._cancel_event is None:
+            return
+        self._cancel_event.set()
+        self.btn_cancel.setEnabled(False)
+        self.label.setText("Przerywanie po bieżącym pliku...")
 
     def update_counter(self, current, total, filename):
         self.label.setText(
@@ -188,19 +310,20 @@ class FakturyApp(QWidget):
             f"Plik: {os.path.basename(filename)}"
         )
 
-    def run_ocr(self):
+    def _prepare_ocr(self, require_pdfs=True):
+        """Walidacja folderów i narzędzi OCR; zwraca folder TXT albo None (komunikat już pokazany)."""
         if not self.folder_path:
             QMessageBox.warning(self, "Błąd", "Nie wybrano folderu z fakturami")
-            return
+            return None
 
         if not self.output_dir:
             QMessageBox.warning(self, "Błąd", "Nie wybrano folderu wyników (.xlsx)")
-            return
+            return None
 
         pdf_files = [f for f in os.listdir(self.folder_path) if f.lower().endswith(".pdf")]
-        if not pdf_files:
+        if require_pdfs and not pdf_files:
             QMessageBox.warning(self, "Brak plików", "W wybranym folderze nie ma plików PDF")
-            return
+            return None
 
         # output TXT
         ocr_out = os.path.join(self.folder_path, "ocr_txt")
@@ -223,7 +346,7 @@ class FakturyApp(QWidget):
                 f"Nie znaleziono Popplera w:\n{self.poppler_bin}\n\n"
                 f"Wymagane pliki:\n- pdfinfo.exe\n- pdftoppm.exe"
             )
-            return
+            return None
 
         # czy pdfinfo uruchamia się
         try:
@@ -236,14 +359,21 @@ class FakturyApp(QWidget):
                 "Najczęstsza przyczyna: brak Microsoft Visual C++ Redistributable.\n\n"
                 f"Szczegóły: {repr(e)}"
             )
-            return
+            return None
 
         if not os.path.exists(self.tesseract_exe):
             QMessageBox.critical(self, "Brak Tesseracta", f"Nie znaleziono tesseract.exe w:\n{self.tesseract_exe}")
-            return
+            return None
 
         if not os.path.isdir(self.tessdata_dir):
             QMessageBox.critical(self, "Brak tessdata", f"Nie znaleziono folderu tessdata:\n{self.tessdata_dir}")
+            return None
+
+        return ocr_out
+
+    def run_ocr(self):
+        ocr_out = self._prepare_ocr()
+        if ocr_out is None:
             return
 
         # reset buffers
@@ -261,9 +391,12 @@ class FakturyApp(QWidget):
             tesseract_exe=self.tesseract_exe,
             tessdata_dir=self.tessdata_dir,
             dpi=300,
-            first_page_only=True
+            first_page_only=True,
+            workers=os.cpu_count() or 1,
+            low_dpi=150,  # 300 DPI tylko dla stron, które w 150 wyszły słabo
         )
         self.worker.moveToThread(self.thread)
+        self._show_cancel(self.worker.cancel_event)
 
         self.thread.started.connect(self.worker.run)
 
@@ -288,29 +421,31 @@ class FakturyApp(QWidget):
             self.btn_ocr.setEnabled(True)
             self.btn_xlsx.setEnabled(True)
             self.btn_main.setEnabled(True)
+            self.btn_watch.setEnabled(True)
 
             self.progress.setVisible(False)
+            self._hide_cancel()
 
             if self._ocr_error:
                 QMessageBox.critical(self, "Błąd OCR", self._ocr_error)
                 return
 
             stats = self._ocr_stats or {"total": 0, "skipped": 0, "done": 0, "errors": 0}
+            cancelled = stats.get("cancelled", False)
             QMessageBox.information(
                 self,
-                "OCR zakończony",
+                "OCR przerwany" if cancelled else "OCR zakończony",
                 f"PDF: {stats['total']}\n"
                 f"Pominięte (już miały TXT): {stats['skipped']}\n"
+                f"W tym wznowione z dziennika: {stats.get('resumed', 0)}\n"
                 f"Nowo zrobione OCR: {stats['done']}\n"
-                f"Błędy: {stats['errors']}\n\n"
+                f"W tym z warstwy tekstu PDF: {stats.get('text_layer', 0)}\n"
+                f"Błędy: {stats['errors']}\n"
+                f"Pominięte po powtarzających się błędach: {stats.get('skipped_errors', 0)}\n\n"
                 f"TXT zapisane w:\n{ocr_out}"
+                + ("\n\nPonowne uruchomienie OCR dokończy pozostałe pliki." if cancelled else "")
             )
 
-            if self._after_ocr == "xlsx":
-                self._after_ocr = None
-                self.run_xlsx()
-
-
         # queued connections = brak akcji UI z workera
         self.worker.progress.connect(self.update_counter, Qt.QueuedConnection)
         self.worker.finished.connect(on_worker_finished, Qt.QueuedConnection)
@@ -341,21 +476,26 @@ class FakturyApp(QWidget):
         self.btn_ocr.setEnabled(False)
         self.btn_xlsx.setEnabled(False)
         self.btn_main.setEnabled(False)
+        self.btn_watch.setEnabled(False)
 
         self.label.setText("Generowanie pliku .xlsx...\nProszę czekać.")
         self.progress.setVisible(True)
+        # nieokreślony pasek tylko do pierwszego pliku (import pandas, listowanie folderu)
         self.progress.setRange(0, 0)
 
         self._xlsx_error = None
         self._xlsx_done = False
         self._xlsx_output_path = ""
+        self._xlsx_stats = None
+        self._xlsx_cancelled = False
 
-        script = os.path.join(self.app_dir, "generate_excel.py")
         self.xlsx_thread = QThread()
-        self.xlsx_worker = XlsxWorker(script, self.folder_path, self.output_dir)
+        # ekstrakcja z TXT jest szybka - pula procesów kosztuje więcej niż daje
+        self.xlsx_worker = XlsxWorker(self.folder_path, self.output_dir)
         self.xlsx_worker.moveToThread(self.xlsx_thread)
 
         self.xlsx_thread.started.connect(self.xlsx_worker.run)
+        self.xlsx_worker.progress.connect(self.update_xlsx_progress, Qt.QueuedConnection)
         self.xlsx_worker.finished.connect(self.on_xlsx_finished, Qt.QueuedConnection)
         self.xlsx_worker.failed.connect(self.on_xlsx_failed, Qt.QueuedConnection)
         self.xlsx_thread.finished.connect(self.on_xlsx_thread_finished, Qt.QueuedConnection)
@@ -366,10 +506,19 @@ class FakturyApp(QWidget):
 
         self.xlsx_thread.start()
 
-    def on_xlsx_finished(self, output_path: str):
+    def update_xlsx_progress(self, current, total, filename):
+        self.progress.setRange(0, total)
+        self.progress.setValue(current)
+        self.label.setText(
+            f"Generowanie pliku .xlsx...\n"
+            f"Zrobione: {current}/{total}\n"
+            f"Plik: {os.path.basename(filename)}"
+        )
+
+    def on_xlsx_finished(self, stats: dict):
         self._xlsx_done = True
-        self._xlsx_output_path = ""
-        self._xlsx_output_path = output_path or ""
+        self._xlsx_stats = stats
+        self._xlsx_output_path = stats.get("output_file") or ""
         if self.xlsx_thread:
             self.xlsx_thread.quit()
 
@@ -383,19 +532,38 @@ class FakturyApp(QWidget):
         self.btn_ocr.setEnabled(True)
         self.btn_xlsx.setEnabled(True)
         self.btn_main.setEnabled(True)
+        self.btn_watch.setEnabled(True)
 
         self.progress.setVisible(False)
         self.progress.setRange(0, 100)
+        self._hide_cancel()
 
         if self._xlsx_error:
             QMessageBox.critical(self, "Błąd generowania xlsx", self._xlsx_error)
             return
 
+        if self._xlsx_cancelled:
+            QMessageBox.information(
+                self,
+                "Przerwano",
+                "OCR przerwany - plik .xlsx nie powstał.\n"
+                "Ponowne uruchomienie dokończy pozostałe pliki (gotowe zostają w dzienniku)."
+            )
+            return
+
         if self._xlsx_done:
             path = self._xlsx_output_path.strip()
 
             if path:
-                QMessageBox.information(self, "Gotowe", f"Plik zapisany:\n{path}")
+                stats = self._xlsx_stats or {}
+                QMessageBox.information(
+                    self,
+                    "Gotowe",
+                    f"Plik zapisany:\n{path}\n\n"
+                    f"Pliki TXT: {stats.get('files', 0)}\n"
+                    f"Wiersze: {stats.get('rows', 0)}\n"
+                    f"Pominięte (zła nazwa pliku): {stats.get('skipped', 0)}"
+                )
                 folder = os.path.dirname(path)
             else:
                 QMessageBox.information(
@@ -426,13 +594,165 @@ class FakturyApp(QWidget):
                 self.label.setText("Nie wybrano folderu")
 
     def run_ocr_and_xlsx(self):
-        # Najpierw OCR, potem xlsx
-        # Po OCR chcemy odpalić xlsx AUTOMATYCZNIE — więc w run_ocr zrobimy “callback”.
-        self._after_ocr = "xlsx"
-        self.run_ocr()
+        # OCR + xlsx jako potok: każdy gotowy TXT od razu idzie do ekstrakcji (pipeline.py)
+        ocr_out = self._prepare_ocr()
+        if ocr_out is None:
+            return
+
+        self.btn_choose.setEnabled(False)
+        self.btn_ocr.setEnabled(False)
+        self.btn_xlsx.setEnabled(False)
+        self.btn_main.setEnabled(False)
+        self.btn_watch.setEnabled(False)
+
+        self.label.setText("OCR + xlsx w toku...")
+        self.progress.setVisible(True)
+        self.progress.setRange(0, 0)
+
+        self._xlsx_error = None
+        self._xlsx_done = False
+        self._xlsx_output_path = ""
+        self._xlsx_stats = None
+        self._xlsx_cancelled = False
+
+        self.xlsx_thread = QThread()
+        self.xlsx_worker = PipelineWorker(
+            folder_path=self.folder_path,
+            ocr_out=ocr_out,
+            output_dir=self.output_dir,
+            tessdata_dir=self.tessdata_dir,
+            ocr_kwargs=self._ocr_kwargs(),
+        )
+        self.xlsx_worker.moveToThread(self.xlsx_thread)
+        self._show_cancel(self.xlsx_worker.cancel_event)
+
+        def on_pipeline_finished(result):
+            if result["xlsx"] is None:
+                self._xlsx_cancelled = True
+                self.xlsx_thread.quit()
+                return
+            self.on_xlsx_finished(result["xlsx"])
+
+        self.xlsx_thread.started.connect(self.xlsx_worker.run)
+        self.xlsx_worker.progress.connect(self.update_pipeline_progress, Qt.QueuedConnection)
+        self.xlsx_worker.finished.connect(on_pipeline_finished, Qt.QueuedConnection)
+        self.xlsx_worker.failed.connect(self.on_xlsx_failed, Qt.QueuedConnection)
+        self.xlsx_thread.finished.connect(self.on_xlsx_thread_finished, Qt.QueuedConnection)
+
+        self.xlsx_worker.finished.connect(self.xlsx_worker.deleteLater)
+        self.xlsx_worker.failed.connect(self.xlsx_worker.deleteLater)
+        self.xlsx_thread.finished.connect(self.xlsx_thread.deleteLater)
+
+        self.xlsx_thread.start()
+
+    def _ocr_kwargs(self):
+        # wspólne ustawienia OCR dla potoku OCR + xlsx i trybu obserwowania
+        return {
+            "poppler_path": self.poppler_bin,
+            "tesseract_cmd": self.tesseract_exe,
+            "dpi": 300,
+            "first_page_only": True,
+            "workers": os.cpu_count() or 1,
+            "low_dpi": 150,
+        }
+
+    def toggle_watch(self, checked):
+        if checked:
+            self.start_watch()
+        else:
+            self.stop_watch()
+
+    def start_watch(self):
+        ocr_out = self._prepare_ocr(require_pdfs=False)
+        if ocr_out is None:
+            self.btn_watch.blockSignals(True)
+            self.btn_watch.setChecked(False)
+            self.btn_watch.blockSignals(False)
+            return
+
+        self.btn_choose.setEnabled(False)
+        self.btn_choose_out.setEnabled(False)
+        self.btn_ocr.setEnabled(False)
+        self.btn_xlsx.setEnabled(False)
+        self.btn_main.setEnabled(False)
+        self.btn_watch.setText("Zatrzymaj obserwowanie")
+
+        self._watch_rows = 0
+        self.label.setText(f"Obserwuję folder:\n{self.folder_path}\n\nCzekam na nowe PDF-y...")
+
+        self.watch_thread = QThread()
+        self.watch_worker = WatchWorker(
+            folder_path=self.folder_path,
+            ocr_out=ocr_out,
+            output_dir=self.output_dir,
+            tessdata_dir=self.tessdata_dir,
+            ocr_kwargs=self._ocr_kwargs(),
+        )
+        self.watch_worker.moveToThread(self.watch_thread)
+
+        def on_watch_failed(msg):
+            QMessageBox.critical(self, "Błąd obserwowania folderu", msg)
+            self.watch_thread.quit()
+
+        self.watch_thread.started.connect(self.watch_worker.run)
+        self.watch_worker.batch.connect(self.on_watch_batch, Qt.QueuedConnection)
+        self.watch_worker.finished.connect(self.watch_thread.quit, Qt.QueuedConnection)
+        self.watch_worker.failed.connect(on_watch_failed, Qt.QueuedConnection)
+        self.watch_thread.finished.connect(self.on_watch_thread_finished, Qt.QueuedConnection)
+
+        self.watch_worker.finished.connect(self.watch_worker.deleteLater)
+        self.watch_worker.failed.connect(self.watch_worker.deleteLater)
+        self.watch_thread.finished.connect(self.watch_thread.deleteLater)
+
+        self.watch_thread.start()
+
+    def stop_watch(self):
+        if self.watch_worker is not None:
+            # bieżący PDF dokończy się, reszta partii zostaje w dzienniku OCR
+            self.watch_worker.stop_event.set()
+            self.btn_watch.setEnabled(False)
+            self.btn_watch.setText("Zatrzymywanie...")
+
+    def on_watch_batch(self, info):
+        if info.get("rows") is not None:
+            self._watch_rows = info["rows"]
+        files = info.get("files") or []
+        text = (
+            f"Obserwuję folder:\n{self.folder_path}\n\n"
+            f"Ostatnia partia ({datetime.now().strftime('%H:%M:%S')}): {len(files)} PDF, {info.get('seconds', 0)} s\n"
+            f"Faktur w {info.get('output_file', '')}: {self._watch_rows}"
+        )
+        if info.get("error"):
+            text += f"\n\nBłąd: {info['error']}"
+        self.label.setText(text)
+
+    def on_watch_thread_finished(self):
+        self.watch_thread = None
+        self.watch_worker = None
+
+        self.btn_choose.setEnabled(True)
+        self.btn_choose_out.setEnabled(True)
+        self.btn_ocr.setEnabled(True)
+        self.btn_xlsx.setEnabled(True)
+        self.btn_watch.blockSignals(True)
+        self.btn_watch.setChecked(False)
+        self.btn_watch.blockSignals(False)
+        self.btn_watch.setText("Obserwuj folder (na żywo)")
+        self.update_buttons_state()
+
+    def update_pipeline_progress(self, current, total, filename):
+        self.progress.setRange(0, total)
+        self.progress.setValue(current)
+        self.label.setText(
+            f"OCR + xlsx w toku...\n"
+            f"Zrobione: {current}/{total}\n"
+            f"Plik: {os.path.basename(filename)}"
+        )
 
 
 if __name__ == "__main__":
+    # pula procesów OCR w wersji spakowanej (exe) na Windows
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = FakturyApp()
     window.show()
@@ -0,0 +1,156 @@
+"""
+Benchmark ekstrakcji na syntetycznym korpusie (benchmarks/synthetic_corpus.py):
+- czas każdego ekstraktora osobno i całego łańcucha (na świeżych TextIndex, jak w extract_fields),
+- pełny generate_xlsx dla 1k / 10k / 100k dokumentów: dokumenty/s i szczytowa pamięć (tracemalloc).
+Wynik jako JSON (stdout albo --out), żeby dało się porównywać przebiegi między commitami.
+
+    python benchmarks/bench_extract.py [--sizes 1000,10000,100000] [--workers 1] [--stream] [--out wynik.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_excel as ge  # noqa: E402
+from synthetic_corpus import make_corpus, write_corpus  # noqa: E402
+
+EXTRACTORS = {
+    "detect_currency": ge.detect_currency,
+    "apply_seller_keyword_map": ge.apply_seller_keyword_map,
+    "extract_seller_from_text": ge.extract_seller_from_text,
+    "extract_invoice_date": ge.extract_invoice_date,
+    "extract_brutto": ge.extract_brutto,
+    "detect_vat_rate": ge.detect_vat_rate,
+    "extract_totals_by_context": ge.extract_totals_by_context,
+    "extract_amount_razem": ge.extract_amount_razem,
+    "extract_amount_netto": lambda ix: ge.extract_amount(ix, ge.NET_KEYS),
+    "extract_amount_vat": lambda ix: ge.extract_amount(ix, ge.VAT_KEYS),
+    "extract_relevant_lines": ge.extract_relevant_lines,
+}
+
+
+def bench_extractors(docs: list, repeat: int) -> dict:
+    texts = [text for _, text in docs]
+    results = {}
+
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        [ge.TextIndex(t) for t in texts]
+        best = min(best or float("inf"), time.perf_counter() - t0)
+    results["TextIndex"] = best
+
+    # świeże indeksy przed każdym pomiarem (poza mierzonym czasem): leniwe pola TextIndex
+    # wypełnione przez poprzedni przebieg/ekstraktor zamieniłyby pomiar w trafienia w cache
+    for name, fn in EXTRACTORS.items():
+        best = None
+        for _ in range(repeat):
+            indexes = [ge.TextIndex(t) for t in texts]
+            t0 = time.perf_counter()
+            for ix in indexes:
+                fn(ix)
+            best = min(best or float("inf"), time.perf_counter() - t0)
+        results[name] = best
+
+    # cały łańcuch ekstraktorów na dokument, jak w extract_fields (współdzielony, zimny indeks)
+    best = None
+    for _ in range(repeat):
+        indexes = [ge.TextIndex(t) for t in texts]
+        t0 = time.perf_counter()
+        for ix in indexes:
+            for fn in EXTRACTORS.values():
+                fn(ix)
+        best = min(best or float("inf"), time.perf_counter() - t0)
+    results["all_extractors"] = best
+
+    return {
+        name: {"seconds": round(sec, 4), "us_per_doc": round(sec / len(texts) * 1e6, 2)}
+        for name, sec in results.items()
+    }
+
+
+def _build(root: str, out_dir: str, workers: int, stream: bool) -> dict:
+    # build_xlsx drukuje diagnostykę - na stderr, żeby stdout był czystym JSON-em
+    with contextlib.redirect_stdout(sys.stderr):
+        return ge.build_xlsx(root, out_dir, workers=workers, stream=stream)
+
+
+def bench_generate(size: int, seed: int, workers: int, stream: bool, memory: bool) -> dict:
+    root = tempfile.mkdtemp(prefix=f"bench_extract_{size}_")
+    try:
+        t0 = time.perf_counter()
+        write_corpus(root, size, seed)
+        corpus_s = time.perf_counter() - t0
+
+        out_dir = os.path.join(root, "out")
+        t0 = time.perf_counter()
+        stats = _build(root, out_dir, workers, stream)
+        seconds = time.perf_counter() - t0
+
+        result = {
+            "docs": size,
+            "rows": stats["rows"],
+            "corpus_seconds": round(corpus_s, 3),
+            "seconds": round(seconds, 3),
+            "docs_per_sec": round(size / seconds, 1),
+        }
+
+        if memory:
+            # osobny przebieg - tracemalloc sam w sobie spowalnia; przy workers > 1 mierzy tylko proces główny
+            tracemalloc.start()
+            _build(root, out_dir, workers, stream)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result["peak_mb"] = round(peak / 2**20, 2)
+
+        return result
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ekstraktorów i generate_xlsx na syntetycznym korpusie")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="liczby dokumentów dla pełnego generate_xlsx")
+    parser.add_argument("--extractor-docs", type=int, default=2000, help="dokumenty do pomiaru ekstraktorów (0 = pomiń)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--stream", action="store_true", help="zapis xlsx w trybie strumieniowym")
+    parser.add_argument("--no-memory", action="store_true", help="bez pomiaru pamięci (tracemalloc)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="zapisz JSON do pliku")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "workers": args.workers,
+        "stream": args.stream,
+        "seed": args.seed,
+    }
+
+    if args.extractor_docs:
+        report["extractors"] = bench_extractors(make_corpus(args.extractor_docs, args.seed), args.repeat)
+
+    report["generate_xlsx"] = [
+        bench_generate(int(s), args.seed, args.workers, args.stream, not args.no_memory)
+        for s in args.sizes.split(",") if s.strip()
+    ]
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Mikrobenchmark rejestru wzorców z generate_excel (regexy i listy słów kompilowane raz, przy imporcie)
+vs poprzednie wersje funkcji, które budowały je przy każdym wywołaniu (skopiowane niżej jako legacy_*).
+Dokumenty z benchmarks/synthetic_corpus.py; wyniki obu wersji muszą być identyczne (inaczej kod wyjścia 1).
+
+    python benchmarks/bench_regex.py [--docs 2000] [--repeat 5]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_excel as ge  # noqa: E402
+from generate_excel import as_text_index, fix_ocr_separators, parse_amount  # noqa: E402
+from synthetic_corpus import make_corpus  # noqa: E402
+
+# daty spoza korpusu: złe dni/miesiące, mieszane separatory, śmieci po dacie
+EDGE_DATES = [
+    "", "   ", "41.01.2026", "31.02.2024", "29.02.2024", "29.02.2023", "2024-13-01", "2024-02-30",
+    "12.03-2024", "12/03.2024", "12-03/2024", " 2024-05-06 ", "2024-05-06T10:00", "06.05.2024 r.",
+    "6.5.2024", "2024/05/06", "20240506", "abc", "12-03-2024", "12/03/2024",
+]
+
+
+# ===================== POPRZEDNIE WERSJE (wzorce budowane przy każdym wywołaniu) =====================
+
+def legacy_normalize_date(date_str: str) -> str:
+    if not date_str:
+        return ""
+
+    s = date_str.strip()
+
+    # yyyy-mm-dd
+    m = re.match(r"(\d{4})-(\d{2})-(\d{2})", s)
+    if m:
+        yyyy, mm, dd = m.groups()
+        try:
+            datetime(int(yyyy), int(mm), int(dd))
+            return f"{dd}.{mm}.{yyyy}"
+        except ValueError:
+            return ""
+
+    # dd.mm.yyyy
+    m = re.match(r"(\d{2})\.(\d{2})\.(\d{4})", s)
+    if m:
+        dd, mm, yyyy = m.groups()
+        try:
+            datetime(int(yyyy), int(mm), int(dd))
+            return f"{dd}.{mm}.{yyyy}"
+        except ValueError:
+            return ""
+
+    # dd/mm/yyyy
+    m = re.match(r"(\d{2})/(\d{2})/(\d{4})", s)
+    if m:
+        dd, mm, yyyy = m.groups()
+        try:
+            datetime(int(yyyy), int(mm), int(dd))
+            return f"{dd}.{mm}.{yyyy}"
+        except ValueError:
+            return ""
+
+    # dd-mm-yyyy
+    m = re.match(r"(\d{2})-(\d{2})-(\d{4})", s)
+    if m:
+        dd, mm, yyyy = m.groups()
+        try:
+            datetime(int(yyyy), int(mm), int(dd))
+            return f"{dd}.{mm}.{yyyy}"
+        except ValueError:
+            return ""
+
+    return ""
+
+
+def legacy_detect_currency(text: str) -> str:
+    if not text:
+        return ""
+
+    t = as_text_index(text).upper
+
+    patterns = [
+        ("PLN", r"\bPLN\b|\bZŁ\b|\bZL\b"),
+        ("EUR", r"\bEUR\b|€"),
+        ("CZK", r"\bCZK\b|\bKČ\b"),
+        ("SEK", r"\bSEK\b"),
+        ("HUF", r"\bHUF\b|\bFT\b"),
+        ("LEI", r"\bLEI\b|\bRON\b"),
+        ("NOK", r"\bNOK\b"),
+    ]
+
+    for code, pat in patterns:
+        if re.search(pat, t):
+            return code
+
+    return ""
+
+
+def legacy_extract_totals_by_context(text: str):
+    ctx = [
+        "razem", "total", "suma", "sumy",
+        "brutto", "netto", "vat", "mwst", "tax",
+        "do zapłaty", "amount due", "wartość dokumentu", "wartosc dokumentu"
+    ]
+
+    ix = as_text_index(text)
+    best = None
+
+    for i, low in enumerate(ix.lower_lines):
+        score = sum(1 for k in ctx if k in low)
+        if score == 0:
+            continue
+
+        nums = ix.line_amounts_fixed(i)
+        if len(nums) < 2:
+            continue
+
+        values = ix.line_values_fixed(i)
+        if len(values) < 2:
+            continue
+
+        if len(values) >= 3:
+            netto, vat, brutto = values[0], values[1], values[2]
+        else:
+            netto, brutto = values[0], values[1]
+            vat = round(brutto - netto, 2)
+
+        if brutto != "" and netto != "":
+            vat_from_diff = round(brutto - netto, 2)
+            if vat == "" or abs(vat_from_diff - float(vat)) > 0.50:
+                vat = vat_from_diff
+
+        cand = (score, netto, vat, brutto)
+        if best is None or cand[0] > best[0]:
+            best = cand
+
+    if best:
+        _, netto, vat, brutto = best
+        return netto, vat, brutto
+
+    return "", "", ""
+
+
+def legacy_extract_seller_from_text(text):
+    ix = as_text_index(text)
+    lines = ix.stripped_lines
+
+    seller_headers = ["sprzedawca", "seller", "lieferant"]
+    buyer_headers = ["nabywca", "kupujący", "kupujacy", "buyer", "odbiorca", "recipient", "customer"]
+
+    banned_contains = [
+        "x-trade transport",
+        "x trade transport",
+        "x-trade",
+        "transport",
+    ]
+
+    banned_exact = {
+        "sprzedawca", "seller", "lieferant",
+        "nabywca", "kupujący", "kupujacy", "buyer", "ODPOWIEDZIALNOŚCIĄ",
+        "ODPOWIEDZIALNOSCIA",
+    }
+
+    def is_good_company_line(s: str) -> bool:
+        low = s.lower()
+        if low in banned_exact:
+            return False
+        if any(h in low for h in buyer_headers):
+            return False
+        if any(b in low for b in banned_contains):
+            return False
+        if len(s) < 4:
+            return False
+        if all(ch.isdigit() or ch in ".,-/" for ch in s):
+            return False
+        if "nip" in low or "vat" in low or "regon" in low:
+            return False
+        return True
+
+    for i, low in enumerate(ix.stripped_lower_lines):
+        if any(h in low for h in seller_headers):
+            for j in range(i + 1, min(i + 7, len(lines))):
+                cand = lines[j]
+                if is_good_company_line(cand):
+                    return cand.upper()
+            break
+
+    for cand in lines[:20]:
+        if is_good_company_line(cand) and len(cand) > 8 and not any(c.isdigit() for c in cand):
+            return cand.upper()
+
+    return ""
+
+
+def legacy_extract_amount_razem(text: str):
+    razem_re = re.compile(r"\brazem\b", re.IGNORECASE)
+    num_re = re.compile(r"\d{1,3}(?:[ .]\d{3})*[.,-]\d{2}")
+
+    ix = as_text_index(text)
+    for line, low in zip(ix.lines, ix.lower_lines):
+        if "razem" not in low or not razem_re.search(line):
+            continue
+
+        parts = razem_re.split(line, maxsplit=1)
+        tail = parts[1] if len(parts) > 1 else line
+        tail = fix_ocr_separators(tail)
+
+        nums = num_re.findall(tail)
+        if len(nums) >= 2:
+            netto = parse_amount(fix_ocr_separators(nums[0]))
+            vat = parse_amount(fix_ocr_separators(nums[1]))
+            return netto, vat
+
+    return "", ""
+
+
+# (nazwa, poprzednia wersja, obecna wersja, wejście: "doc" = TextIndex dokumentu, "date" = napis daty)
+CASES = [
+    ("normalize_date", legacy_normalize_date, ge.normalize_date, "date"),
+    ("detect_currency", legacy_detect_currency, ge.detect_currency, "doc"),
+    ("extract_totals_by_context", legacy_extract_totals_by_context, ge.extract_totals_by_context, "doc"),
+    ("extract_seller_from_text", legacy_extract_seller_from_text, ge.extract_seller_from_text, "doc"),
+    ("extract_amount_razem", legacy_extract_amount_razem, ge.extract_amount_razem, "doc"),
+]
+
+
+def bench(fn, inputs: list, repeat: int):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = [fn(x) for x in inputs]
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rejestr wzorców generate_excel vs wzorce budowane per wywołanie")
+    ap.add_argument("--docs", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    texts = [text for _, text in make_corpus(args.docs, args.seed)]
+    # indeksy liczone raz (jak w extract_fields) - leniwe pola wypełnia rozgrzewka poniżej
+    indexes = [ge.TextIndex(t) for t in texts]
+    dates = [ix.line_date(i) for ix in indexes for i in range(len(ix.lines))]
+    dates = [d for d in dates if d] + EDGE_DATES
+    inputs = {"doc": indexes, "date": dates}
+    for _, legacy, _, kind in CASES:
+        for x in inputs[kind]:
+            legacy(x)
+
+    results = []
+    total_legacy = total_now = 0.0
+    for name, legacy, now, kind in CASES:
+        old_s, old_out = bench(legacy, inputs[kind], args.repeat)
+        new_s, new_out = bench(now, inputs[kind], args.repeat)
+        if kind == "doc":
+            total_legacy += old_s
+            total_now += new_s
+        results.append({
+            "function": name,
+            "calls": len(inputs[kind]),
+            "legacy_us_per_call": round(old_s / len(inputs[kind]) * 1e6, 3),
+            "registry_us_per_call": round(new_s / len(inputs[kind]) * 1e6, 3),
+            "speedup": round(old_s / new_s, 2) if new_s else None,
+            "identical": old_out == new_out,
+        })
+
+    # wszystkie ekstraktory dokumentu razem; normalize_date osobno (wołane raz na plik, na wyciągniętej dacie)
+    results.append({
+        "function": "per_document (detect_currency + totals + seller + razem)",
+        "calls": len(indexes),
+        "legacy_us_per_call": round(total_legacy / len(indexes) * 1e6, 3),
+        "registry_us_per_call": round(total_now / len(indexes) * 1e6, 3),
+        "speedup": round(total_legacy / total_now, 2) if total_now else None,
+        "identical": all(r["identical"] for r in results),
+    })
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    if not all(r["identical"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark dopasowania sprzedawcy: liniowy `kw in t` po keywordach z seller_rules.json vs KeywordMatcher
+(wymuszony regex oraz tryb automatyczny).
+Mapa sztucznie powiększana do tysięcy wpisów; wyniki obu metod muszą być identyczne.
+
+    python benchmarks/bench_seller_map.py [--docs 200] [--sizes 35,150,500,1000,5000]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_excel import get_seller_rules  # noqa: E402
+from seller_rules import KeywordMatcher  # noqa: E402
+
+WORDS = [
+    "FAKTURA", "VAT", "SPRZEDAWCA", "NABYWCA", "NIP", "RAZEM", "DO ZAPŁATY", "NETTO", "BRUTTO",
+    "USŁUGA", "TRANSPORT", "CZĘŚCI", "ZAMIENNE", "OPONY", "ODBIÓR", "TERMIN", "PRZELEW", "SP. Z O.O.",
+]
+
+
+def linear_match(mapping: dict, text: str) -> str:
+    for kw, seller in mapping.items():
+        if kw in text:
+            return seller
+    return ""
+
+
+def grow_map(size: int, rnd: random.Random) -> dict:
+    """Prawdziwa mapa + losowi dostawcy dopisani NA KOŃCU (priorytet istniejących wpisów bez zmian)."""
+    mapping = dict(get_seller_rules().keyword_map)
+    letters = "ABCDEFGHIJKLMNOPRSTUWZŁŚŻ"
+    while len(mapping) < size:
+        name = "".join(rnd.choice(letters) for _ in range(rnd.randint(5, 12)))
+        kw = name + " " + rnd.choice(["TRANS", "SERWIS", "AUTO", "SP. Z O.O.", "S.C.", "PHU"])
+        mapping.setdefault(kw, kw)
+    return mapping
+
+
+def make_docs(mapping: dict, count: int, rnd: random.Random) -> list:
+    keywords = list(mapping.keys())
+    docs = []
+    for i in range(count):
+        body = [" ".join(rnd.choice(WORDS) for _ in range(8)) for _ in range(40)]
+        if i % 4:  # 3/4 dokumentów zawiera jakiś keyword, reszta - brak dopasowania
+            body.insert(rnd.randrange(len(body)), rnd.choice(keywords))
+        docs.append("\n".join(body))
+    return docs
+
+
+def bench(fn, docs, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = [fn(d) for d in docs]
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark dopasowania sprzedawcy po keywordach")
+    ap.add_argument("--docs", type=int, default=200)
+    ap.add_argument("--sizes", default="35,150,500,1000,5000")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rnd = random.Random(args.seed)
+    results = []
+    for size in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        mapping = grow_map(size, rnd)
+        docs = make_docs(mapping, args.docs, rnd)
+
+        t0 = time.perf_counter()
+        regex_matcher = KeywordMatcher(mapping, linear_max=0)
+        compile_s = time.perf_counter() - t0
+        matcher = KeywordMatcher(mapping)
+
+        lin_s, lin_out = bench(lambda d: linear_match(mapping, d), docs, args.repeat)
+        re_s, re_out = bench(regex_matcher.match, docs, args.repeat)
+        km_s, km_out = bench(matcher.match, docs, args.repeat)
+
+        results.append({
+            "keywords": len(mapping),
+            "docs": len(docs),
+            "linear_ms_per_doc": round(lin_s * 1000 / len(docs), 4),
+            "regex_ms_per_doc": round(re_s * 1000 / len(docs), 4),
+            "matcher_ms_per_doc": round(km_s * 1000 / len(docs), 4),
+            "matcher_mode": "linear" if matcher.linear else "regex",
+            "regex_compile_s": round(compile_s, 4),
+            "identical": lin_out == re_out == km_out,
+        })
+
+    print(json.dumps(results, indent=2))
+    if not all(r["identical"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Syntetyczny korpus tekstów "po OCR" do benchmarków generate_excel:
+PL / DE / EN / CZ / RO, różne waluty, keywordy sprzedawców z seller_rules.json,
+błędy OCR separatorów (118-11, 1 234—56) poprawiane przez fix_ocr_separators,
+nazwy plików NRFAKTURY_REJESTRACJA.txt, także pod reguły numerów faktur (Poczta, WROV, MARTEX).
+"""
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_excel import get_seller_rules  # noqa: E402
+
+OTHER_SELLERS = [
+    "TRANS-POL SP. Z O.O.", "AUTO SERWIS NOWAK", "Firma Handlowa KOWALSKI", "SPEDITION MÜLLER GMBH",
+    "EUROPARTS LTD", "DOPRAVA NOVÁK S.R.O.", "TRANSCOM SRL", "PHU MAREK ZIELIŃSKI",
+]
+ITEMS = ["Usługa transportowa", "Opona 315/70 R22.5", "Filtr oleju", "Naprawa hamulców", "Paliwo ON",
+         "Myjnia", "Ubezpieczenie OC", "Przegląd techniczny", "Klocki hamulcowe", "Parking"]
+BUYER = ["Nabywca:", "X-TRADE TRANSPORT SP. Z O.O.", "ul. Przemysłowa 12", "97-500 Radomsko", "NIP 772-000-00-00"]
+
+
+def _money(value: float, rnd: random.Random, ocr_errors: float) -> str:
+    whole, cents = f"{value:.2f}".split(".")
+    if len(whole) > 3 and rnd.random() < 0.5:
+        whole = f"{int(whole):,}".replace(",", rnd.choice([" ", "."]))
+    sep = "," if rnd.random() > 0.3 else "."
+    if rnd.random() < ocr_errors:
+        sep = rnd.choice(["-", "–", "—"])  # błąd OCR separatora dziesiętnego
+    return f"{whole}{sep}{cents}"
+
+
+def _date(rnd: random.Random, style: str) -> str:
+    y, m, d = rnd.choice([2023, 2024, 2025]), rnd.randint(1, 12), rnd.randint(1, 28)
+    if style == "iso":
+        return f"{y}-{m:02d}-{d:02d}"
+    return f"{d:02d}{rnd.choice('.-/')}{m:02d}{rnd.choice('.-/')}{y}" if style == "mixed" else f"{d:02d}.{m:02d}.{y}"
+
+
+def _invoice_name(i: int, rnd: random.Random) -> str:
+    kind = rnd.random()
+    if kind < 0.04:
+        return f"(00){rnd.randint(0, 10**10):010d}"
+    if kind < 0.08:
+        return f"F{rnd.randint(0, 99999):05d}G{rnd.randint(0, 10**12):012d}P"
+    if kind < 0.10:
+        return f"WROV{rnd.randint(0, 9999999):07d}"
+    if kind < 0.14:
+        return f"A1-FV-{rnd.choice([2023, 2024])}-{i % 100000:05d}"
+    return f"FV-{i}-{rnd.choice(['2023', '2024', '2025'])}"
+
+
+def make_text(rnd: random.Random, keywords: list, ocr_errors: float = 0.15) -> str:
+    lang = rnd.choices(["pl", "de", "en", "cz", "ro"], weights=[60, 15, 12, 8, 5])[0]
+    net = round(rnd.uniform(10, 60000), 2)
+    rate = {"pl": rnd.choice([0.23, 0.23, 0.08]), "de": 0.19, "en": 0.2, "cz": 0.21, "ro": 0.19}[lang]
+    vat = round(net * rate, 2)
+    gross = round(net + vat, 2)
+    pct = int(round(rate * 100))
+    m = lambda v: _money(v, rnd, ocr_errors)  # noqa: E731
+
+    seller = rnd.choice(keywords) if rnd.random() < 0.6 else rnd.choice(OTHER_SELLERS)
+    item = rnd.choice(ITEMS)
+    noise = " ".join(rnd.choice(["|", "_", ".", "~", "Il", "0O"]) for _ in range(rnd.randint(1, 4)))
+
+    if lang == "pl":
+        currency = rnd.choice(["PLN", "PLN", "zł", "EUR"])
+        lines = [
+            f"FAKTURA VAT nr {rnd.randint(1, 999)}/{rnd.randint(1, 12)}/2024",
+            f"Data wystawienia: {_date(rnd, rnd.choice(['iso', 'dmy']))}",
+            f"Data sprzedaży: {_date(rnd, 'dmy')}",
+            "Sprzedawca:", seller, "ul. Długa 5, 00-001 Warszawa", f"NIP {rnd.randint(100, 999)}-{rnd.randint(100, 999)}-00-00",
+            *BUYER,
+            "Lp Nazwa Ilość Cena netto Wartość netto Stawka Kwota VAT Wartość brutto",
+            f"1 {item} 1 szt {m(net)} {m(net)} {pct}% {m(vat)} {m(gross)}",
+            rnd.choice([f"Razem: {m(net)} {m(vat)} {m(gross)}", f"RAZEM {m(net)} {pct}% {m(vat)} {m(gross)}",
+                        f"Wartość netto {m(net)}", ""]),
+            f"Do zapłaty: {m(gross)} {currency}",
+            f"Słownie: {rnd.randint(1, 99)} tysięcy złotych",
+        ]
+    elif lang == "de":
+        currency = "EUR"
+        lines = [
+            f"RECHNUNG Nr. {rnd.randint(10000, 99999)}", f"Rechnungsdatum {_date(rnd, 'dmy')}",
+            "Lieferant", seller, "Hauptstraße 1, 10115 Berlin", *BUYER[1:2],
+            f"{item} 1 {m(net)}", f"Netto {m(net)} EUR", f"MwSt {pct}% {m(vat)}", f"Gesamt {m(gross)} {currency}",
+        ]
+    elif lang == "en":
+        currency = rnd.choice(["EUR", "€", "SEK", "NOK", "HUF"])
+        lines = [
+            "INVOICE", f"Invoice date: {_date(rnd, 'iso')}", "Seller:", seller, *BUYER[1:2],
+            f"{item} {m(net)}", f"Subtotal {m(net)}", f"VAT {pct}% {m(vat)}", f"Total {m(gross)} {currency}",
+        ]
+    elif lang == "cz":
+        currency = rnd.choice(["CZK", "Kč"])
+        lines = [
+            "FAKTURA - DAŇOVÝ DOKLAD", f"Datum vystavení {_date(rnd, 'mixed')}", "Dodavatel:", seller,
+            f"{item} {m(net)}", f"Základ {m(net)}", f"DPH {pct}% {m(vat)}", f"Celkem k úhradě {m(gross)} {currency}",
+        ]
+    else:
+        currency = rnd.choice(["LEI", "RON"])
+        lines = [
+            "FACTURA FISCALA", f"Data: {_date(rnd, 'mixed')}", "Furnizor:", seller,
+            f"{item} {m(net)}", f"Total fara TVA {m(net)}", f"TVA {pct}% {m(vat)}", f"Total {m(gross)} {currency}",
+        ]
+
+    lines.insert(rnd.randrange(len(lines)), noise)  # śmieci OCR w losowym miejscu
+    return "\n".join(lines)
+
+
+def make_corpus(n: int, seed: int = 0):
+    """Lista (nazwa_pliku, tekst) - deterministyczna dla danego seeda."""
+    rnd = random.Random(seed)
+    keywords = list(get_seller_rules().keyword_map)
+    docs = []
+    for i in range(n):
+        plate = f"{rnd.choice(['WPI', 'EL', 'ERA', 'WX', 'SK'])}{rnd.randint(10000, 99999)}"
+        docs.append((f"{_invoice_name(i, rnd)}_{plate}.txt", make_text(rnd, keywords)))
+    return docs
+
+
+def write_corpus(root: str, n: int, seed: int = 0) -> str:
+    """Zapisuje korpus jako root/scans/ocr_txt/*.txt (układ oczekiwany przez generate_xlsx)."""
+    ocr_txt_dir = os.path.join(root, "scans", "ocr_txt")
+    os.makedirs(ocr_txt_dir, exist_ok=True)
+    for filename, text in make_corpus(n, seed):
+        with open(os.path.join(ocr_txt_dir, filename), "w", encoding="utf-8") as f:
+            f.write(text)
+    return root
@@ -1,56 +1,114 @@
 import os
+import time
 import pandas as pd
 from datetime import datetime
 import re
 import json
-#from openai import OpenAI
+import sqlite3
+from collections import deque
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook
+
+from ai_fallback import AIFallback
+from seller_rules import SellerRulesStore
+from row_manifest import RowManifest, default_manifest_path
+from invoice_store import InvoiceStore, default_store_path
+from profiling import NULL_PROFILER, Profiler
 
 USE_AI = False  # <- jednym ruchem możesz wyłączyć AI
+AI_CONCURRENCY = 4   # ile zapytań AI naraz
+AI_BATCH_SIZE = 32   # ile faktur zbieramy przed wysłaniem paczki zapytań
+_ai_fallback = None
+
+# podbić przy zmianie logiki ekstraktorów -> tryb przyrostowy przeliczy wszystkie pliki
+EXTRACTOR_VERSION = 1
 
 # ===================== KONFIGURACJA =====================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# kolejność kolumn w wynikowym xlsx
+XLSX_COLUMNS = [
+    "Nr faktury",
+    "Data wystawienia",
+    "Sprzedawca",
+    "Netto",
+    "VAT",
+    "Waluta",
+    "Brutto",
+    "Nr rejestracyjny",
+]
+
 NET_KEYS = ["net", "netto", "subtotal", "základ", "base"]
 VAT_KEYS = ["vat", "mwst", "tax", "moms", "dph", "áfa"]
 
-# ===================== REGUŁY SPRZEDAWCÓW (KEYWORD -> SELLER) =====================
-SELLER_KEYWORD_MAP = {
-    "ŁOSOŚ": "LETLIV FABIAN ŁOSOŚ",
-    "SCANIA POLSKA": "SCANIA POLSKA",
-    "RONAL": "RONAL",
-    "INTER CARS": "INTER CARS",
-    "PACCAR FINANCIAL": "PACCAR FINANCIAL",
-    "KRISCAR KRZYSZTOF BALIŃSKI": "KRISCAR KRZYSZTOF BALIŃSKI",
-    "OPOLTRANS": "OPOLTRANS",
-    "MEGATECHNIK": "MEGATECHNIK",
-    "HT TRUCKS": "HT TRUCKS & PARTS",
-    "TORUS": "TORUS S.C.",
-    "KON-TIR": "KON-TIR S.C.",
-    "KRZYSZTOF PIOTROWICZ": "K.P. AUTO PORT",
-    "KAMIL MARKIEWICZ": "WULKANIZACJA KAMIL MARKIEWICZ",
-    "SCANIA FINANCE": "SCANIA FINANCE",
-    "ROBERT KOPECKI": "ROBERT KOPECKI",
-    "KOMPANN": "KOMPANN SP. Z O.O.",
-    "ERGO HESTIA": "ERGO HESTIA",
-    "HEPI FUTURE": "HEPI FUTURE",
-    "ANWIM": "ANWIM",
-    "KARTONY24": "KARTONY24",
-    "KRZYSZTOF RASZKA": "CIESZYŃSKI AUTO SERWIS PHU GRAND",
-    "V.P. RENT": "V.P. RENT HUNGARY",
-    "POCZTA": "POCZTA POLSKA",
-    "PORT RADOMSKO": "PORT RADOMSKO",
-    "MARTEX": "MARTEX",
-    "OLX": "OLX",
-    "ROBERT WIŚNIEWSKI": "AUTO MECHANIKA ROBERT WIŚNIEWSKI",
-    "GIZ-TRANS": "GIZ-TRANS ROBERT GIZA",
-    "CENTRO-GUM": "CENTRO-GUM",
-    "AUTO PORT": "K. P. AUTO PORT",
-    "JADWIGA JÓŹWA": "JADWIGA JÓŹWA",
-    "PHU DAN": "PHU DAN JERZY DANKO",
-    "JERZY DANKO": "PHU DAN JERZY DANKO",
-    "WARTA": "WARTA",
-    "INTERTRANS": "INTERTRANS PKS",
+# ===================== WZORCE I SŁOWA KLUCZOWE (kompilowane raz, przy imporcie) =====================
+
+OCR_SEPARATOR_RE = re.compile(r"(?<=\d)[\-–—](?=\d{2}\b)")
+DECIMAL_RE = re.compile(r"\d+\.\d+")
+MONEY_RE = re.compile(r"\d+[.,]\d{2}")
+
+# normalize_date: yyyy-mm-dd albo dd.mm.yyyy / dd/mm/yyyy / dd-mm-yyyy (ten sam separator dwa razy)
+NORMALIZE_DATE_RE = re.compile(
+    r"(?P<iso_y>\d{4})-(?P<iso_m>\d{2})-(?P<iso_d>\d{2})"
+    r"|(?P<d>\d{2})(?P<sep>[./-])(?P<m>\d{2})(?P=sep)(?P<y>\d{4})"
+)
+
+# detect_currency: token (tekst wielkimi literami) -> waluta; kolejność walut = priorytet
+# (PLN wygrywa z EUR, gdy w tekście są obie)
+CURRENCY_TOKENS = {
+    "PLN": "PLN", "ZŁ": "PLN", "ZL": "PLN",
+    "EUR": "EUR", "€": "EUR",
+    "CZK": "CZK", "KČ": "CZK",
+    "SEK": "SEK",
+    "HUF": "HUF", "FT": "HUF",
+    "LEI": "LEI", "RON": "LEI",  # rumuńska waluta, u Ciebie ma być LEI
+    "NOK": "NOK",
 }
+CURRENCY_PRIORITY = {code: i for i, code in enumerate(dict.fromkeys(CURRENCY_TOKENS.values()))}
+# lookahead z pierwszymi literami tokenów: silnik pomija resztę pozycji bez sprawdzania każdej alternatywy
+CURRENCY_RE = re.compile(r"(?=[PZECKSHFLRN€])(?:\b(?:PLN|ZŁ|ZL|EUR|CZK|KČ|SEK|HUF|FT|LEI|RON|NOK)\b|€)")
+
+# extract_totals_by_context: im więcej słów w linii, tym pewniejsza linia sum
+TOTALS_CONTEXT_KEYS = (
+    "razem", "total", "suma", "sumy",
+    "brutto", "netto", "vat", "mwst", "tax",
+    "do zapłaty", "amount due", "wartość dokumentu", "wartosc dokumentu",
+)
+
+RAZEM_RE = re.compile(r"\brazem\b", re.IGNORECASE)
+RATE_RE = re.compile(r"\d{1,2}\s*%")  # MARTEX: linia ze stawką VAT
+DASH_DATE_RE = re.compile(r"\d{2}-\d{2}-\d{4}")
+POCZTA_DATE_RE = re.compile(r"Data wystawienia:\s*(\d{4}-\d{2}-\d{2})")
+
+AI_TOTAL_KEYS = ("razem", "total", "suma", "vat", "netto", "mwst", "tax")
+
+# extract_seller_from_text
+SELLER_HEADERS = ("sprzedawca", "seller", "lieferant")
+BUYER_HEADERS = ("nabywca", "kupujący", "kupujacy", "buyer", "odbiorca", "recipient", "customer")
+# rzeczy, które często pojawiają się w pobliżu i psują wybór
+SELLER_BANNED_CONTAINS = (
+    "x-trade transport",  # <- to chciałaś ignorować
+    "x trade transport",
+    "x-trade",
+    "transport",
+)
+# linie, które są "śmieciem" zamiast nazwy firmy
+SELLER_BANNED_EXACT = frozenset({
+    "sprzedawca", "seller", "lieferant",
+    "nabywca", "kupujący", "kupujacy", "buyer", "ODPOWIEDZIALNOŚCIĄ",
+    "ODPOWIEDZIALNOSCIA",
+})
+
+# ===================== REGUŁY SPRZEDAWCÓW (plik seller_rules.json) =====================
+# keyword -> sprzedawca, regex numeru faktury, strategia daty/kwot; przeładowywane po zmianie pliku
+SELLER_RULES_PATH = os.path.join(BASE_DIR, "seller_rules.json")
+SELLER_RULES = SellerRulesStore(SELLER_RULES_PATH)
+
+
+def get_seller_rules():
+    return SELLER_RULES.get()
+
 
 def apply_seller_keyword_map(text: str) -> str:
     """
@@ -59,11 +117,8 @@ def apply_seller_keyword_map(text: str) -> str:
     """
     if not text:
         return ""
-    t = text.upper()
-    for kw, seller in SELLER_KEYWORD_MAP.items():
-        if kw in t:
-            return seller  # już jest uppercase
-    return ""
+    rule = get_seller_rules().match_text(as_text_index(text).upper)
+    return rule.name if rule is not None else ""
 
 
 # ===================== FUNKCJE =====================
@@ -77,7 +132,7 @@ def fix_ocr_separators(s: str) -> str:
     if not s:
         return s
     s = s.strip()
-    s = re.sub(r"(?<=\d)[\-–—](?=\d{2}\b)", ".", s)
+    s = OCR_SEPARATOR_RE.sub(".", s)
     return s
 
 
@@ -116,6 +171,131 @@ def parse_amount(s: str):
 
 
 
+# ===================== INDEKS TEKSTU (jedno przejście) =====================
+
+# kwoty: [.,] jako separator dziesiętny (extract_amount, MARTEX)
+AMOUNT_RE = re.compile(r"\d{1,3}(?:[ .]\d{3})*[.,]\d{2}")
+# kwoty z tolerancją OCR: dopuszczamy też "-" jako separator dziesiętny
+AMOUNT_DASH_RE = re.compile(r"\d{1,3}(?:[ .]\d{3})*[.,-]\d{2}")
+ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+DMY_DATE_RE = re.compile(r"\d{2}[./-]\d{2}[./-]\d{4}")
+PERCENT_RE = re.compile(r"(?<!\d)(\d{1,2})\s*%")
+
+
+class TextIndex:
+    """
+    Tekst OCR pocięty raz na linie (+ wersje lower/upper) z leniwie wyszukanymi
+    tokenami kwot, dat i procentów (per linia albo dla całego tekstu).
+    Ekstraktory przyjmują str albo TextIndex - generate_xlsx buduje indeks raz na plik,
+    zamiast kilkunastu splitlines()/lower()/findall po całym tekście.
+    """
+
+    __slots__ = (
+        "text", "lines", "lower_lines",
+        "_upper", "_lower", "_stripped", "_stripped_lower",
+        "_amount_tokens", "_amount_values", "_percent_tokens",
+        "_line_amounts", "_line_amounts_fixed", "_line_values_fixed", "_line_dates",
+    )
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        self.lines = self.text.splitlines()
+        self.lower_lines = [line.lower() for line in self.lines]
+
+        self._upper = self._lower = None
+        self._stripped = self._stripped_lower = None
+        self._amount_tokens = self._amount_values = self._percent_tokens = None
+
+        # per linia: None = jeszcze nie liczone
+        n = len(self.lines)
+        self._line_amounts = [None] * n
+        self._line_amounts_fixed = [None] * n
+        self._line_values_fixed = [None] * n
+        self._line_dates = [None] * n
+
+    @property
+    def upper(self) -> str:
+        if self._upper is None:
+            self._upper = self.text.upper()
+        return self._upper
+
+    @property
+    def lower(self) -> str:
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    @property
+    def stripped_lines(self) -> list:
+        # niepuste linie bez białych znaków na brzegach
+        if self._stripped is None:
+            self._stripped = [l.strip() for l in self.lines if l.strip()]
+        return self._stripped
+
+    @property
+    def stripped_lower_lines(self) -> list:
+        if self._stripped_lower is None:
+            self._stripped_lower = [l.lower() for l in self.stripped_lines]
+        return self._stripped_lower
+
+    @property
+    def amount_tokens(self) -> list:
+        """Kwoty z "-" jako możliwym separatorem, z całego tekstu (w kolejności wystąpienia)."""
+        if self._amount_tokens is None:
+            self._amount_tokens = AMOUNT_DASH_RE.findall(self.text)
+        return self._amount_tokens
+
+    @property
+    def amount_values(self) -> list:
+        """amount_tokens sparsowane przez parse_amount (bez nieparsowalnych)."""
+        if self._amount_values is None:
+            values = [parse_amount(n) for n in self.amount_tokens]
+            self._amount_values = [v for v in values if v != ""]
+        return self._amount_values
+
+    @property
+    def percent_tokens(self) -> list:
+        """Liczby przed % (23%, 8 %) z całego tekstu."""
+        if self._percent_tokens is None:
+            self._percent_tokens = [int(r) for r in PERCENT_RE.findall(self.text)]
+        return self._percent_tokens
+
+    def line_amounts(self, i: int) -> list:
+        """Kwoty z linii i (separator dziesiętny . albo ,)."""
+        v = self._line_amounts[i]
+        if v is None:
+            v = self._line_amounts[i] = AMOUNT_RE.findall(self.lines[i])
+        return v
+
+    def line_amounts_fixed(self, i: int) -> list:
+        """Kwoty z linii i po fix_ocr_separators (separator . , albo -)."""
+        v = self._line_amounts_fixed[i]
+        if v is None:
+            v = self._line_amounts_fixed[i] = AMOUNT_DASH_RE.findall(fix_ocr_separators(self.lines[i]))
+        return v
+
+    def line_values_fixed(self, i: int) -> list:
+        """line_amounts_fixed(i) sparsowane przez parse_amount (bez nieparsowalnych)."""
+        v = self._line_values_fixed[i]
+        if v is None:
+            values = [parse_amount(n) for n in self.line_amounts_fixed(i)]
+            v = self._line_values_fixed[i] = [x for x in values if x != ""]
+        return v
+
+    def line_date(self, i: int) -> str:
+        """Pierwsza data z linii i: najpierw yyyy-mm-dd, potem dd.mm.yyyy / dd/mm/yyyy / dd-mm-yyyy."""
+        v = self._line_dates[i]
+        if v is None:
+            line = self.lines[i]
+            m = ISO_DATE_RE.search(line) or DMY_DATE_RE.search(line)
+            v = self._line_dates[i] = m.group() if m else ""
+        return v
+
+
+def as_text_index(text) -> TextIndex:
+    return text if isinstance(text, TextIndex) else TextIndex(text)
+
+
 def load_ocr_texts(ocr_txt_dir):
     texts = {}
     for file in os.listdir(ocr_txt_dir):
@@ -127,7 +307,7 @@ def load_ocr_texts(ocr_txt_dir):
 
 def normalize_number(text):
     text = text.replace(" ", "").replace(",", ".")
-    nums = re.findall(r"\d+\.\d+", text)
+    nums = DECIMAL_RE.findall(text)
     if nums:
         return float(nums[0])
     return ""
@@ -145,56 +325,27 @@ def normalize_date(date_str: str) -> str:
     if not date_str:
         return ""
 
-    s = date_str.strip()
-
-    # yyyy-mm-dd
-    m = re.match(r"(\d{4})-(\d{2})-(\d{2})", s)
-    if m:
-        yyyy, mm, dd = m.groups()
-        try:
-            datetime(int(yyyy), int(mm), int(dd))
-            return f"{dd}.{mm}.{yyyy}"
-        except ValueError:
-            return ""
-
-    # dd.mm.yyyy
-    m = re.match(r"(\d{2})\.(\d{2})\.(\d{4})", s)
-    if m:
-        dd, mm, yyyy = m.groups()
-        try:
-            datetime(int(yyyy), int(mm), int(dd))
-            return f"{dd}.{mm}.{yyyy}"
-        except ValueError:
-            return ""
-
-    # dd/mm/yyyy
-    m = re.match(r"(\d{2})/(\d{2})/(\d{4})", s)
-    if m:
-        dd, mm, yyyy = m.groups()
-        try:
-            datetime(int(yyyy), int(mm), int(dd))
-            return f"{dd}.{mm}.{yyyy}"
-        except ValueError:
-            return ""
-
-    # dd-mm-yyyy
-    m = re.match(r"(\d{2})-(\d{2})-(\d{4})", s)
-    if m:
-        dd, mm, yyyy = m.groups()
-        try:
-            datetime(int(yyyy), int(mm), int(dd))
-            return f"{dd}.{mm}.{yyyy}"
-        except ValueError:
-            return ""
+    # jeden regex zamiast czterech re.match po kolei
+    m = NORMALIZE_DATE_RE.match(date_str.strip())
+    if not m:
+        return ""
 
-    return ""
+    if m.group("iso_y"):
+        yyyy, mm, dd = m.group("iso_y", "iso_m", "iso_d")
+    else:
+        yyyy, mm, dd = m.group("y", "m", "d")
+    try:
+        datetime(int(yyyy), int(mm), int(dd))
+        return f"{dd}.{mm}.{yyyy}"
+    except ValueError:
+        return ""
 
 
 def extract_amount(text, keywords):
-    for line in text.splitlines():
-        low = line.lower()
+    ix = as_text_index(text)
+    for i, low in enumerate(ix.lower_lines):
         if any(k in low for k in keywords):
-            nums = re.findall(r"\d{1,3}(?:[ .]\d{3})*[.,]\d{2}", line)
+            nums = ix.line_amounts(i)
             if nums:
                 return parse_amount(nums[-1])
     return ""
@@ -202,12 +353,7 @@ def extract_amount(text, keywords):
 
 
 def extract_brutto(text):
-    numbers = re.findall(r"\d{1,3}(?:[ .]\d{3})*[.,-]\d{2}", text)
-    values = []
-    for n in numbers:
-        v = parse_amount(n)
-        if v != "":
-            values.append(v)
+    values = as_text_index(text).amount_values
     return max(values) if values else ""
 
 def detect_vat_rate(text: str):
@@ -218,8 +364,8 @@ def detect_vat_rate(text: str):
     - jeśli jest kilka stawek, bierzemy najwyższą (często to ta "główna")
     """
     # typowe zapisy: 23%, 23 %, VAT 23%, stawka 23%
-    rates = re.findall(r"(?<!\d)(\d{1,2})\s*%", text)
-    rates = [int(r) for r in rates if 0 <= int(r) <= 30]  # filtr śmieci
+    rates = as_text_index(text).percent_tokens
+    rates = [r for r in rates if 0 <= r <= 30]  # filtr śmieci
     if not rates:
         return None
 
@@ -235,23 +381,18 @@ def detect_currency(text: str) -> str:
     if not text:
         return ""
 
-    t = text.upper()
-
-    patterns = [
-        ("PLN", r"\bPLN\b|\bZŁ\b|\bZL\b"),
-        ("EUR", r"\bEUR\b|€"),
-        ("CZK", r"\bCZK\b|\bKČ\b"),
-        ("SEK", r"\bSEK\b"),
-        ("HUF", r"\bHUF\b|\bFT\b"),
-        ("LEI", r"\bLEI\b|\bRON\b"),  # rumuńska waluta, u Ciebie ma być LEI
-        ("NOK", r"\bNOK\b"),
-    ]
+    t = as_text_index(text).upper
 
-    for code, pat in patterns:
-        if re.search(pat, t):
+    # jedno przejście po tekście; wygrywa waluta o najwyższym priorytecie, nie pierwsza w tekście
+    best = ""
+    for m in CURRENCY_RE.finditer(t):
+        code = CURRENCY_TOKENS[m.group()]
+        if code == "PLN":
             return code
+        if not best or CURRENCY_PRIORITY[code] < CURRENCY_PRIORITY[best]:
+            best = code
 
-    return ""
+    return best
 
 
 def extract_totals_by_context(text: str):
@@ -259,30 +400,20 @@ def extract_totals_by_context(text: str):
     Szuka linii z sumami po kontekście (razem/total/suma/brutto/vat/do zapłaty/wartość dokumentu).
     Zwraca (netto, vat, brutto) - każdy może być "" jeśli brak.
     """
-    ctx = [
-        "razem", "total", "suma", "sumy",
-        "brutto", "netto", "vat", "mwst", "tax",
-        "do zapłaty", "amount due", "wartość dokumentu", "wartosc dokumentu"
-    ]
-
-    num_re = re.compile(r"\d{1,3}(?:[ .]\d{3})*[.,-]\d{2}")
-
+    ix = as_text_index(text)
     best = None  # (score, netto, vat, brutto)
 
-    for line in text.splitlines():
-        low = line.lower()
-        score = sum(1 for k in ctx if k in low)
+    for i, low in enumerate(ix.lower_lines):
+        score = sum(1 for k in TOTALS_CONTEXT_KEYS if k in low)
         if score == 0:
             continue
 
-        line_fixed = fix_ocr_separators(line)
-        nums = num_re.findall(line_fixed)
+        nums = ix.line_amounts_fixed(i)
 
         if len(nums) < 2:
             continue
 
-        values = [parse_amount(n) for n in nums]
-        values = [v for v in values if v != ""]
+        values = ix.line_values_fixed(i)
 
         if len(values) < 2:
             continue
@@ -333,60 +464,38 @@ def extract_relevant_lines(text: str) -> str:
         "brutto", "gross", "do zapłaty", "amount due", "razem do zapłaty"
     ]
 
+    ix = as_text_index(text)
     lines = []
-    for line in text.splitlines():
-        low = line.lower()
+    for line, low in zip(ix.lines, ix.lower_lines):
         if any(k in low for k in keywords):
             lines.append(line.strip())
 
     # limit bezpieczeństwa (koszt!)
     return "\n".join(lines[:30])
 
+def get_ai_fallback() -> AIFallback:
+    """Jeden klient AI, schemat i cache odpowiedzi na cały proces."""
+    global _ai_fallback
+    if _ai_fallback is None:
+        _ai_fallback = AIFallback(concurrency=AI_CONCURRENCY)
+    return _ai_fallback
+
+
 def ai_extract_fields(text_for_ai: str) -> dict:
     """
     Wywołuje AI i każe mu zwrócić WYŁĄCZNIE JSON zgodny ze schematem invoice_schema.json.
+    Odpowiedzi są cache'owane (ai_fallback.AICache) - ten sam tekst nie kosztuje drugi raz.
     """
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("Brak zmiennej środowiskowej OPENAI_API_KEY")
-
-    client = OpenAI(api_key=api_key)
-    schema_pack = load_invoice_schema()  # {"name": "...", "schema": {...}}
-
-    instructions = (
-        "Wyciągnij z treści faktury: seller_name, netto, vat, currency. "
-        "Zwróć WYŁĄCZNIE JSON zgodny ze schematem. "
-        "Jeśli nie masz pewności, ustaw null i daj confidence=low. "
-        "W evidence.seller_line wklej linię, z której wziąłeś sprzedawcę. "
-        "W evidence.totals_line wklej linię/fragment z sumami netto/VAT."
-    )
-
-    # safety: nie wysyłamy za dużo tekstu nawet jeśli ktoś poda śmietnik
-    trimmed = text_for_ai[:8000]
-
-    resp = client.responses.create(
-        model="gpt-4.1-mini",
-        instructions=instructions,
-        input=trimmed,
-        text={
-            "format": {
-                "type": "json_schema",
-                "name": schema_pack["name"],
-                "schema": schema_pack["schema"],
-                "strict": True
-            }
-        },
-    )
-
-    return json.loads(resp.output_text)
+    return get_ai_fallback().extract(text_for_ai)
 
 def extract_amount_martex(text):
     netto = ""
     vat = ""
 
-    for line in text.splitlines():
-        if re.search(r"\d{1,2}\s*%", line):
-            nums = re.findall(r"\d{1,3}(?:[ .]\d{3})*[.,]\d{2}", line)
+    ix = as_text_index(text)
+    for i, line in enumerate(ix.lines):
+        if RATE_RE.search(line):
+            nums = ix.line_amounts(i)
             if len(nums) >= 2:
                 netto = parse_amount(nums[0])
                 vat   = parse_amount(nums[1])
@@ -397,111 +506,116 @@ def extract_amount_martex(text):
 
 
 def extract_invoice_date(text, seller=""):
-    # === WROV ===
-    if seller == "UNIUNEA NATIONALA A TRANSPORTATORILOR RUTIERI DIN ROMANIA":
-        for line in text.splitlines():
-            if "data:" in line.lower():
-                match = re.search(r"\d{2}-\d{2}-\d{4}", line)
-                if match:
-                    return match.group()
+    ix = as_text_index(text)
+
+    # zgodność wstecz: dawny parametr seller (WROV) -> strategia "data_label" z pliku reguł
+    if seller and any(r.name == seller and r.date == "data_label" for r in get_seller_rules().rules):
+        return extract_invoice_date_label(ix)
 
         # === PRIORYTET: Data wystawienia / Invoice date ===
-    for line in text.splitlines():
-        low = line.lower()
+    for i, low in enumerate(ix.lower_lines):
         if "data wystawienia" in low or "invoice date" in low:
-            m = re.search(r"\d{4}-\d{2}-\d{2}", line)
-            if m:
-                return m.group()
-            m = re.search(r"\d{2}[./-]\d{2}[./-]\d{4}", line)
-            if m:
-                return m.group()
+            d = ix.line_date(i)
+            if d:
+                return d
 
         # === OGÓLNE (fallback) ===
-    for line in text.splitlines():
-        m = re.search(r"\d{4}-\d{2}-\d{2}", line)
-        if m:
-            return m.group()
-        m = re.search(r"\d{2}[./-]\d{2}[./-]\d{4}", line)
-        if m:
-            return m.group()
+    for i in range(len(ix.lines)):
+        d = ix.line_date(i)
+        if d:
+            return d
 
     return ""
 
 
+def extract_invoice_date_label(text) -> str:
+    """Np. WROV: data w linii "data:" w formacie dd-mm-rrrr, potem ogólna logika."""
+    ix = as_text_index(text)
+    for line, low in zip(ix.lines, ix.lower_lines):
+        if "data:" in low:
+            match = DASH_DATE_RE.search(line)
+            if match:
+                return match.group()
+    return extract_invoice_date(ix)
+
+
 def is_poczta_polska_invoice(faktura: str) -> bool:
-    return bool(re.match(r"^F\d{5}G\d{12}P$", faktura))
+    """Zgodność wstecz: numer faktury pasuje do reguły ze strategią daty "poczta"."""
+    rule = get_seller_rules().match_invoice(faktura)
+    return rule is not None and rule.date == "poczta"
+
 
 def extract_invoice_date_poczta(text: str) -> str:
-    match = re.search(r"Data wystawienia:\s*(\d{4}-\d{2}-\d{2})", text)
+    match = POCZTA_DATE_RE.search(as_text_index(text).text)
     if match:
         return match.group(1)
     return ""
 
 
-def extract_seller(text, faktura):
-    if re.match(r"^WROV\d{7}$", faktura):
-        return "UNIUNEA NATIONALA A TRANSPORTATORILOR RUTIERI DIN ROMANIA"
+# strategia "date" z pliku reguł -> funkcja
+DATE_STRATEGIES = {
+    "default": extract_invoice_date,
+    "data_label": extract_invoice_date_label,
+    "poczta": extract_invoice_date_poczta,
+    "none": lambda text: "",
+}
 
-    if re.match(r"^[A-Za-z][A-Za-z0-9]?/[A-Za-z]{2,3}/202\d/\d{5}$", faktura):
-        return "MARTEX SP. Z O.O."
 
-    # ======= REGUŁY KEYWORD (Twoje mapowanie sprzedawców) =======
-    mapped = apply_seller_keyword_map(text)
-    if mapped:
-        return mapped
+def extract_invoice_date_for(text, rule=None) -> str:
+    strategy = rule.date if rule is not None else "default"
+    return DATE_STRATEGIES[strategy](text)
 
 
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
+def match_seller_rule(text, faktura):
+    """Reguła z pliku: najpierw po numerze faktury, potem po keywordach w treści."""
+    return get_seller_rules().match(faktura, as_text_index(text).upper)
 
-    # słowa kluczowe
-    seller_headers = ["sprzedawca", "seller", "lieferant"]
-    buyer_headers  = ["nabywca", "kupujący", "kupujacy", "buyer", "odbiorca", "recipient", "customer"]
 
-    # rzeczy, które często pojawiają się w pobliżu i psują wybór
-    banned_contains = [
-        "x-trade transport",  # <- to chciałaś ignorować
-        "x trade transport",
-        "x-trade",
-        "transport",
-    ]
+def extract_seller(text, faktura):
+    ix = as_text_index(text)
 
-    # linie, które są "śmieciem" zamiast nazwy firmy
-    banned_exact = {
-        "sprzedawca", "seller", "lieferant",
-        "nabywca", "kupujący", "kupujacy", "buyer", "ODPOWIEDZIALNOŚCIĄ",
-        "ODPOWIEDZIALNOSCIA",
-    }
+    # ======= REGUŁY Z PLIKU (numer faktury, potem keywordy) =======
+    rule = match_seller_rule(ix, faktura)
+    if rule is not None:
+        return rule.name
+
+    return extract_seller_from_text(ix)
 
-    def is_good_company_line(s: str) -> bool:
-        low = s.lower()
 
-        if low in banned_exact:
-            return False
+def is_good_company_line(s: str) -> bool:
+    low = s.lower()
 
-        # jeśli trafimy na sekcję kupującego, stop
-        if any(h in low for h in buyer_headers):
-            return False
+    if low in SELLER_BANNED_EXACT:
+        return False
 
-        # ignorujemy linie z x-trade transport + podobne
-        if any(b in low for b in banned_contains):
-            return False
+    # jeśli trafimy na sekcję kupującego, stop
+    if any(h in low for h in BUYER_HEADERS):
+        return False
 
-        # nie bierzemy linii z samymi cyframi / datami / zbyt krótkich
-        if len(s) < 4:
-            return False
-        if all(ch.isdigit() or ch in ".,-/" for ch in s):
-            return False
+    # ignorujemy linie z x-trade transport + podobne
+    if any(b in low for b in SELLER_BANNED_CONTAINS):
+        return False
 
-        # jeśli wygląda jak NIP/REGON/itp. to nie jest nazwa
-        if "nip" in low or "vat" in low or "regon" in low:
-            return False
+    # nie bierzemy linii z samymi cyframi / datami / zbyt krótkich
+    if len(s) < 4:
+        return False
+    if all(ch.isdigit() or ch in ".,-/" for ch in s):
+        return False
 
-        return True
+    # jeśli wygląda jak NIP/REGON/itp. to nie jest nazwa
+    if "nip" in low or "vat" in low or "regon" in low:
+        return False
+
+    return True
+
+
+def extract_seller_from_text(text):
+    ix = as_text_index(text)
+    lines = ix.stripped_lines
 
     # 1) preferowane: po nagłówku sprzedawcy szukamy pierwszej sensownej linijki w kolejnych 6 liniach
-    for i, line in enumerate(lines):
-        low = line.lower()
-        if any(h in low for h in seller_headers):
+    for i, low in enumerate(ix.stripped_lower_lines):
+        if any(h in low for h in SELLER_HEADERS):
             for j in range(i + 1, min(i + 7, len(lines))):
                 cand = lines[j]
                 if is_good_company_line(cand):
@@ -517,22 +631,20 @@ def extract_seller(text, faktura):
 
 
 def extract_amount_razem(text: str):
-    razem_re = re.compile(r"\brazem\b", re.IGNORECASE)
-
-    # <-- tu dopuszczamy . , albo - jako separator dziesiętny
-    num_re = re.compile(r"\d{1,3}(?:[ .]\d{3})*[.,-]\d{2}")
-
-    for line in text.splitlines():
-        if not razem_re.search(line):
+    ix = as_text_index(text)
+    for line, low in zip(ix.lines, ix.lower_lines):
+        # tani filtr zanim odpalimy regex z \b
+        if "razem" not in low or not RAZEM_RE.search(line):
             continue
 
-        parts = razem_re.split(line, maxsplit=1)
+        parts = RAZEM_RE.split(line, maxsplit=1)
         tail = parts[1] if len(parts) > 1 else line
 
         # najpierw naprawiamy typowe OCR fuckupy
         tail = fix_ocr_separators(tail)
 
-        nums = num_re.findall(tail)
+        # <-- tu dopuszczamy . , albo - jako separator dziesiętny
+        nums = AMOUNT_DASH_RE.findall(tail)
         if len(nums) >= 2:
             netto = parse_amount(fix_ocr_separators(nums[0]))
             vat   = parse_amount(fix_ocr_separators(nums[1]))
@@ -543,10 +655,11 @@ def extract_amount_razem(text: str):
 
 
 def looks_like_worth_calling_ai(text: str) -> bool:
+    ix = as_text_index(text)
     # musi być liczba z groszami
-    has_amount = bool(re.search(r"\d+[.,]\d{2}", text))
+    has_amount = bool(MONEY_RE.search(ix.text))
     # i jakieś słowo-klucz sumy
-    has_keyword = any(k in text.lower() for k in ["razem", "total", "suma", "vat", "netto", "mwst", "tax"])
+    has_keyword = any(k in ix.lower for k in AI_TOTAL_KEYS)
     return has_amount and has_keyword
 
 def to_money(val):
@@ -561,7 +674,340 @@ def to_money(val):
         return ""
 
 
-def generate_xlsx(folder, output_dir):
+def extract_fields(ocr_txt_dir: str, filename: str, profiler=NULL_PROFILER):
+    """
+    Pola faktury z jednego TXT - wszystko poza AI (None dla złej nazwy pliku).
+    "ai_text": fragment tekstu dla AI, gdy USE_AI i brakuje sprzedawcy/netto/VAT (inaczej None);
+    samo zapytanie i dokończenie wiersza robi finish_row, żeby AI dało się puszczać paczkami.
+    profiler: czasy odczytu, indeksu i każdego ekstraktora (profiling.Profiler).
+    """
+    prof = profiler
+    name = os.path.splitext(filename)[0]
+    if "_" not in name:
+        return None
+
+    faktura_raw, rejestracja = name.split("_", 1)
+    faktura = faktura_raw.replace("-", "/").strip()
+    rejestracja = rejestracja.strip()
+
+    txt_path = os.path.join(ocr_txt_dir, filename)
+    with prof.stage("text_read", filename):
+        with open(txt_path, "r", encoding="utf-8") as f:
+            full_text = f.read()
+
+    # jeden indeks linii/tokenów współdzielony przez wszystkie ekstraktory
+    with prof.stage("text_index", filename):
+        ix = TextIndex(full_text)
+
+    currency = prof.call(detect_currency, ix, file=filename)
+
+    # reguła sprzedawcy z pliku (numer faktury / keyword) - jedno dopasowanie na dokument
+    rule = prof.call(match_seller_rule, ix, faktura, file=filename)
+    if rule is not None and rule.currency and not currency:
+        currency = rule.currency
+
+    # === REGUŁA BEZ KWOT (np. potwierdzenia Poczty "(00)...") ===
+    if rule is not None and rule.amounts == "none":
+        return {
+            "faktura": faktura,
+            "invoice_date": prof.call(extract_invoice_date_for, ix, rule, file=filename),
+            "rejestracja": rejestracja,
+            "seller_name": rule.name,
+            "netto": "",
+            "vat": 0.0,
+            "brutto": "",
+            "currency": currency,
+            "filename": filename,
+            "ai_text": None,
+        }
+
+    # ======= SPRZEDAWCA + DATA (bo później tego używamy) =======
+    seller_name = rule.name if rule is not None else prof.call(extract_seller_from_text, ix, file=filename)
+    invoice_date = prof.call(extract_invoice_date_for, ix, rule, file=filename)
+
+    # ======= KWOTY: globalna logika (bez AI) =======
+
+    brutto = prof.call(extract_brutto, ix, file=filename)
+
+    # 0) wykryj stawkę VAT (do ratunku)
+    vat_rate = prof.call(detect_vat_rate, ix, file=filename)  # np. 0.23, 0.08, None
+
+    # 1) Najpierw totals po kontekście (działa nawet jak "Razem" jest zjebane)
+    netto, vat, brutto_ctx = prof.call(extract_totals_by_context, ix, file=filename)
+
+    # jeśli kontekst znalazł brutto, a globalne brutto nie
+    if brutto == "" and brutto_ctx != "":
+        brutto = brutto_ctx
+
+    # 2) Potem klasyczne "Razem: netto vat ..."
+    if netto == "" or vat == "":
+        n2, v2 = prof.call(extract_amount_razem, ix, file=filename)
+        if netto == "":
+            netto = n2
+        if vat == "":
+            vat = v2
+
+    # 3) Potem keywordy (netto/vat)
+    if netto == "":
+        netto = prof.call(extract_amount, ix, NET_KEYS, file=filename)
+    if vat == "":
+        vat = prof.call(extract_amount, ix, VAT_KEYS, file=filename)
+
+    # 4) OSTATNIA DESKA: brutto -> netto/vat wg wykrytej stawki (albo 23% jak nie wykryło)
+    if brutto != "" and (netto == "" or vat == ""):
+        rate = vat_rate if vat_rate is not None else 0.23
+        n3, v3 = calc_netto_vat_from_brutto(float(brutto), rate)
+        if netto == "":
+            netto = n3
+        if vat == "":
+            vat = v3
+
+    # ================= AI FALLBACK (TANI TRYB) - tylko przygotowanie tekstu =================
+    ai_text = None
+    # bez AI nie liczymy tekstu, którego nikt nie wyśle
+    if USE_AI and (seller_name == "" or netto == "" or vat == ""):
+        relevant_text = prof.call(extract_relevant_lines, ix, file=filename)
+        if relevant_text and looks_like_worth_calling_ai(relevant_text):
+            ai_text = relevant_text
+
+    return {
+        "faktura": faktura,
+        "invoice_date": invoice_date,
+        "rejestracja": rejestracja,
+        "seller_name": seller_name,
+        "netto": netto,
+        "vat": vat,
+        "brutto": brutto,
+        "currency": currency,
+        "filename": filename,
+        "ai_text": ai_text,
+    }
+
+
+def finish_row(fields: dict, ai: dict | None = None) -> dict:
+    """Uzupełnienie z odpowiedzi AI (jeśli jest), zaokrąglenie kwot, reguła znaku VAT -> wiersz xlsx."""
+    seller_name = fields["seller_name"]
+    netto = fields["netto"]
+    vat = fields["vat"]
+    brutto = fields["brutto"]
+
+    if ai:
+        if seller_name == "" and ai.get("seller_name"):
+            seller_name = ai["seller_name"].strip().upper()
+
+        if netto == "" and ai.get("netto") is not None:
+            netto = ai["netto"]
+
+        if vat == "" and ai.get("vat") is not None:
+            vat = ai["vat"]
+
+    netto = to_money(netto)
+    vat = to_money(vat)
+    brutto = to_money(brutto)
+
+    # === REGUŁA: znak VAT zgodny z netto ===
+    if netto != "" and vat != "":
+        # netto nieujemne -> VAT nie może być ujemny
+        if netto >= 0 and vat < 0:
+            vat = abs(vat)
+
+        # faktura minusowa -> VAT też minus (zgodny znak)
+        elif netto < 0 and vat > 0:
+            vat = -abs(vat)
+
+    return {
+        "Nr faktury": fields["faktura"],
+        "Data wystawienia": normalize_date(fields["invoice_date"]),
+        "Nr rejestracyjny": fields["rejestracja"],
+        "Sprzedawca": seller_name,
+        "Netto": netto,
+        "VAT": vat,
+        "Brutto": brutto,
+        "Waluta": fields["currency"],
+        "Plik": fields["filename"]
+    }
+
+
+def extract_row(ocr_txt_dir: str, filename: str, profiler=NULL_PROFILER):
+    """
+    Czyta jeden plik TXT z OCR i zwraca wiersz do xlsx (dict)
+    albo None, gdy nazwa nie ma formatu NRFAKTURY_REJESTRACJA.txt.
+    """
+    fields = extract_fields(ocr_txt_dir, filename, profiler)
+    if fields is None:
+        return None
+
+    ai = None
+    if USE_AI and fields["ai_text"]:
+        try:
+            ai = ai_extract_fields(fields["ai_text"])
+        except Exception:
+            ai = None
+    return finish_row(fields, ai)
+
+
+def _extract_fields_chunk(ocr_txt_dir: str, filenames: list, profile: bool = False):
+    # paczka plików na jedno zadanie puli - mniej narzutu na pickle/IPC niż plik po pliku;
+    # profil liczony w procesie puli, zdarzenia wracają razem z wynikami
+    prof = Profiler() if profile else NULL_PROFILER
+    return [extract_fields(ocr_txt_dir, filename, prof) for filename in filenames], list(prof.events)
+
+
+# poniżej tylu plików ekstrakcja idzie szeregowo mimo workers > 1: start puli (spawn na Windows,
+# import modułu w każdym procesie) to ~1 s, a ekstrakcja ~0.1 ms na plik
+PARALLEL_MIN_FILES = 5000
+
+
+def _resolve_workers(workers) -> int:
+    # None / 0 -> wszystkie rdzenie
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def iter_rows(ocr_txt_dir: str, files: list, workers: int = 1, chunk_size: int = None, profiler=NULL_PROFILER):
+    """
+    Wiersze (albo None dla pominiętych plików) w kolejności `files`.
+    workers > 1 i co najmniej PARALLEL_MIN_FILES plików: ekstrakcja w puli procesów, paczkami po chunk_size plików;
+    wyniki paczek odbierane w kolejności wejścia, więc wynik jest identyczny jak szeregowo.
+    USE_AI: niekompletne faktury idą do AI paczkami po AI_BATCH_SIZE (współbieżnie, z cache).
+    """
+    fields = _iter_fields(ocr_txt_dir, files, workers, chunk_size, profiler)
+    if not USE_AI:
+        for f in fields:
+            yield finish_row(f) if f is not None else None
+        return
+
+    ai = get_ai_fallback()
+    while True:
+        batch = list(islice(fields, AI_BATCH_SIZE))
+        if not batch:
+            return
+        with profiler.stage("ai_batch"):
+            answers = iter(ai.extract_many([f["ai_text"] for f in batch if f is not None and f["ai_text"]]))
+        for f in batch:
+            if f is None:
+                yield None
+            else:
+                yield finish_row(f, next(answers) if f["ai_text"] else None)
+
+
+def _iter_fields(ocr_txt_dir: str, files: list, workers: int = 1, chunk_size: int = None, profiler=NULL_PROFILER):
+    workers = _resolve_workers(workers)
+    if workers == 1 or len(files) < PARALLEL_MIN_FILES:
+        for filename in files:
+            yield extract_fields(ocr_txt_dir, filename, profiler)
+        return
+
+    if not chunk_size:
+        # ~4 paczki na proces (wyrównanie obciążenia), ale nie za duże
+        chunk_size = max(1, min(256, len(files) // (workers * 4)))
+    chunks = (files[i:i + chunk_size] for i in range(0, len(files), chunk_size))
+
+    # najwyżej ~2 paczki na proces w locie: wyniki nie gromadzą się w pamięci, gdy zapis nie nadąża
+    workers = min(workers, -(-len(files) // chunk_size))
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        profile = profiler.enabled
+        pending = deque(
+            pool.submit(_extract_fields_chunk, ocr_txt_dir, c, profile) for c in islice(chunks, window)
+        )
+        while pending:
+            rows, events = pending.popleft().result()
+            profiler.merge(events)
+            nxt = next(chunks, None)
+            if nxt is not None:
+                pending.append(pool.submit(_extract_fields_chunk, ocr_txt_dir, nxt, profile))
+            yield from rows
+
+
+def write_xlsx_stream(rows, output_file: str, profiler=NULL_PROFILER) -> int:
+    """
+    Zapis wierszy od razu do xlsx (openpyxl write_only) - pamięć nie rośnie z liczbą wierszy.
+    Te same kolumny i formaty co df.to_excel w trybie zwykłym. Zwraca liczbę zapisanych wierszy.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(XLSX_COLUMNS)
+
+    count = 0
+    for row in rows:
+        if row is None:
+            continue
+        ws.append([row[col] for col in XLSX_COLUMNS])
+        count += 1
+
+    # wiersze dopisywane są w trakcie ekstrakcji - osobno mierzymy tylko zapis pliku
+    with profiler.stage("xlsx_write"):
+        wb.save(output_file)
+    return count
+
+
+def extraction_version() -> str:
+    """Wersja wyników ekstrakcji: kod + plik reguł sprzedawców + tryb AI."""
+    return f"{EXTRACTOR_VERSION}:{get_seller_rules().version}:{int(USE_AI)}"
+
+
+def _with_progress(files: list, rows, on_progress=None):
+    # on_progress(filename, current, total) - jak w ocr_folder_pdfs; wołane po każdym pliku
+    if on_progress is None:
+        yield from rows
+        return
+    total = len(files)
+    for current, (filename, row) in enumerate(zip(files, rows), start=1):
+        on_progress(filename, current, total)
+        yield row
+
+
+def update_manifest(manifest, ocr_txt_dir: str, files: list, workers: int = 1, on_progress=None,
+                    profiler=NULL_PROFILER) -> int:
+    """Ekstrakcja tylko nowych/zmienionych plików; zwraca ich liczbę."""
+    version = extraction_version()
+    with profiler.stage("manifest_check"):
+        stale = manifest.stale_files(ocr_txt_dir, files, version)
+    rows = _with_progress(stale, iter_rows(ocr_txt_dir, stale, workers, profiler=profiler), on_progress)
+    for n, (filename, row) in enumerate(zip(stale, rows), start=1):
+        manifest.put(ocr_txt_dir, filename, version, row)
+        if n % 500 == 0:
+            manifest.commit()
+    manifest.commit()
+    return len(stale)
+
+
+def generate_xlsx(folder, output_dir, workers=1, stream=False, incremental=False, on_progress=None,
+                  profiler=NULL_PROFILER, store=None):
+    """Generuje xlsx i zwraca ścieżkę pliku (szczegóły: build_xlsx)."""
+    return build_xlsx(folder, output_dir, workers=workers, stream=stream, incremental=incremental,
+                      on_progress=on_progress, profiler=profiler, store=store)["output_file"]
+
+
+def open_store(store):
+    """
+    Ścieżka albo gotowy InvoiceStore -> (store, czy zamknąć po zapisie).
+    Baza jest dodatkiem do xlsx: gdy nie da się jej otworzyć (folder tylko do odczytu, blokada),
+    zwraca (None, False) i xlsx powstaje bez niej.
+    """
+    if store is None or isinstance(store, InvoiceStore):
+        return store, False
+    try:
+        return InvoiceStore(store), True
+    except (sqlite3.Error, OSError) as e:
+        print("BAZA FAKTUR: nie można otworzyć", store, "- xlsx bez zapisu do bazy:", e)
+        return None, False
+
+
+def build_xlsx(folder, output_dir, workers=1, stream=False, incremental=False, on_progress=None,
+               profiler=NULL_PROFILER, store=None) -> dict:
+    """
+    Ekstrakcja wszystkich TXT z scans/ocr_txt i zapis xlsx - do wołania w procesie (GUI, serwis).
+    on_progress(filename, current, total) po każdym przetworzonym pliku.
+    profiler (profiling.Profiler): czasy etapów per plik, także z procesów puli.
+    store (ścieżka albo invoice_store.InvoiceStore): wiersze trafiają też do trwałej bazy faktur.
+    Zwraca: output_file, files, rows, skipped (złe nazwy plików), extracted (sparsowane w tym
+    przebiegu - w trybie przyrostowym tylko nowe/zmienione), seconds.
+    """
+    t0 = time.perf_counter()
+
     # folder może być bazą (...\Faktury) albo ...\Faktury\scans
     base_folder = folder
     if os.path.basename(folder).lower() == "scans":
@@ -573,185 +1019,158 @@ def generate_xlsx(folder, output_dir):
     if not os.path.isdir(ocr_txt_dir):
         raise FileNotFoundError("Brak folderu ocr_txt – najpierw uruchom OCR")
 
-    files = [f for f in os.listdir(ocr_txt_dir) if f.lower().endswith(".txt")]
-    files.sort()
-
-    rows = []
-
-    for filename in files:
-        name = os.path.splitext(filename)[0]
-        if "_" not in name:
-            continue
-
-        faktura_raw, rejestracja = name.split("_", 1)
-        faktura = faktura_raw.replace("-", "/").strip()
-        rejestracja = rejestracja.strip()
-
-        txt_path = os.path.join(ocr_txt_dir, filename)
-        with open(txt_path, "r", encoding="utf-8") as f:
-            full_text = f.read()
-
-        currency = detect_currency(full_text)
-
-        # === REGUŁA: POTWIERDZENIA POCZTY (00...) ===
-        if faktura.startswith("(00)"):
-            seller_name = "POCZTA POLSKA"
-            invoice_date = ""
-            netto = ""
-            vat = 0.0
-            brutto = ""
-
-            if not currency:
-                currency = "PLN"
-
-            rows.append({
-                "Nr faktury": faktura,
-                "Data wystawienia": "",
-                "Nr rejestracyjny": rejestracja,
-                "Sprzedawca": seller_name,
-                "Netto": netto,
-                "VAT": vat,
-                "Brutto": brutto,
-                "Waluta": currency,
-                "Plik": filename
-            })
-            continue
+    files = list_ocr_txt(ocr_txt_dir)
 
-        # ======= SPRZEDAWCA + DATA (bo później tego używamy) =======
-        seller_name = extract_seller(full_text, faktura)
-        invoice_date = extract_invoice_date(full_text, seller_name)
+    output_file = xlsx_output_path(output_dir)
 
-        # reguła "FxxxxxG...P" = Poczta Polska
-        if is_poczta_polska_invoice(faktura):
-            seller_name = "POCZTA POLSKA"
-            invoice_date = extract_invoice_date_poczta(full_text)
-            if not currency:
-                currency = "PLN"
+    print("FOLDER:", folder)
+    print("OCR_TXT_DIR:", ocr_txt_dir)
+    print("TXT FILES:", len(files), files[:5])
 
-        # ======= KWOTY: globalna logika (bez AI) =======
+    manifest = None
+    if incremental:
+        # parsujemy tylko nowe/zmienione TXT, reszta wierszy z manifestu
+        manifest = RowManifest(default_manifest_path(ocr_txt_dir))
+        extracted = update_manifest(manifest, ocr_txt_dir, files, workers, on_progress, profiler)
+        print("ZMIENIONE:", extracted)
+        source = manifest.iter_rows()
+    else:
+        extracted = len(files)
+        source = _with_progress(files, iter_rows(ocr_txt_dir, files, workers, profiler=profiler), on_progress)
 
-        brutto = extract_brutto(full_text)
+    store, own_store = open_store(store)
+    if store is not None:
+        source = store.sync(ocr_txt_dir, source, extraction_version())
 
-        # 0) wykryj stawkę VAT (do ratunku)
-        vat_rate = detect_vat_rate(full_text)  # np. 0.23, 0.08, None
+    try:
+        count = write_rows(source, output_file, stream, profiler)
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if own_store:
+            store.close()
+
+    return {
+        "output_file": output_file,
+        "files": len(files),
+        "rows": count,
+        "skipped": len(files) - count,
+        "extracted": extracted,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
 
-        # 1) Najpierw totals po kontekście (działa nawet jak "Razem" jest zjebane)
-        netto, vat, brutto_ctx = extract_totals_by_context(full_text)
 
-        # jeśli kontekst znalazł brutto, a globalne brutto nie
-        if brutto == "" and brutto_ctx != "":
-            brutto = brutto_ctx
+def export_xlsx(output_file: str, store=None, **filters) -> int:
+    """
+    Eksport z bazy faktur (bez ekstrakcji) - widok filtrowany po roku/miesiącu/sprzedawcy/rejestracji,
+    filtry jak InvoiceStore.query. Zwraca liczbę wierszy; nic nie pasuje -> ValueError, bez pliku.
+    """
+    # tu baza jest jedynym źródłem wierszy - błąd otwarcia ma przerwać eksport
+    own_store = not isinstance(store, InvoiceStore)
+    if own_store:
+        store = InvoiceStore(store or default_store_path())
+    try:
+        rows = store.query(**filters)
+        first = next(rows, None)
+        if first is None:
+            used = ", ".join(f"{k}={v}" for k, v in filters.items() if v is not None)
+            raise ValueError(
+                f"Żadna faktura w bazie nie pasuje do filtrów ({used})." if used else "Baza faktur jest pusta."
+            )
+        return write_rows(chain([first], rows), output_file, stream=True)
+    finally:
+        if own_store:
+            store.close()
+
+
+def xlsx_output_path(output_dir: str) -> str:
+    return os.path.join(
+        output_dir,
+        f"wynik_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
+    )
 
-        # 2) Potem klasyczne "Razem: netto vat ..."
-        if netto == "" or vat == "":
-            n2, v2 = extract_amount_razem(full_text)
-            if netto == "":
-                netto = n2
-            if vat == "":
-                vat = v2
 
-        # 3) Potem keywordy (netto/vat)
-        if netto == "":
-            netto = extract_amount(full_text, NET_KEYS)
-        if vat == "":
-            vat = extract_amount(full_text, VAT_KEYS)
+def list_ocr_txt(ocr_txt_dir: str) -> list:
+    files = [f for f in os.listdir(ocr_txt_dir) if f.lower().endswith(".txt")]
+    files.sort()
+    return files
 
-        # 4) OSTATNIA DESKA: brutto -> netto/vat wg wykrytej stawki (albo 23% jak nie wykryło)
-        if brutto != "" and (netto == "" or vat == ""):
-            rate = vat_rate if vat_rate is not None else 0.23
-            n3, v3 = calc_netto_vat_from_brutto(float(brutto), rate)
-            if netto == "":
-                netto = n3
-            if vat == "":
-                vat = v3
 
-        # ================= AI FALLBACK (TANI TRYB) =================
-        if USE_AI and (seller_name == "" or netto == "" or vat == ""):
-            relevant_text = extract_relevant_lines(full_text)
+def write_rows(source, output_file: str, stream: bool = False, profiler=NULL_PROFILER) -> int:
+    """Zapis wierszy (None = pominięty plik) do xlsx; zwraca liczbę wierszy."""
+    if stream:
+        # wiersze idą prosto do pliku, bez listy i DataFrame
+        print("ZAPISUJE:", output_file)
+        count = write_xlsx_stream(source, output_file, profiler)
+        print("ROWS:", count)
+        if not count:
+            os.remove(output_file)
+            raise ValueError(
+                "Nie powstały żadne wiersze. Sprawdź nazwy plików TXT: muszą mieć format NRFAKTURY_REJESTRACJA.txt"
+            )
+        return count
 
-            ai = None
-            if relevant_text and looks_like_worth_calling_ai(relevant_text):
-                try:
-                    ai = ai_extract_fields(relevant_text)
-                except Exception:
-                    ai = None
-
-            if ai:
-                if seller_name == "" and ai.get("seller_name"):
-                    seller_name = ai["seller_name"].strip().upper()
-
-                if netto == "" and ai.get("netto") is not None:
-                    netto = ai["netto"]
-
-                if vat == "" and ai.get("vat") is not None:
-                    vat = ai["vat"]
-
-        netto = to_money(netto)
-        vat = to_money(vat)
-        brutto = to_money(brutto)
-
-        # === REGUŁA: znak VAT zgodny z netto ===
-        if netto != "" and vat != "":
-            # netto nieujemne -> VAT nie może być ujemny
-            if netto >= 0 and vat < 0:
-                vat = abs(vat)
-
-            # faktura minusowa -> VAT też minus (zgodny znak)
-            elif netto < 0 and vat > 0:
-                vat = -abs(vat)
-
-        rows.append({
-            "Nr faktury": faktura,
-            "Data wystawienia": normalize_date(invoice_date),
-            "Nr rejestracyjny": rejestracja,
-            "Sprzedawca": seller_name,
-            "Netto": netto,
-            "VAT": vat,
-            "Brutto": brutto,
-            "Waluta": currency,
-            "Plik": filename
-        })
+    rows = [row for row in source if row is not None]
 
     if not rows:
         raise ValueError(
             "Nie powstały żadne wiersze. Sprawdź nazwy plików TXT: muszą mieć format NRFAKTURY_REJESTRACJA.txt"
         )
 
-    df = pd.DataFrame(rows)
+    with profiler.stage("dataframe"):
+        df = pd.DataFrame(rows)
 
-    df = df[[
-        "Nr faktury",
-        "Data wystawienia",
-        "Sprzedawca",
-        "Netto",
-        "VAT",
-        "Waluta",
-        "Brutto",
-        "Nr rejestracyjny",
-    ]]
-
-    output_file = os.path.join(
-        output_dir,
-        f"wynik_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
-    )
-
-    print("FOLDER:", folder)
-    print("OCR_TXT_DIR:", ocr_txt_dir)
-    print("TXT FILES:", len(files), files[:5])
+        df = df[XLSX_COLUMNS]
 
     print("ROWS:", len(rows))
     print("ZAPISUJE:", output_file)
 
-    df.to_excel(output_file, index=False)
-    return output_file
+    with profiler.stage("xlsx_write"):
+        df.to_excel(output_file, index=False)
+    return len(rows)
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--folder", required=True)
-    parser.add_argument("--output", required=True)
+    parser.add_argument("--folder", default=None)
+    parser.add_argument("--output", required=True,
+                        help="folder na xlsx (z --export: ścieżka pliku xlsx)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="liczba procesów do ekstrakcji (0 = wszystkie rdzenie, 1 = szeregowo)")
+    parser.add_argument("--stream", action="store_true",
+                        help="zapis strumieniowy (stała pamięć, dla bardzo dużych paczek)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="parsuj tylko nowe/zmienione TXT (manifest w ocr_txt), resztę wierszy bierz z manifestu")
+    parser.add_argument("--profile", action="store_true",
+                        help="czasy etapów (wall/CPU) na koniec, jako JSON")
+    parser.add_argument("--trace", default=None,
+                        help="zapisz Chrome trace JSON (chrome://tracing, Perfetto); włącza profilowanie")
+    parser.add_argument("--store", default=None,
+                        help="zapisuj wiersze w bazie faktur SQLite (ścieżka; przy --export domyślnie invoices.sqlite w folderze danych użytkownika)")
+    parser.add_argument("--export", action="store_true",
+                        help="bez ekstrakcji: xlsx z bazy faktur, filtry --year/--month/--seller/--plate")
+    parser.add_argument("--year", type=int, default=None)
+    parser.add_argument("--month", default=None, help="rrrr-mm")
+    parser.add_argument("--seller", default=None, help="początek nazwy sprzedawcy (bez wielkości liter)")
+    parser.add_argument("--plate", default=None)
     args = parser.parse_args()
-    output = generate_xlsx(args.folder, args.output)
+
+    if args.export:
+        count = export_xlsx(args.output, args.store, year=args.year, month=args.month,
+                            seller=args.seller, plate=args.plate)
+        print(f"Gotowe. Wierszy: {count}, plik: {args.output}")
+        raise SystemExit(0)
+    if not args.folder:
+        parser.error("--folder jest wymagany (chyba że --export)")
+
+    profiler = Profiler() if args.profile or args.trace else NULL_PROFILER
+    output = generate_xlsx(args.folder, args.output, workers=args.workers, stream=args.stream,
+                           incremental=args.incremental, profiler=profiler, store=args.store)
     print(f"Gotowe. Plik zapisany: {output}")
+    if args.trace:
+        profiler.write_chrome_trace(args.trace)
+        print(f"Trace: {args.trace}")
+    if args.profile:
+        print(json.dumps(profiler.stats()["stages"], ensure_ascii=False, indent=2))
 
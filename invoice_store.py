@@ -0,0 +1,206 @@
+import os
+import time
+import sqlite3
+
+APP_NAME = "GeneratorFaktur"
+
+# kolumna xlsx -> kolumna w bazie (kolejność jak w wierszu z finish_row)
+ROW_FIELDS = {
+    "Nr faktury": "invoice_no",
+    "Data wystawienia": "issue_date",
+    "Nr rejestracyjny": "plate",
+    "Sprzedawca": "seller",
+    "Netto": "netto",
+    "VAT": "vat",
+    "Brutto": "brutto",
+    "Waluta": "currency",
+    "Plik": "filename",
+}
+MONEY_FIELDS = ("netto", "vat", "brutto")
+
+
+def _iso_date(date: str):
+    """dd.mm.rrrr (format z normalize_date) -> rrrr-mm-dd do zapytań po zakresach; "" -> None."""
+    if not date or len(date) != 10:
+        return None
+    dd, mm, yyyy = date.split(".")
+    return f"{yyyy}-{mm}-{dd}"
+
+
+def _prefix_range(prefix: str):
+    # "SCANIA" -> ["SCANIA", "SCANIB") - zapytanie po prefiksie, które korzysta z indeksu
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class InvoiceStore:
+    """
+    Trwała, indeksowana baza wyciągniętych faktur (SQLite) - historia z wielu folderów i lat.
+    Jeden wiersz na plik TXT (source = folder ocr_txt, filename) + metadane ekstrakcji
+    (wersja reguł, czas). xlsx to tylko eksport widoku: export_xlsx w generate_excel.
+    Indeksy pod typowe filtry: rejestracja + data, sprzedawca (prefiks, bez wielkości liter) + data, data.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.error = None  # ostatni błąd zapisu w sync() (wtedy ten przebieg nie trafił do bazy)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS invoices (
+                source TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                invoice_no TEXT NOT NULL,
+                issue_date TEXT NOT NULL,
+                issue_iso TEXT,
+                plate TEXT NOT NULL,
+                seller TEXT NOT NULL,
+                seller_upper TEXT NOT NULL,
+                netto REAL,
+                vat REAL,
+                brutto REAL,
+                currency TEXT NOT NULL,
+                version TEXT NOT NULL,
+                extracted_at REAL NOT NULL,
+                PRIMARY KEY (source, filename)
+            );
+            CREATE INDEX IF NOT EXISTS idx_invoices_plate ON invoices(plate, issue_iso);
+            CREATE INDEX IF NOT EXISTS idx_invoices_seller ON invoices(seller_upper, issue_iso);
+            CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(issue_iso);
+            """
+        )
+        self.conn.commit()
+
+    def sync(self, source: str, rows, version: str, batch_size: int = 500):
+        """
+        Przepuszcza wiersze (generator z generate_xlsx) i zapisuje je po drodze.
+        Po wyczerpaniu: wpisy z `source`, których nie było w tym przebiegu, są usuwane,
+        więc baza odpowiada bieżącej zawartości folderu. None (zła nazwa pliku) przechodzi bez zapisu.
+        Błąd zapisu (np. baza zablokowana przez inny proces) nie przerywa wierszy idących do xlsx:
+        zmiany przebiegu są wycofywane, a błąd trafia do self.error.
+        """
+        source = os.path.normcase(os.path.abspath(source))
+        seen = set()
+        batch = []
+        now = time.time()
+        self.error = None
+
+        for row in rows:
+            if row is not None and self.error is None:
+                seen.add(row["Plik"])
+                batch.append(self._record(source, row, version, now))
+                if len(batch) >= batch_size:
+                    self._guarded(self._upsert, batch)
+                    batch = []
+            yield row
+
+        if self.error is None:
+            self._guarded(self._finish, source, seen, batch)
+
+    def _guarded(self, fn, *args):
+        try:
+            fn(*args)
+        except sqlite3.Error as e:
+            self.error = e
+            print("BAZA FAKTUR: błąd zapisu, ten przebieg nie trafi do bazy:", e)
+            try:
+                self.conn.rollback()
+            except sqlite3.Error:
+                pass
+
+    def _finish(self, source: str, seen: set, batch: list):
+        if batch:
+            self._upsert(batch)
+        gone = [
+            (source, name)
+            for (name,) in self.conn.execute("SELECT filename FROM invoices WHERE source = ?", (source,))
+            if name not in seen
+        ]
+        if gone:
+            self.conn.executemany("DELETE FROM invoices WHERE source = ? AND filename = ?", gone)
+        self.conn.commit()
+
+    def _record(self, source: str, row: dict, version: str, now: float) -> tuple:
+        values = {col: row[key] for key, col in ROW_FIELDS.items()}
+        for col in MONEY_FIELDS:
+            if values[col] == "":
+                values[col] = None
+        return (
+            source, values["filename"], values["invoice_no"], values["issue_date"],
+            _iso_date(values["issue_date"]), values["plate"], values["seller"], values["seller"].upper(),
+            values["netto"], values["vat"], values["brutto"], values["currency"], version, now,
+        )
+
+    def _upsert(self, records: list):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO invoices (source, filename, invoice_no, issue_date, issue_iso, plate, "
+            "seller, seller_upper, netto, vat, brutto, currency, version, extracted_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            records,
+        )
+
+    def query(self, year=None, month=None, date_from=None, date_to=None, seller=None, plate=None,
+              source=None):
+        """
+        Wiersze w formacie xlsx (jak finish_row), w kolejności folder + nazwa pliku.
+        year=2024, month="2024-05", date_from/date_to="rrrr-mm-dd" (włącznie),
+        seller = początek nazwy sprzedawcy bez względu na wielkość liter ("scania" -> SCANIA POLSKA ...),
+        plate = dokładny numer rejestracyjny, source = folder ocr_txt.
+        """
+        where = []
+        args = []
+        if year is not None:
+            where.append("issue_iso >= ? AND issue_iso < ?")
+            args += [f"{year}-01-01", f"{int(year) + 1}-01-01"]
+        if month is not None:
+            # "rrrr-mm-32" > każdy dzień miesiąca (porównanie tekstowe)
+            where.append("issue_iso >= ? AND issue_iso < ?")
+            args += [f"{month}-01", f"{month}-32"]
+        if date_from:
+            where.append("issue_iso >= ?")
+            args.append(date_from)
+        if date_to:
+            where.append("issue_iso <= ?")
+            args.append(date_to)
+        if seller:
+            lo, hi = _prefix_range(seller.upper())
+            where.append("seller_upper >= ? AND seller_upper < ?")
+            args += [lo, hi]
+        if plate:
+            where.append("plate = ?")
+            args.append(plate)
+        if source:
+            where.append("source = ?")
+            args.append(os.path.normcase(os.path.abspath(source)))
+
+        sql = "SELECT " + ", ".join(ROW_FIELDS.values()) + " FROM invoices"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY source, filename"
+
+        keys = list(ROW_FIELDS)
+        for values in self.conn.execute(sql, args):
+            row = dict(zip(keys, values))
+            for key in ("Netto", "VAT", "Brutto"):
+                if row[key] is None:
+                    row[key] = ""
+            yield row
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def user_data_dir() -> str:
+    """Folder danych użytkownika - zapisywalny także przy programie w Program Files albo na udziale sieciowym."""
+    if os.name == "nt":
+        root = os.environ.get("LOCALAPPDATA") or os.environ.get("APPDATA") or os.path.expanduser("~")
+    else:
+        root = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(root, APP_NAME)
+
+
+def default_store_path() -> str:
+    return os.path.join(user_data_dir(), "invoices.sqlite")
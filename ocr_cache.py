@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+# domyślny limit cache (sam tekst OCR, bez narzutu SQLite)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# ile odświeżeń last_used zbieramy przed jednym zapisem do bazy
+TOUCH_BATCH = 64
+
+STATUS_OK = "ok"
+STATUS_UNREADABLE = "unreadable"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def make_cache_key(pdf_path: str, settings: dict) -> str:
+    """
+    Klucz = hash treści PDF-a + ustawienia OCR (dpi, języki, config, strony...).
+    Zmiana nazwy pliku nie zmienia klucza, podmiana treści pod tą samą nazwą - zmienia.
+    """
+    settings_json = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    h = hashlib.sha256()
+    h.update(file_sha256(pdf_path).encode("ascii"))
+    h.update(settings_json.encode("utf-8"))
+    return h.hexdigest()
+
+
+class OCRCache:
+    """
+    Trwały cache wyników OCR w SQLite.
+    - entries: klucz -> status ("ok" / "unreadable") + tekst; wyniki negatywne też zapamiętujemy
+    - outputs: który klucz wyprodukował dany plik TXT (wykrywanie podmienionych PDF-ów)
+    Limit rozmiaru z usuwaniem najdawniej używanych wpisów (LRU).
+    Trafienia odświeżają last_used w pamięci i zapisują je paczkami (TOUCH_BATCH, put, close),
+    a łączny rozmiar wpisów liczymy raz przy otwarciu i dalej prowadzimy bieżąco.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                text TEXT NOT NULL,
+                path TEXT NOT NULL DEFAULT '',
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS outputs (
+                txt_name TEXT PRIMARY KEY,
+                key TEXT NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+        self.total = self._sum_sizes()
+        self._touched = {}
+
+    def _sum_sizes(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str):
+        """Zwraca {"status", "text", "path"} albo None. Trafienie odświeża last_used (paczkami)."""
+        row = self.conn.execute(
+            "SELECT status, text, path FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_BATCH:
+            self._flush_touched()
+            self.conn.commit()
+        return {"status": row[0], "text": row[1], "path": row[2]}
+
+    def _flush_touched(self):
+        if not self._touched:
+            return
+        self.conn.executemany(
+            "UPDATE entries SET last_used = ? WHERE key = ?",
+            [(t, key) for key, t in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def put(self, key: str, status: str, text: str = "", path: str = ""):
+        size = len(text.encode("utf-8", errors="ignore"))
+        old = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        self._touched.pop(key, None)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, status, text, path, size, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, status, text, path, size, time.time()),
+        )
+        self.total += size - (old[0] if old else 0)
+        self._evict()
+        # przy okazji zapisu wyniku OCR zapisujemy też zebrane odświeżenia
+        self._flush_touched()
+        self.conn.commit()
+
+    def _evict(self):
+        if self.total <= self.max_bytes:
+            return
+
+        # inny proces mógł w międzyczasie zmienić bazę - przed usuwaniem liczymy dokładnie
+        self._flush_touched()
+        self.total = self._sum_sizes()
+        if self.total <= self.max_bytes:
+            return
+
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_used"
+        ).fetchall():
+            # outputs zostaje: po wyrzuceniu wpisu nadal wiemy, z którego PDF-a jest TXT
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total -= size
+            if self.total <= self.max_bytes:
+                break
+
+    def output_key(self, txt_name: str):
+        row = self.conn.execute(
+            "SELECT key FROM outputs WHERE txt_name = ?", (txt_name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_output(self, txt_name: str, key: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO outputs (txt_name, key) VALUES (?, ?)", (txt_name, key)
+        )
+        self.conn.commit()
+
+    def forget_output(self, txt_name: str):
+        self.conn.execute("DELETE FROM outputs WHERE txt_name = ?", (txt_name,))
+        self.conn.commit()
+
+    def close(self):
+        self._flush_touched()
+        self.conn.commit()
+        self.conn.close()
+
+
+def default_cache_path(out_txt_folder: str) -> str:
+    return os.path.join(out_txt_folder, ".ocr_cache.sqlite")
@@ -1,11 +1,33 @@
 import os
+import re
+import json
+import time
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import cv2
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from ocr_cache import (
+    DEFAULT_MAX_BYTES, STATUS_OK, STATUS_UNREADABLE,
+    OCRCache, default_cache_path, make_cache_key,
+)
+from ocr_journal import (
+    STATE_DONE, STATE_ERROR, STATE_UNREADABLE,
+    OCRJournal, default_journal_path,
+)
+from profiling import NULL_PROFILER, Profiler
 
 # Ustawienia OCR
 LANGS = "pol+eng+deu+swe+ces+slk+hun+ita+ro"
+# przebieg próbny (detect_langs): tylko alfabet łaciński z polskimi znakami - słowa kluczowe
+# pozostałych języków i tak w nim wychodzą, a Tesseract rozpoznaje każdym załadowanym modelem (2 zamiast 9)
+PROBE_LANGS = "pol+eng"
+# faktury są z polskiej firmy - polski zawsze zostaje w wybranym zestawie
+BASE_LANG = "pol"
 TESS_CONFIG = "--oem 3 --psm 6"
 
 import re
@@ -27,12 +49,758 @@ def is_text_readable(text: str, min_chars: int = 30) -> bool:
 
 
 
-def _fast_preprocess(img_bgr):
-    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+# ===================== PREPROCESSING =====================
+# Każdy etap: obraz w skali szarości (uint8, 2D) -> obraz w skali szarości.
+# Etapy działają na widokach/wynikach OpenCV, bez pośrednich kopii BGR.
+
+# docelowa mediana wysokości znaków (px) - okolice optimum dla Tesseracta
+TARGET_TEXT_HEIGHT = 24
+
+
+def _to_gray(rgb):
+    # PIL daje RGB -> jedna konwersja prosto do szarości (bez RGB->BGR->GRAY)
+    if rgb.ndim == 2:
+        return rgb
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+
+
+def _ink_mask(gray):
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return bw
+
+
+def _stage_deskew(gray, max_angle: float = 10.0):
+    """Prostowanie lekko przekrzywionych skanów (kąt z minAreaRect pikseli tekstu)."""
+    coords = cv2.findNonZero(_ink_mask(gray))
+    if coords is None:
+        return gray
+    angle = cv2.minAreaRect(coords)[-1]
+    # różne wersje OpenCV zwracają kąt w różnych zakresach -> sprowadzamy do (-45, 45]
+    if angle > 45:
+        angle -= 90
+    elif angle <= -45:
+        angle += 90
+    if abs(angle) < 0.3 or abs(angle) > max_angle:
+        return gray
+    h, w = gray.shape
+    m = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(gray, m, (w, h), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+def _stage_binarize(gray):
+    """Binaryzacja adaptacyjna - nierówne oświetlenie, szare tło, pieczątki."""
+    return cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15
+    )
+
+
+def _stage_crop(gray, margin: int = 10):
+    """Obcina białe marginesy i czarne ramki ze skanera (wiersze/kolumny prawie całe czarne)."""
+    dark = gray < 128
+    row_frac = dark.mean(axis=1)
+    col_frac = dark.mean(axis=0)
+    rows = np.flatnonzero((row_frac > 0.002) & (row_frac < 0.9))
+    cols = np.flatnonzero((col_frac > 0.002) & (col_frac < 0.9))
+    if rows.size == 0 or cols.size == 0:
+        return gray
+    y0, y1 = max(0, rows[0] - margin), min(gray.shape[0], rows[-1] + margin + 1)
+    x0, x1 = max(0, cols[0] - margin), min(gray.shape[1], cols[-1] + margin + 1)
+    return gray[y0:y1, x0:x1]
+
+
+def _stage_downscale(gray, target: int = TARGET_TEXT_HEIGHT):
+    """Zmniejsza obraz, gdy litery są dużo większe niż potrzebuje Tesseract."""
+    n, _, cc_stats, _ = cv2.connectedComponentsWithStats(_ink_mask(gray), connectivity=8)
+    heights = cc_stats[1:, cv2.CC_STAT_HEIGHT]
+    heights = heights[(heights > 5) & (heights < gray.shape[0] // 10)]
+    if heights.size < 20:
+        return gray
+    median = float(np.median(heights))
+    if median <= target * 1.3:
+        return gray
+    scale = target / median
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+PREPROCESS_STAGES = {
+    "deskew": _stage_deskew,
+    "binarize": _stage_binarize,
+    "crop": _stage_crop,
+    "downscale": _stage_downscale,
+}
+
+# domyślnie sama konwersja do szarości (jak dotychczas)
+DEFAULT_PREPROCESS = ()
+
+
+def register_preprocess_stage(name: str, fn):
+    """
+    Własny etap: fn(gray) -> gray. Rejestrować przy imporcie modułu,
+    żeby był widoczny także w procesach puli.
+    """
+    PREPROCESS_STAGES[name] = fn
+
+
+def preprocess_image(page, stages=DEFAULT_PREPROCESS, timings: dict | None = None):
+    """
+    PIL/ndarray RGB -> szarość -> kolejne etapy z `stages` (np. ("deskew", "binarize", "crop")).
+    timings (opcjonalnie): {etap: sekundy}, sumowane między wywołaniami.
+    """
+    t0 = time.perf_counter()
+    img = _to_gray(np.asarray(page))
+    if timings is not None:
+        timings["gray"] = timings.get("gray", 0.0) + time.perf_counter() - t0
+
+    for name in stages:
+        t0 = time.perf_counter()
+        img = PREPROCESS_STAGES[name](img)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - t0
+
+    # Tesseract/tesserocr chcą ciągłej pamięci (crop zwraca widok)
+    return np.ascontiguousarray(img)
+
+
+# ===================== BACKENDY OCR =====================
+
+def _parse_tess_config(config: str) -> dict:
+    """"--oem 3 --psm 6 -c x=y" -> {"oem": 3, "psm": 6, "vars": {"x": "y"}}"""
+    out = {"oem": None, "psm": None, "vars": {}}
+    parts = config.split()
+    i = 0
+    while i < len(parts):
+        p = parts[i]
+        if p in ("--oem", "--psm") and i + 1 < len(parts):
+            out[p[2:]] = int(parts[i + 1])
+            i += 2
+            continue
+        if p == "-c" and i + 1 < len(parts) and "=" in parts[i + 1]:
+            k, v = parts[i + 1].split("=", 1)
+            out["vars"][k] = v
+            i += 2
+            continue
+        i += 1
+    return out
+
+
+class PytesseractBackend:
+    """Fallback: nowy proces tesseract.exe na każdą stronę (modele ładowane za każdym razem)."""
+
+    name = "pytesseract"
+
+    def warm(self, lang: str, config: str):
+        # nic do załadowania z góry - każde wywołanie to osobny proces
+        pass
+
+    def image_to_string(self, img, lang: str, config: str) -> str:
+        return pytesseract.image_to_string(img, lang=lang, config=config)
+
+    def image_to_string_conf(self, img, lang: str, config: str):
+        """(tekst, średnia pewność słów 0-100) z jednego przebiegu image_to_data."""
+        data = pytesseract.image_to_data(
+            img, lang=lang, config=config, output_type=pytesseract.Output.DICT
+        )
+        lines = {}
+        confs = []
+        for i, word in enumerate(data["text"]):
+            if not word.strip():
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append(word)
+            conf = float(data["conf"][i])
+            if conf >= 0:
+                confs.append(conf)
+        text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+        return text, (sum(confs) / len(confs) if confs else 0.0)
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """
+    Długo żyjący silnik Tesseracta w procesie (tesserocr / C API).
+    Modele językowe ładujemy raz na (lang, config) i trzymamy najwyżej MAX_APIS ostatnio używanych
+    (detect_langs daje różne zestawy języków), obraz idzie z pamięci - bez plików tymczasowych
+    i bez uruchamiania tesseract.exe.
+    """
+
+    name = "tesserocr"
+    # każdy PyTessBaseAPI to załadowane modele (dziesiątki MB przy pełnym LANGS)
+    MAX_APIS = 4
+
+    def __init__(self):
+        import tesserocr
+        from PIL import Image
+
+        self._tesserocr = tesserocr
+        self._image = Image
+        self._apis = OrderedDict()  # (lang, config) -> PyTessBaseAPI, najdawniej używany pierwszy
+
+    def warm(self, lang: str, config: str):
+        self._api(lang, config)
+
+    def _api(self, lang: str, config: str):
+        api = self._apis.get((lang, config))
+        if api is not None:
+            self._apis.move_to_end((lang, config))
+        else:
+            cfg = _parse_tess_config(config)
+            kwargs = {"lang": lang}
+            if os.environ.get("TESSDATA_PREFIX"):
+                kwargs["path"] = os.environ["TESSDATA_PREFIX"]
+            if cfg["psm"] is not None:
+                kwargs["psm"] = cfg["psm"]
+            if cfg["oem"] is not None:
+                kwargs["oem"] = cfg["oem"]
+            api = self._tesserocr.PyTessBaseAPI(**kwargs)
+            for k, v in cfg["vars"].items():
+                api.SetVariable(k, v)
+            self._apis[(lang, config)] = api
+            while len(self._apis) > self.MAX_APIS:
+                _, old = self._apis.popitem(last=False)
+                old.End()
+        return api
+
+    def image_to_string(self, img, lang: str, config: str) -> str:
+        api = self._api(lang, config)
+        if isinstance(img, np.ndarray):
+            img = self._image.fromarray(img)
+        api.SetImage(img)
+        return api.GetUTF8Text()
+
+    def image_to_string_conf(self, img, lang: str, config: str):
+        """(tekst, średnia pewność słów 0-100) - to samo rozpoznanie, bez drugiego przebiegu."""
+        text = self.image_to_string(img, lang, config)
+        return text, float(self._api(lang, config).MeanTextConf())
+
+    def close(self):
+        for api in self._apis.values():
+            api.End()
+        self._apis.clear()
+
+
+_BACKEND_CLASSES = {
+    PytesseractBackend.name: PytesseractBackend,
+    TesserocrBackend.name: TesserocrBackend,
+}
+
+# jeden silnik na wątek (tesserocr nie jest thread-safe), w puli = jeden na proces
+_backends = threading.local()
+
+
+def resolve_backend_name(name: str = "auto") -> str:
+    """"auto" -> tesserocr jeśli jest zainstalowany, inaczej pytesseract."""
+    if name != "auto":
+        if name not in _BACKEND_CLASSES:
+            raise ValueError(f"Nieznany backend OCR: {name}")
+        return name
+    try:
+        import tesserocr  # noqa: F401
+        return TesserocrBackend.name
+    except ImportError:
+        return PytesseractBackend.name
+
+
+def get_backend(name: str = "auto"):
+    """Zwraca (i zapamiętuje) instancję backendu dla bieżącego wątku."""
+    name = resolve_backend_name(name)
+    cache = getattr(_backends, "by_name", None)
+    if cache is None:
+        cache = _backends.by_name = {}
+    backend = cache.get(name)
+    if backend is None:
+        backend = cache[name] = _BACKEND_CLASSES[name]()
+    return backend
+
+
+def _ocr_image(img_gray, backend: str = "pytesseract", langs: str = LANGS):
+    return get_backend(backend).image_to_string(img_gray, langs, TESS_CONFIG)
+
+
+def _ocr_image_conf(img_gray, backend: str = "pytesseract", langs: str = LANGS):
+    return get_backend(backend).image_to_string_conf(img_gray, langs, TESS_CONFIG)
+
+
+# ===================== WYKRYWANIE JĘZYKA =====================
+
+# znaki, które (w obrębie LANGS) ma praktycznie tylko jeden język
+LANG_CHARS = {
+    "pol": "ąćęłńśźżĄĆĘŁŃŚŹŻ",
+    "deu": "ßẞ",
+    "swe": "åÅ",
+    "ces": "ěřůĚŘŮ",
+    "slk": "ľĺŕôĽĹŔÔ",
+    "hun": "őűŐŰ",
+    "ita": "àèìòùÀÈÌÒÙ",
+    "ro": "ășşțţâîĂȘŞȚŢÂÎ",
+}
+
+# typowe słowa z faktur (małymi literami)
+LANG_WORDS = {
+    "pol": ["faktura", "sprzedawca", "nabywca", "razem", "zapłaty", "zaplaty", "wystawienia", "słownie", "kwota"],
+    "eng": ["invoice", "total", "amount due", "seller", "buyer", "subtotal", "date", "payment"],
+    "deu": ["rechnung", "mwst", "betrag", "gesamt", "summe", "steuer", "datum", "lieferant"],
+    "swe": ["moms", "summa", "belopp", "att betala", "org.nr", "förfallodatum"],
+    "ces": ["dph", "celkem", "částka", "dodavatel", "odběratel", "datum vystavení"],
+    "slk": ["faktúra", "dph", "spolu", "dodávateľ", "odberateľ", "dátum"],
+    "hun": ["számla", "áfa", "összesen", "fizetendő", "eladó", "vevő", "nettó", "bruttó"],
+    "ita": ["fattura", "iva", "totale", "imponibile", "importo", "fornitore"],
+    "ro": ["factura", "tva", "furnizor", "cumpărător", "cota", "total de plata"],
+}
+
+# słowo -> języki, w których występuje (np. "dph": ces i slk)
+WORD_LANGS = {}
+for _lang, _words in LANG_WORDS.items():
+    for _w in _words:
+        WORD_LANGS.setdefault(_w, []).append(_lang)
+
+# całe słowa ("total" nie może trafiać w "totale", "iva" w "aktywa"), wszystkie języki w jednym
+# przebiegu; dłuższe najpierw, żeby "total de plata" nie skończyło się na "total"
+LANG_WORDS_RE = re.compile(
+    r"(?<!\w)(?:" + "|".join(re.escape(w) for w in sorted(WORD_LANGS, key=len, reverse=True)) + r")(?!\w)"
+)
+
+
+def detect_langs(text: str, max_langs: int = 2, min_score: int = 3) -> str:
+    """
+    Tania heurystyka: diakrytyki + słowa kluczowe -> 1-2 najbardziej prawdopodobne języki
+    plus zawsze BASE_LANG, np. "pol" albo "deu+eng+pol". Gdy dowodów jest za mało, zwraca pełne LANGS.
+    """
+    if not text:
+        return LANGS
+
+    low = text.lower()
+    scores = {}
+    for lang, chars in LANG_CHARS.items():
+        scores[lang] = sum(text.count(c) for c in chars)
+    for word in LANG_WORDS_RE.findall(low):
+        for lang in WORD_LANGS[word]:
+            scores[lang] = scores.get(lang, 0) + 3
+
+    ranked = sorted((s, lang) for lang, s in scores.items() if s > 0)
+    ranked.reverse()
+    if not ranked or ranked[0][0] < min_score:
+        return LANGS
+
+    top = ranked[0][0]
+    # drugi język tylko gdy ma sensowny udział (np. faktura DE z angielskimi nagłówkami)
+    chosen = [lang for s, lang in ranked[:max_langs] if s >= max(min_score, top * 0.3)]
+    if BASE_LANG not in chosen:
+        chosen.append(BASE_LANG)
+    return "+".join(chosen)
+
+
+def _probe_langs(pdf_path, opts: dict, page_no: int) -> str:
+    """Szybki OCR strony w niskim DPI z PROBE_LANGS -> wybór języków do właściwego przebiegu."""
+    for page in iter_pdf_pages(pdf_path, opts["probe_dpi"], opts["poppler_path"], page_no, page_no):
+        probe = _ocr_image(_page_to_gray(page, opts), opts["backend"], PROBE_LANGS)
+        return detect_langs(probe)
+    return LANGS
+
+
+def _init_worker(tesseract_cmd, backend="pytesseract", warm_langs=LANGS):
+    # każdy proces puli ma własny moduł pytesseract -> ustawiamy ścieżkę jeszcze raz
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    # modele pierwszego przebiegu (tesserocr) ładujemy przy starcie procesu, nie przy pierwszej stronie
+    get_backend(backend).warm(warm_langs, TESS_CONFIG)
+
+
+def _poppler_tool(name: str, poppler_path: str | None) -> str:
+    # na Windows CreateProcess sam dopisze ".exe"
+    return os.path.join(poppler_path, name) if poppler_path else name
+
+
+def extract_text_layer(pdf_path, poppler_path=None, first_page=None, last_page=None) -> str:
+    """
+    Wyciąga osadzoną warstwę tekstu (PDF-y "cyfrowe") przez pdftotext z Popplera.
+    -layout trzyma wiersze tabel w jednej linii, tak jak OCR z --psm 6.
+    Zwraca "" gdy PDF nie ma warstwy tekstu.
+    """
+    cmd = [_poppler_tool("pdftotext", poppler_path), "-layout", "-enc", "UTF-8"]
+    if first_page:
+        cmd += ["-f", str(first_page)]
+    if last_page:
+        cmd += ["-l", str(last_page)]
+    cmd += [pdf_path, "-"]
+
+    result = subprocess.run(
+        cmd,
+        capture_output=True,
+        check=True,
+        timeout=60,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),  # bez okna konsoli w GUI
+    )
+    # strony są rozdzielone \f
+    return result.stdout.decode("utf-8", errors="ignore").replace("\f", "\n")
+
+
+def iter_pdf_pages(pdf_path, dpi, poppler_path=None, first_page=None, last_page=None):
+    """
+    Renderuje strony PDF-a po jednej (generator).
+    Poppler dostaje zawsze first_page == last_page, więc w pamięci jest tylko jedna strona,
+    niezależnie od długości dokumentu. Zakres włącznie, numeracja od 1.
+    """
+    first_page = first_page or 1
+    if last_page is None:
+        last_page = int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+
+    for page_no in range(first_page, last_page + 1):
+        pages = convert_from_path(
+            pdf_path, dpi=dpi, poppler_path=poppler_path,
+            first_page=page_no, last_page=page_no,
+        )
+        for page in pages:
+            yield page
+
+
+# ===================== OCR TYLKO WYBRANYCH REGIONÓW (ROI) =====================
+
+# nagłówek = pas strony (ułamki wysokości) ze sprzedawcą i datą. Sumy: "totals" = stały pas
+# (np. z szablonu sprzedawcy), None = szukanie od dołu strony po totals_lines wierszy tekstu,
+# aż trafi się linia z ROI_TOTALS_KEYWORDS i kwotą (tabela pozycji zwykle zostaje pominięta)
+ROI_DEFAULT = {"header": (0.0, 0.2), "totals": None, "totals_lines": 8}
+
+# słowa linii sum jak w extract_totals_by_context (generate_excel), bez "vat"/"netto",
+# które trafiają się też w wierszach tabeli pozycji
+ROI_TOTALS_KEYWORDS = (
+    "razem", "suma", "total", "do zapłaty", "do zaplaty", "brutto",
+    "amount due", "wartość dokumentu", "wartosc dokumentu", "gesamt",
+)
+ROI_AMOUNT_RE = re.compile(r"\d[.,-]\d{2}\b")
+
+
+def load_roi_templates(path: str) -> dict:
+    """
+    Szablony ROI per sprzedawca z pliku JSON:
+    {"SCANIA": {"totals": [0.55, 0.9]}, "INTER CARS": {"totals": [0.35, 0.8]}}
+    Klucz = fragment tekstu z nagłówka (wielkość liter bez znaczenia).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {kw.upper(): {k: tuple(v) for k, v in tpl.items()} for kw, tpl in raw.items()}
+
+
+def find_text_blocks(gray, min_area: int = 200) -> list:
+    """
+    Bloki tekstu bez Tesseracta: binaryzacja Otsu + rozmycie liter w linie/akapity
+    (dylatacja) + kontury. Zwraca listę (x, y, w, h).
+    """
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    # jądro ~ szerokość kilku liter, żeby słowa w linii skleiły się w jeden blok
+    kw = max(3, gray.shape[1] // 80)
+    kh = max(3, gray.shape[0] // 300)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kw, kh))
+    merged = cv2.dilate(bw, kernel, iterations=2)
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    blocks = []
+    for c in contours:
+        x, y, w, h = cv2.boundingRect(c)
+        if w * h >= min_area:
+            blocks.append((x, y, w, h))
+    return blocks
+
+
+def _band_rect(blocks, band, height, pad: int = 10):
+    """Prostokąt obejmujący bloki, których środek leży w pasie (y0, y1) -> (x0, y0, x1, y1) albo None."""
+    lo, hi = band[0] * height, band[1] * height
+    return _blocks_rect([b for b in blocks if lo <= b[1] + b[3] / 2 < hi], pad)
+
+
+def _blocks_rect(sel, pad: int = 10):
+    if not sel:
+        return None
+    x0 = max(0, min(b[0] for b in sel) - pad)
+    y0 = max(0, min(b[1] for b in sel) - pad)
+    x1 = max(b[0] + b[2] for b in sel) + pad
+    y1 = max(b[1] + b[3] for b in sel) + pad
+    return x0, y0, x1, y1
+
+
+def _text_rows(blocks) -> list:
+    """Bloki zgrupowane w wiersze tekstu (środek bloku w pionowym zakresie wiersza), od góry strony."""
+    rows = []
+    bottom = None
+    for b in sorted(blocks, key=lambda b: b[1]):
+        if rows and b[1] + b[3] / 2 < bottom:
+            rows[-1].append(b)
+            bottom = max(bottom, b[1] + b[3])
+        else:
+            rows.append([b])
+            bottom = b[1] + b[3]
+    return rows
+
+
+def _row_clusters(rows: list) -> list:
+    """Sąsiednie wiersze bez dużej pionowej przerwy (> 2x typowa wysokość wiersza) -> jeden prostokąt."""
+    heights = sorted(max(b[1] + b[3] for b in row) - min(b[1] for b in row) for row in rows)
+    gap_limit = 2 * heights[len(heights) // 2]
+    clusters = [[rows[0]]]
+    for prev, row in zip(rows, rows[1:]):
+        if min(b[1] for b in row) - max(b[1] + b[3] for b in prev) > gap_limit:
+            clusters.append([])
+        clusters[-1].append(row)
+    return [_blocks_rect([b for row in cluster for b in row]) for cluster in clusters]
+
+
+def _has_totals_line(text: str) -> bool:
+    for line in text.lower().splitlines():
+        if any(k in line for k in ROI_TOTALS_KEYWORDS) and ROI_AMOUNT_RE.search(line):
+            return True
+    return False
+
+
+def _match_roi_template(header_text: str, templates: dict) -> dict:
+    up = header_text.upper()
+    for kw, tpl in templates.items():
+        if kw in up:
+            return tpl
+    return {}
+
+
+def _ocr_region(img, opts: dict, langs: str, with_conf: bool, timings: dict | None = None):
+    # (tekst, pewność albo None)
+    t0 = time.perf_counter()
+    if with_conf:
+        result = _ocr_image_conf(img, opts["backend"], langs)
+    else:
+        result = _ocr_image(img, opts["backend"], langs), None
+    if timings is not None:
+        timings["tesseract"] = timings.get("tesseract", 0.0) + time.perf_counter() - t0
+    return result
+
+
+def _ocr_page_roi(gray, opts: dict, langs: str, with_conf: bool = False, timings: dict | None = None):
+    """
+    OCR tylko nagłówka i sekcji sum. Zwraca (tekst, ile_pikseli_poszło_do_OCR, pewność).
+    Szablon sprzedawcy (opts["roi"]["templates"]) wybieramy po tekście nagłówka.
+    """
+    roi = opts["roi"]
+    height = gray.shape[0]
+    blocks = find_text_blocks(gray)
+
+    header_band = roi.get("header", ROI_DEFAULT["header"])
+    texts = []
+    confs = []
+    pixels = 0
+
+    def ocr_rect(rect):
+        nonlocal pixels
+        x0, y0, x1, y1 = rect
+        text, conf = _ocr_region(gray[y0:y1, x0:x1], opts, langs, with_conf, timings)
+        confs.append(conf)
+        pixels += (y1 - y0) * (x1 - x0)
+        return text
+
+    rect = _band_rect(blocks, header_band, height)
+    header_end = header_band[1]
+    if rect:
+        texts.append(ocr_rect(rect))
+        header_end = max(header_end, rect[3] / height)
+
+    tpl = _match_roi_template("\n".join(texts), roi.get("templates", {}))
+    totals_band = tpl.get("totals", roi.get("totals", ROI_DEFAULT["totals"]))
+
+    if totals_band:
+        # nie OCR-ujemy drugi raz tego, co już było w nagłówku
+        totals_band = (max(totals_band[0], header_end), totals_band[1])
+        rect = _band_rect(blocks, totals_band, height)
+        if rect:
+            texts.append(ocr_rect(rect))
+    else:
+        # od dołu strony, po kilka wierszy, aż do linii sum (reszta tabeli pozycji zostaje bez OCR)
+        rows = _text_rows([b for b in blocks if b[1] + b[3] / 2 >= header_end * height])
+        step = max(1, roi.get("totals_lines", ROI_DEFAULT["totals_lines"]))
+        found = []
+        end = len(rows)
+        while end > 0:
+            start = max(0, end - step)
+            # pusta przestrzeń między grupami wierszy (np. sumy ... stopka) nie idzie do OCR
+            text = "\n".join(ocr_rect(rect) for rect in _row_clusters(rows[start:end]))
+            found.insert(0, text)
+            if _has_totals_line(text):
+                break
+            end = start
+        texts.extend(found)
+
+    conf = None
+    if with_conf:
+        conf = sum(confs) / len(confs) if confs else 0.0
+    return "\n".join(texts), pixels, conf
+
+
+def _page_to_gray(page, opts: dict, timings: dict | None = None):
+    gray = preprocess_image(page, opts["preprocess"], timings)
+    page.close()  # render strony nie jest już potrzebny
+    return gray
+
+
+def _ocr_page(gray, opts: dict, langs: str, with_conf: bool = False, timings: dict | None = None):
+    """OCR jednej strony (cała albo ROI). Zwraca (tekst, piksele, pewność albo None)."""
+    if opts["roi"]:
+        return _ocr_page_roi(gray, opts, langs, with_conf, timings)
+    text, conf = _ocr_region(gray, opts, langs, with_conf, timings)
+    return text, gray.shape[0] * gray.shape[1], conf
+
+
+def _ocr_pdf(pdf_path, opts: dict, first_page=None, last_page=None) -> dict:
+    """
+    Tekst jednego PDF-a (albo zakresu stron first_page..last_page, numeracja od 1).
+    Najpierw próbuje warstwy tekstu, a OCR (render + Tesseract) robi tylko gdy jej brak
+    albo jest nieczytelna. Zwraca {"text": ..., "path": "text_layer" | "ocr", "langs": ..., "dpi": [...]}.
+    Tryb adaptacyjny (opts["low_dpi"]): każda strona najpierw w niskim DPI, a ponowny render
+    w opts["dpi"] tylko gdy tekst jest nieczytelny albo pewność Tesseracta < opts["min_conf"].
+    opts: słownik ustawień z _ocr_options().
+    opts["profile"] -> wynik ma też "events": zdarzenia etapów (render, preprocess, tesseract, ...)
+    dla profiling.Profiler.merge w procesie głównym.
+    Funkcja na poziomie modułu, żeby dało się ją wysłać do ProcessPoolExecutor.
+    """
+    t0 = time.perf_counter()
+    prof = Profiler() if opts.get("profile") else NULL_PROFILER
+    poppler_path = opts["poppler_path"]
+
+    if opts["first_page_only"]:
+        first_page = last_page = 1
+
+    if opts["use_text_layer"]:
+        try:
+            with prof.stage("text_layer"):
+                text = extract_text_layer(pdf_path, poppler_path, first_page, last_page)
+        except Exception:
+            text = ""  # brak pdftotext / uszkodzony PDF -> zwykły OCR
+
+        with prof.stage("readability"):
+            readable = is_text_readable(text)
+        if readable:
+            return {
+                "text": text, "path": "text_layer", "langs": "", "seconds": time.perf_counter() - t0,
+                "events": list(prof.events),
+            }
+
+    langs = LANGS
+    if opts["detect_langs"]:
+        with prof.stage("lang_probe"):
+            langs = _probe_langs(pdf_path, opts, first_page or 1)
+
+    text = ""
+    pixels = page_pixels = 0
+    page_dpis = []
+    timings = {}
+    low_dpi = opts["low_dpi"]
+    render_dpi = low_dpi or opts["dpi"]
+
+    pages = prof.iter("render", iter_pdf_pages(pdf_path, render_dpi, poppler_path, first_page, last_page))
+    for page_no, page in enumerate(pages, start=first_page or 1):
+        with prof.stage("preprocess"):
+            gray = _page_to_gray(page, opts, timings)
+        with prof.stage("tesseract"):
+            page_text, px, conf = _ocr_page(gray, opts, langs, bool(low_dpi), timings)
+        pixels += px
+        used_dpi = render_dpi
+
+        good = True
+        if low_dpi:
+            with prof.stage("readability"):
+                good = is_text_readable(page_text) and conf >= opts["min_conf"]
+        if not good:
+            # słaby wynik -> ta sama strona jeszcze raz w pełnej rozdzielczości
+            hi_pages = iter_pdf_pages(pdf_path, opts["dpi"], poppler_path, page_no, page_no)
+            for hi_page in prof.iter("render", hi_pages):
+                with prof.stage("preprocess"):
+                    gray = _page_to_gray(hi_page, opts, timings)
+                with prof.stage("tesseract"):
+                    page_text, px, _ = _ocr_page(gray, opts, langs, timings=timings)
+                pixels += px
+            used_dpi = opts["dpi"]
+
+        page_pixels += gray.shape[0] * gray.shape[1]
+        page_dpis.append(used_dpi)
+        text += page_text + "\n"
+        del gray
+
+    return {
+        "text": text, "path": "ocr", "langs": langs, "dpi": page_dpis,
+        "pixels": pixels, "page_pixels": page_pixels, "seconds": time.perf_counter() - t0,
+        "timings": timings, "events": list(prof.events),
+    }
+
+
+def _save_ocr_text(text: str, txt_path: str, profiler=NULL_PROFILER, file: str | None = None) -> bool:
+    """Zapisuje TXT tylko gdy tekst jest czytelny. Zwraca False dla śmieci."""
+    with profiler.stage("readability", file):
+        readable = is_text_readable(text)
+    if not readable:
+        return False
+
+    with profiler.stage("txt_write", file):
+        with open(txt_path, "w", encoding="utf-8", errors="ignore") as f:
+            f.write(text)
+    return True
+
+
+def _resolve_workers(workers) -> int:
+    # None / 0 -> wszystkie rdzenie
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, int(workers))
+
+
+def _ocr_options(*, poppler_path, dpi, first_page_only, use_text_layer, backend,
+                 detect_langs, probe_dpi, roi, low_dpi, min_conf, preprocess) -> dict:
+    # ustawienia przekazywane do _ocr_pdf (również do procesów puli -> tylko proste typy)
+    preprocess = tuple(preprocess or DEFAULT_PREPROCESS)
+    # literówka w etapie ma zatrzymać start, a nie dać błąd na każdym PDF-ie (i trafić do dziennika)
+    unknown = [name for name in preprocess if name not in PREPROCESS_STAGES]
+    if unknown:
+        raise ValueError(
+            f"Nieznane etapy preprocessingu: {', '.join(unknown)} (dostępne: {', '.join(PREPROCESS_STAGES)})"
+        )
+    return {
+        "poppler_path": poppler_path,
+        "dpi": dpi,
+        "first_page_only": first_page_only,
+        "use_text_layer": use_text_layer,
+        "backend": resolve_backend_name(backend),
+        "detect_langs": detect_langs,
+        "probe_dpi": probe_dpi,
+        "roi": roi,
+        "low_dpi": low_dpi if low_dpi and low_dpi < dpi else None,
+        "min_conf": min_conf,
+        "preprocess": preprocess,
+    }
+
+
+def _roi_options(roi: bool, roi_templates) -> dict | None:
+    if not roi:
+        return None
+    if isinstance(roi_templates, str):
+        templates = load_roi_templates(roi_templates)
+    else:
+        templates = {
+            kw.upper(): {k: tuple(v) for k, v in tpl.items()}
+            for kw, tpl in (roi_templates or {}).items()
+        }
+    return {**ROI_DEFAULT, "templates": templates}
 
 
-def _ocr_image(img_gray):
-    return pytesseract.image_to_string(img_gray, lang=LANGS, config=TESS_CONFIG)
+def _cache_settings(opts: dict) -> dict:
+    # wszystko, od czego zależy tekst wynikowy -> część klucza cache
+    return {
+        "dpi": opts["dpi"],
+        "langs": LANGS,
+        "config": TESS_CONFIG,
+        "first_page_only": opts["first_page_only"],
+        "text_layer": opts["use_text_layer"],
+        "backend": opts["backend"],
+        "detect_langs": opts["detect_langs"],
+        "probe_dpi": opts["probe_dpi"] if opts["detect_langs"] else None,
+        "roi": opts["roi"],
+        "low_dpi": opts["low_dpi"],
+        "min_conf": opts["min_conf"] if opts["low_dpi"] else None,
+        "preprocess": list(opts["preprocess"]),
+    }
 
 
 def ocr_folder_pdfs(
@@ -43,65 +811,501 @@ def ocr_folder_pdfs(
     dpi: int = 200,
     first_page_only: bool = True,
     on_progress=None,
+    workers: int | None = 1,
+    use_text_layer: bool = True,
+    use_cache: bool = True,
+    cache_path: str | None = None,
+    cache_max_bytes: int = DEFAULT_MAX_BYTES,
+    backend: str = "auto",
+    detect_langs: bool = False,
+    probe_dpi: int = 100,
+    roi: bool = False,
+    roi_templates: str | dict | None = None,
+    low_dpi: int | None = None,
+    min_conf: float = 75.0,
+    preprocess=None,
+    on_output=None,
+    profiler=NULL_PROFILER,
+    journal: bool = True,
+    journal_path: str | None = None,
+    max_error_attempts: int = 3,
+    cancel=None,
+    pdf_files: list | None = None,
 ) -> dict:
+    """
+    OCR wszystkich PDF-ów z folderu do plików TXT.
+    workers=1 -> tryb szeregowy (jak dotychczas),
+    workers>1 -> pula procesów (PDF-y, a przy first_page_only=False także pojedyncze strony),
+    workers=None/0 -> tyle procesów ile rdzeni.
+    use_text_layer=True -> PDF-y z czytelną warstwą tekstu omijają render i Tesseracta.
+    use_cache=True -> cache po hashu treści PDF + ustawieniach OCR (domyślnie w out_txt_folder);
+    use_cache=False -> stary tryb: pomijamy PDF, jeśli istnieje TXT o tej samej nazwie.
+    backend: "auto" (tesserocr jeśli dostępny), "tesserocr" albo "pytesseract".
+    detect_langs=True -> przebieg próbny w probe_dpi (PROBE_LANGS) wybiera 1-2 języki + polski zamiast całego LANGS
+    (wybór trafia do stats["files"][nazwa_pdf]["langs"]).
+    roi=True -> OCR tylko nagłówka i sekcji sum (ROI_DEFAULT), opcjonalnie z szablonami
+    per sprzedawca (roi_templates: ścieżka JSON albo dict, patrz load_roi_templates);
+    stats["files"][nazwa_pdf]["roi_ratio"] = ułamek pikseli strony, który poszedł do OCR,
+    stats["roi_ratio"] = to samo dla wszystkich stron przebiegu.
+    low_dpi=150 (np.) -> adaptacyjne DPI: najpierw low_dpi, powtórka w dpi tylko dla stron,
+    które nie przejdą is_text_readable albo mają średnią pewność słów < min_conf.
+    stats["files"][nazwa_pdf]: "dpi" (lista per strona) i "seconds" (czas pliku).
+    preprocess: etapy po konwersji do szarości, np. ("deskew", "binarize", "crop", "downscale")
+    (patrz PREPROCESS_STAGES); czasy etapów i Tesseracta -> stats["stage_seconds"]
+    i stats["files"][nazwa_pdf]["timings"].
+    stats["files"][nazwa_pdf]["path"] mówi, którą drogą poszedł plik.
+    on_output(txt_path) -> wołane, gdy TXT danego PDF-a jest gotowy (nowy OCR, cache albo już
+    istniejący), np. żeby od razu puścić go do ekstrakcji (pipeline.py).
+    profiler (profiling.Profiler) -> czasy etapów per PDF (render, preprocess, tesseract, readability,
+    txt_write, ...), także z procesów puli; wyłączony (domyślnie) praktycznie nic nie kosztuje.
+    journal=True -> dziennik zadań (ocr_journal, domyślnie w out_txt_folder): stan każdego PDF-a
+    (pending/done/unreadable/error + powód i czas) zapisywany na bieżąco. Kolejny przebieg wznawia
+    z dziennika: niezmienione PDF-y done/unreadable są pomijane bez hashowania (path "journal"),
+    a PDF z błędem jest ponawiany najwyżej max_error_attempts razy (potem stats["skipped_errors"]).
+    cancel (np. threading.Event) -> przerwanie na granicy pliku: rozpoczęte pliki kończą się
+    i zapisują, reszta zostaje w dzienniku jako pending; stats["cancelled"] = True.
+    pdf_files -> tylko te PDF-y (nazwy plików w pdf_folder), np. gotowe partie z trybu watch.
+    """
 
     if tesseract_cmd:
         pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
 
     os.makedirs(out_txt_folder, exist_ok=True)
 
-    pdf_files = [f for f in os.listdir(pdf_folder) if f.lower().endswith(".pdf")]
+    if pdf_files is None:
+        pdf_files = [f for f in os.listdir(pdf_folder) if f.lower().endswith(".pdf")]
 
     total = len(pdf_files)
-    skipped_existing = 0
-    skipped_unreadable = 0
-    done = 0
-    errors = 0
-    first_error = ""
+    stats = {
+        "skipped_existing": 0,
+        "skipped_unreadable": 0,
+        "done": 0,
+        "errors": 0,
+        "first_error": "",
+        "text_layer": 0,
+        "ocr": 0,
+        "cached": 0,
+        "dpi_retries": 0,
+        "resumed": 0,
+        "skipped_errors": 0,
+        "cancelled": False,
+        "stage_seconds": {},
+        "roi_pixels": 0,
+        "roi_page_pixels": 0,
+        "files": {},
+    }
 
-    for idx, pdf in enumerate(pdf_files, start=1):
-        if on_progress:
-            on_progress(pdf, idx, total)  # (filename, current, total)
+    # najpierw walidacja ustawień (ValueError), dopiero potem cache/dziennik na dysku
+    opts = _ocr_options(
+        poppler_path=poppler_path, dpi=dpi, first_page_only=first_page_only,
+        use_text_layer=use_text_layer, backend=backend,
+        detect_langs=detect_langs, probe_dpi=probe_dpi,
+        roi=_roi_options(roi, roi_templates),
+        low_dpi=low_dpi, min_conf=min_conf, preprocess=preprocess,
+    )
+    cache = None
+    if use_cache:
+        cache = OCRCache(cache_path or default_cache_path(out_txt_folder), max_bytes=cache_max_bytes)
+    opts["profile"] = profiler.enabled
+    settings = _cache_settings(opts)
+
+    jrn = None
+    resumable = {}
+    if journal:
+        jrn = OCRJournal(journal_path or default_journal_path(out_txt_folder), settings)
+        resumable = jrn.begin(pdf_folder, pdf_files)
+
+    def on_error(pdf, e):
+        stats["errors"] += 1
+        stats["files"][pdf] = {"path": "error"}
+        if not stats["first_error"]:
+            stats["first_error"] = f"{pdf}: {repr(e)}"
+        if jrn is not None:
+            jrn.mark(pdf, STATE_ERROR, repr(e))
 
+    def on_existing(job, path="existing"):
+        stats["skipped_existing"] += 1
+        stats["files"][job["pdf"]] = {"path": path}
+        if jrn is not None and path != "journal":
+            jrn.mark(job["pdf"], STATE_DONE, path)
+        if on_output:
+            on_output(job["txt_path"])
+
+    def drop_stale_txt(job):
+        # TXT powstał z innej treści PDF-a (plik podmieniony) -> nie może zostać
+        old_key = cache.output_key(job["txt_name"])
+        if old_key is not None and old_key != job["key"]:
+            if os.path.exists(job["txt_path"]):
+                os.remove(job["txt_path"])
+            cache.forget_output(job["txt_name"])
+
+    def prepare(pdf):
+        """Zwraca zadanie do OCR albo None, jeśli plik obsłużyliśmy bez OCR."""
         name = os.path.splitext(pdf)[0]
-        pdf_path = os.path.join(pdf_folder, pdf)
-        txt_path = os.path.join(out_txt_folder, name + ".txt")
+        job = {
+            "pdf": pdf,
+            "pdf_path": os.path.join(pdf_folder, pdf),
+            "txt_name": name + ".txt",
+            "txt_path": os.path.join(out_txt_folder, name + ".txt"),
+            "key": None,
+        }
 
-        if os.path.exists(txt_path):
-            skipped_existing += 1
-            continue
+        # wznowienie z dziennika: bez hashowania PDF-a i bez zaglądania do cache
+        state, attempts = resumable.get(pdf, (None, 0))
+        if state == STATE_DONE and os.path.exists(job["txt_path"]):
+            stats["resumed"] += 1
+            on_existing(job, "journal")
+            return None
+        if state == STATE_UNREADABLE:
+            stats["resumed"] += 1
+            stats["skipped_unreadable"] += 1
+            stats["files"][pdf] = {"path": "journal"}
+            return None
+        if state == STATE_ERROR and attempts >= max_error_attempts:
+            stats["skipped_errors"] += 1
+            stats["files"][pdf] = {"path": "journal"}
+            return None
 
-        try:
-            pages = convert_from_path(pdf_path, dpi=dpi, poppler_path=poppler_path)
+        if cache is None:
+            if os.path.exists(job["txt_path"]):
+                on_existing(job)
+                return None
+            return job
 
-            text = ""
-            pages_to_process = pages[:1] if first_page_only else pages
+        with profiler.stage("cache_key", pdf):
+            job["key"] = make_cache_key(job["pdf_path"], settings)
+        hit = cache.get(job["key"])
 
-            for page in pages_to_process:
-                img = cv2.cvtColor(np.array(page), cv2.COLOR_RGB2BGR)
-                gray = _fast_preprocess(img)
-                text += _ocr_image(gray) + "\n"
+        if hit is None:
+            txt_exists = os.path.exists(job["txt_path"])
+            if txt_exists and cache.output_key(job["txt_name"]) in (None, job["key"]):
+                # TXT sprzed cache (albo wpis wyleciał z LRU) -> przejmujemy bez OCR
+                with open(job["txt_path"], "r", encoding="utf-8", errors="ignore") as f:
+                    text = f.read()
+                cache.put(job["key"], STATUS_OK, text, "existing")
+                cache.set_output(job["txt_name"], job["key"])
+                on_existing(job)
+                return None
+            return job
 
-            if not is_text_readable(text):
-                skipped_unreadable += 1
-                continue
+        stats["cached"] += 1
+
+        if hit["status"] == STATUS_UNREADABLE:
+            drop_stale_txt(job)
+            stats["skipped_unreadable"] += 1
+            stats["files"][pdf] = {"path": "cache"}
+            if jrn is not None:
+                jrn.mark(pdf, STATE_UNREADABLE, "cache")
+            return None
+
+        # ta sama treść (np. pod nową nazwą) -> odtwarzamy TXT z cache
+        if cache.output_key(job["txt_name"]) != job["key"] or not os.path.exists(job["txt_path"]):
+            with open(job["txt_path"], "w", encoding="utf-8", errors="ignore") as f:
+                f.write(hit["text"])
+            cache.set_output(job["txt_name"], job["key"])
 
-            with open(txt_path, "w", encoding="utf-8", errors="ignore") as f:
-                f.write(text)
+        on_existing(job, "cache")
+        return None
 
-            done += 1
+    def on_text(job, res):
+        pdf = job["pdf"]
+        text, path = res["text"], res["path"]
+        profiler.merge(res.get("events", ()), pdf)
+        stats["files"][pdf] = {"path": path}
+        if res.get("langs"):
+            stats["files"][pdf]["langs"] = res["langs"]
+        if opts["roi"] and res.get("page_pixels"):
+            stats["files"][pdf]["roi_ratio"] = round(res["pixels"] / res["page_pixels"], 3)
+            stats["roi_pixels"] += res["pixels"]
+            stats["roi_page_pixels"] += res["page_pixels"]
+        if res.get("dpi"):
+            stats["files"][pdf]["dpi"] = res["dpi"]
+            if opts["low_dpi"]:
+                stats["dpi_retries"] += sum(1 for d in res["dpi"] if d != opts["low_dpi"])
+        if "seconds" in res:
+            stats["files"][pdf]["seconds"] = round(res["seconds"], 3)
+        if res.get("timings"):
+            stats["files"][pdf]["timings"] = {k: round(v, 4) for k, v in res["timings"].items()}
+            for k, v in res["timings"].items():
+                stats["stage_seconds"][k] = stats["stage_seconds"].get(k, 0.0) + v
+        if path in ("text_layer", "ocr"):
+            stats[path] += 1
 
-        except Exception as e:
-            errors += 1
-            if not first_error:
-                first_error = f"{pdf}: {repr(e)}"
+        if _save_ocr_text(text, job["txt_path"], profiler, pdf):
+            stats["done"] += 1
+            if cache is not None:
+                cache.put(job["key"], STATUS_OK, text, path)
+                cache.set_output(job["txt_name"], job["key"])
+            if jrn is not None:
+                jrn.mark(pdf, STATE_DONE, path, res.get("seconds"))
+            if on_output:
+                on_output(job["txt_path"])
+        else:
+            stats["skipped_unreadable"] += 1
+            if cache is not None:
+                # wynik negatywny też zapamiętujemy -> brak ponownego OCR śmieci
+                cache.put(job["key"], STATUS_UNREADABLE, "", path)
+                drop_stale_txt(job)
+            if jrn is not None:
+                jrn.mark(pdf, STATE_UNREADABLE, f"nieczytelny tekst ({path})", res.get("seconds"))
+
+    workers = _resolve_workers(workers)
+
+    try:
+        if workers == 1:
+            for idx, pdf in enumerate(pdf_files, start=1):
+                if cancel is not None and cancel.is_set():
+                    stats["cancelled"] = True
+                    break
+
+                if on_progress:
+                    on_progress(pdf, idx, total)  # (filename, current, total)
+
+                try:
+                    job = prepare(pdf)
+                    if job is None:
+                        continue
+
+                    res = _ocr_pdf(job["pdf_path"], opts)
+                    on_text(job, res)
+                except Exception as e:
+                    on_error(pdf, e)
+        else:
+            stats["cancelled"] = _ocr_folder_parallel(
+                pdf_files, opts, tesseract_cmd, on_progress, workers, prepare, on_text, on_error, cancel,
+            )
+        journal_summary = jrn.summary() if jrn is not None else {}
+    finally:
+        if cache is not None:
+            cache.close()
+        if jrn is not None:
+            jrn.close()
 
     return {
         "total": total,
-        "skipped": skipped_existing + skipped_unreadable,
-        "skipped_existing": skipped_existing,
-        "skipped_unreadable": skipped_unreadable,
-        "done": done,
-        "errors": errors,
-        "first_error": first_error
+        "skipped": stats["skipped_existing"] + stats["skipped_unreadable"] + stats["skipped_errors"],
+        "skipped_existing": stats["skipped_existing"],
+        "skipped_unreadable": stats["skipped_unreadable"],
+        "done": stats["done"],
+        "errors": stats["errors"],
+        "first_error": stats["first_error"],
+        "text_layer": stats["text_layer"],
+        "ocr": stats["ocr"],
+        "cached": stats["cached"],
+        "dpi_retries": stats["dpi_retries"],
+        "resumed": stats["resumed"],
+        "skipped_errors": stats["skipped_errors"],
+        "cancelled": stats["cancelled"],
+        "journal": journal_summary,
+        "stage_seconds": {k: round(v, 3) for k, v in stats["stage_seconds"].items()},
+        # ROI: ułamek pikseli wszystkich stron OCR, który faktycznie poszedł do Tesseracta
+        "roi_ratio": (round(stats["roi_pixels"] / stats["roi_page_pixels"], 3)
+                      if stats["roi_page_pixels"] else None),
+        "files": stats["files"],
     }
+
+
+def _sum_timings(items) -> dict:
+    out = {}
+    for t in items:
+        for k, v in t.items():
+            out[k] = out.get(k, 0.0) + v
+    return out
+
+
+def _merge_page_results(parts: list) -> dict:
+    """Skleja wyniki _ocr_pdf dla kolejnych stron jednego PDF-a."""
+    paths = {r["path"] for r in parts}
+    langs = []
+    for r in parts:
+        for lang in r.get("langs", "").split("+"):
+            if lang and lang not in langs:
+                langs.append(lang)
+    return {
+        "text": "".join(r["text"] for r in parts),
+        "path": paths.pop() if len(paths) == 1 else "mixed",
+        "langs": "+".join(langs),
+        "dpi": [d for r in parts for d in r.get("dpi", [])],
+        "seconds": sum(r.get("seconds", 0.0) for r in parts),
+        "timings": _sum_timings(r.get("timings", {}) for r in parts),
+        "pixels": sum(r.get("pixels", 0) for r in parts),
+        "page_pixels": sum(r.get("page_pixels", 0) for r in parts),
+        "events": [e for r in parts for e in r.get("events", ())],
+    }
+
+
+def _ocr_folder_parallel(
+    pdf_files, opts, tesseract_cmd, on_progress, workers, prepare, on_text, on_error, cancel=None,
+) -> bool:
+    """
+    Rozkłada OCR na pulę procesów. Postęp raportujemy w kolejności ukończenia:
+    on_progress(filename, ile_skonczonych, total).
+    cancel.is_set() -> zadania jeszcze nie rozpoczęte są anulowane, rozpoczęte kończą się normalnie;
+    PDF z choćby jedną anulowaną stroną nie jest zapisywany. Zwraca True, jeśli przerwano.
+    """
+    total = len(pdf_files)
+    finished = 0
+
+    def report(pdf):
+        nonlocal finished
+        finished += 1
+        if on_progress:
+            on_progress(pdf, finished, total)
+
+    # pdf -> {"job", "parts": {first_page: wynik _ocr_pdf}, "pending": n, "failed": bool, "cancelled": bool}
+    jobs = {}
+    cancelled = False
+
+    def is_cancelled():
+        return cancel is not None and cancel.is_set()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker,
+        # z detect_langs pierwszy OCR każdego PDF-a to próba w PROBE_LANGS
+        initargs=(tesseract_cmd, opts["backend"], PROBE_LANGS if opts["detect_langs"] else LANGS),
+    ) as pool:
+        futures = {}
+
+        for pdf in pdf_files:
+            if is_cancelled():
+                cancelled = True
+                break
+
+            try:
+                job = prepare(pdf)
+                if job is None:
+                    report(pdf)
+                    continue
+
+                if opts["first_page_only"]:
+                    ranges = [(None, None)]
+                else:
+                    # wszystkie strony -> każda strona to osobne zadanie
+                    n_pages = int(pdfinfo_from_path(job["pdf_path"], poppler_path=opts["poppler_path"])["Pages"])
+                    ranges = [(p, p) for p in range(1, n_pages + 1)] or [(None, None)]
+            except Exception as e:
+                on_error(pdf, e)
+                report(pdf)
+                continue
+
+            jobs[pdf] = {"job": job, "parts": {}, "pending": len(ranges), "failed": False, "cancelled": False}
+
+            for first, last in ranges:
+                fut = pool.submit(_ocr_pdf, job["pdf_path"], opts, first, last)
+                futures[fut] = (pdf, first or 1)
+
+        for fut in as_completed(futures):
+            if not cancelled and is_cancelled():
+                # granica pliku: nierozpoczęte zadania wypadają, trwające dobiegają końca
+                cancelled = True
+                for f in futures:
+                    f.cancel()
+
+            pdf, page_no = futures[fut]
+            entry = jobs[pdf]
+            entry["pending"] -= 1
+
+            if fut.cancelled():
+                entry["cancelled"] = True
+            else:
+                try:
+                    entry["parts"][page_no] = fut.result()
+                except Exception as e:
+                    if not entry["failed"]:
+                        entry["failed"] = True
+                        on_error(pdf, e)
+
+            if entry["pending"]:
+                continue
+
+            if entry["cancelled"]:
+                # zostaje "pending" w dzienniku - dokończy go wznowienie
+                del jobs[pdf]
+                continue
+
+            if not entry["failed"]:
+                # sklejamy strony w kolejności, niezależnie od kolejności ukończenia
+                parts = [entry["parts"][p] for p in sorted(entry["parts"])]
+                try:
+                    on_text(entry["job"], _merge_page_results(parts))
+                except Exception as e:
+                    on_error(pdf, e)
+
+            del jobs[pdf]
+            report(pdf)
+
+    return cancelled
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser(
+        description="OCR folderu PDF-ów do TXT (bez GUI). Statystyki JSON na stdout."
+    )
+    parser.add_argument("--input", required=True, help="folder z PDF-ami")
+    parser.add_argument("--output", required=True, help="folder na pliki TXT")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--low-dpi", type=int, default=None, help="adaptacyjne DPI: pierwszy przebieg")
+    parser.add_argument("--min-conf", type=float, default=75.0)
+    parser.add_argument("--workers", type=int, default=0, help="0 = wszystkie rdzenie")
+    parser.add_argument("--all-pages", action="store_true", help="OCR wszystkich stron, nie tylko pierwszej")
+    parser.add_argument("--poppler", default=None, help="folder bin Popplera")
+    parser.add_argument("--tesseract", default=None, help="ścieżka do tesseract(.exe)")
+    parser.add_argument("--tessdata", default=None, help="folder tessdata (TESSDATA_PREFIX)")
+    parser.add_argument("--backend", default="auto", choices=["auto", "tesserocr", "pytesseract"])
+    parser.add_argument("--no-text-layer", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-journal", action="store_true", help="bez dziennika zadań (i bez wznawiania)")
+    parser.add_argument("--cache", default=None, help="ścieżka pliku cache OCR")
+    parser.add_argument("--detect-langs", action="store_true")
+    parser.add_argument("--roi", action="store_true")
+    parser.add_argument("--roi-templates", default=None)
+    parser.add_argument("--preprocess", default="", help="np. deskew,binarize,crop")
+    parser.add_argument("--progress", action="store_true", help="postęp na stderr")
+    parser.add_argument("--profile", action="store_true", help="czasy etapów (wall/CPU) w wyniku")
+    parser.add_argument("--trace", default=None, help="zapisz Chrome trace JSON; włącza profilowanie")
+    args = parser.parse_args()
+
+    if args.tessdata:
+        os.environ["TESSDATA_PREFIX"] = args.tessdata
+
+    def print_progress(filename, current, total):
+        print(f"[{current}/{total}] {filename}", file=sys.stderr, flush=True)
+
+    profiler = Profiler() if args.profile or args.trace else NULL_PROFILER
+    started = time.perf_counter()
+    result = ocr_folder_pdfs(
+        pdf_folder=args.input,
+        out_txt_folder=args.output,
+        poppler_path=args.poppler,
+        tesseract_cmd=args.tesseract,
+        dpi=args.dpi,
+        first_page_only=not args.all_pages,
+        on_progress=print_progress if args.progress else None,
+        workers=args.workers,
+        use_text_layer=not args.no_text_layer,
+        use_cache=not args.no_cache,
+        cache_path=args.cache,
+        backend=args.backend,
+        detect_langs=args.detect_langs,
+        roi=args.roi,
+        roi_templates=args.roi_templates,
+        low_dpi=args.low_dpi,
+        min_conf=args.min_conf,
+        preprocess=[p for p in args.preprocess.split(",") if p],
+        profiler=profiler,
+        journal=not args.no_journal,
+    )
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    if args.profile:
+        result["profile"] = profiler.stats()["stages"]
+    if args.trace:
+        profiler.write_chrome_trace(args.trace)
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(1 if result["errors"] else 0)
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+STATE_PENDING = "pending"
+STATE_DONE = "done"
+STATE_UNREADABLE = "unreadable"
+STATE_ERROR = "error"
+
+
+def settings_digest(settings: dict) -> str:
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class OCRJournal:
+    """
+    Dziennik zadań OCR w SQLite: PDF -> stan (pending / done / unreadable / error), powód, czas, próby.
+    Zapisywany na bieżąco (commit po każdym pliku), więc po awarii albo przerwaniu
+    wiadomo dokładnie, co zostało. Wpis jest ważny, dopóki PDF (rozmiar + mtime)
+    i ustawienia OCR się nie zmienią - wznowienie nie musi hashować gotowych plików.
+    """
+
+    def __init__(self, path: str, settings: dict):
+        self.path = path
+        self.config = settings_digest(settings)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                pdf TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                config TEXT NOT NULL,
+                state TEXT NOT NULL,
+                reason TEXT NOT NULL DEFAULT '',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                seconds REAL,
+                updated REAL NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    def begin(self, pdf_folder: str, pdf_files: list) -> dict:
+        """
+        Rejestruje przebieg: nowe/zmienione PDF-y (albo inne ustawienia OCR) -> pending,
+        wpisy plików, których już nie ma w folderze, są usuwane (pdf_files może być tylko częścią folderu).
+        Zwraca {pdf: (stan, próby)} dla wpisów nadal ważnych - na tej podstawie ocr_folder_pdfs wznawia.
+        """
+        known = {
+            pdf: (size, mtime_ns, config, state, attempts)
+            for pdf, size, mtime_ns, config, state, attempts in self.conn.execute(
+                "SELECT pdf, size, mtime_ns, config, state, attempts FROM jobs"
+            )
+        }
+
+        present = set(pdf_files)
+        gone = [
+            (pdf,) for pdf in known
+            if pdf not in present and not os.path.exists(os.path.join(pdf_folder, pdf))
+        ]
+        if gone:
+            self.conn.executemany("DELETE FROM jobs WHERE pdf = ?", gone)
+
+        valid = {}
+        reset = []
+        now = time.time()
+        for pdf in pdf_files:
+            try:
+                st = os.stat(os.path.join(pdf_folder, pdf))
+            except OSError:
+                continue  # usunięty/przeniesiony po listowaniu folderu - błąd zgłosi dopiero OCR tego pliku
+            entry = known.get(pdf)
+            if entry is not None and entry[:3] == (st.st_size, st.st_mtime_ns, self.config):
+                valid[pdf] = entry[3:]
+            else:
+                reset.append((pdf, st.st_size, st.st_mtime_ns, self.config, STATE_PENDING, now))
+
+        if reset:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO jobs (pdf, size, mtime_ns, config, state, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                reset,
+            )
+        self.conn.commit()
+        return valid
+
+    def mark(self, pdf: str, state: str, reason: str = "", seconds: float | None = None):
+        """Stan pliku po przetworzeniu (od razu na dysk). Błędy zwiększają licznik prób."""
+        self.conn.execute(
+            "UPDATE jobs SET state = ?, reason = ?, seconds = ?, updated = ?, "
+            "attempts = CASE WHEN ? = ? THEN attempts + 1 ELSE 0 END WHERE pdf = ?",
+            (state, reason, seconds, time.time(), state, STATE_ERROR, pdf),
+        )
+        self.conn.commit()
+
+    def summary(self) -> dict:
+        """{stan: liczba plików}"""
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+    def entries(self, state: str | None = None) -> list:
+        """Wpisy (np. same błędy z powodami) posortowane po nazwie PDF-a."""
+        sql = "SELECT pdf, state, reason, attempts, seconds, updated FROM jobs"
+        args = ()
+        if state is not None:
+            sql += " WHERE state = ?"
+            args = (state,)
+        cols = ("pdf", "state", "reason", "attempts", "seconds", "updated")
+        return [dict(zip(cols, row)) for row in self.conn.execute(sql + " ORDER BY pdf", args)]
+
+    def close(self):
+        self.conn.close()
+
+
+def default_journal_path(out_txt_folder: str) -> str:
+    return os.path.join(out_txt_folder, ".ocr_journal.sqlite")
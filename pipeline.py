@@ -0,0 +1,132 @@
+import os
+import time
+import queue
+import threading
+
+from ocr_engine import ocr_folder_pdfs
+from generate_excel import (
+    extract_row, extraction_version, list_ocr_txt, open_store, update_manifest,
+    write_rows, xlsx_output_path,
+)
+from row_manifest import RowManifest, default_manifest_path
+from profiling import NULL_PROFILER
+
+_DONE = object()
+
+
+def ocr_to_xlsx(
+    pdf_folder: str,
+    output_dir: str,
+    out_txt_folder: str | None = None,
+    queue_size: int = 32,
+    stream: bool = True,
+    on_progress=None,
+    on_row=None,
+    profiler=NULL_PROFILER,
+    output_file: str | None = None,
+    store=None,
+    **ocr_kwargs,
+) -> dict:
+    """
+    OCR -> ekstrakcja -> xlsx jako potok zamiast dwóch faz po sobie.
+    OCR (ocr_folder_pdfs w osobnym wątku) wrzuca ścieżkę każdego gotowego TXT do kolejki,
+    a bieżący wątek od razu wyciąga z niego wiersz do manifestu (row_manifest).
+    Kolejka ma limit queue_size -> gdy ekstrakcja nie nadąża, OCR czeka (backpressure).
+    Na końcu xlsx powstaje z manifestu w kolejności nazw plików - jak generate_xlsx.
+
+    on_progress(filename, current, total) - postęp OCR (jak w ocr_folder_pdfs),
+    on_row(txt_name, row) - po wyciągnięciu wiersza (row = None dla złej nazwy pliku),
+    profiler - wspólny profiling.Profiler dla OCR i ekstrakcji (etapy obu wątków na jednej osi czasu),
+    output_file - stała ścieżka xlsx (np. plik "na żywo" w watch.py) zamiast wynik_<data>.xlsx,
+    store - baza faktur (ścieżka albo invoice_store.InvoiceStore), jak w build_xlsx,
+    ocr_kwargs - reszta parametrów ocr_folder_pdfs (poppler_path, dpi, workers, cancel, ...).
+    Zwraca {"ocr": statystyki OCR, "xlsx": jak build_xlsx}; po przerwaniu OCR (cancel) "xlsx" = None -
+    wiersze gotowych plików zostają w manifeście, wznowienie dokończy resztę.
+    """
+    t0 = time.perf_counter()
+    if out_txt_folder is None:
+        out_txt_folder = os.path.join(pdf_folder, "ocr_txt")
+    os.makedirs(out_txt_folder, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    q = queue.Queue(maxsize=queue_size)
+    result = {}
+    # własne zdarzenie, gdy wołający nie podał - błąd ekstrakcji musi móc zatrzymać OCR
+    cancel = ocr_kwargs.pop("cancel", None) or threading.Event()
+
+    def produce():
+        try:
+            result["ocr"] = ocr_folder_pdfs(
+                pdf_folder, out_txt_folder,
+                on_progress=on_progress, on_output=q.put, profiler=profiler, cancel=cancel, **ocr_kwargs,
+            )
+        except BaseException as e:
+            result["error"] = e
+        finally:
+            q.put(_DONE)
+
+    producer = threading.Thread(target=produce, name="ocr-producer", daemon=True)
+    producer.start()
+
+    manifest = RowManifest(default_manifest_path(out_txt_folder))
+    version = extraction_version()
+    streamed = 0
+    try:
+        try:
+            while True:
+                txt_path = q.get()
+                if txt_path is _DONE:
+                    break
+                txt_name = os.path.basename(txt_path)
+                if manifest.is_fresh(out_txt_folder, txt_name, version):
+                    continue  # TXT bez zmian od poprzedniego przebiegu
+                row = extract_row(out_txt_folder, txt_name, profiler)
+                manifest.put(out_txt_folder, txt_name, version, row)
+                streamed += 1
+                if streamed % 100 == 0:
+                    manifest.commit()
+                if on_row:
+                    on_row(txt_name, row)
+        except BaseException:
+            # błąd nie czeka na koniec całego folderu: OCR staje na granicy pliku,
+            # a kolejkę opróżniamy, żeby nie zawisł na pełnej
+            cancel.set()
+            while q.get() is not _DONE:
+                pass
+            raise
+
+        producer.join()
+        manifest.commit()
+        if "error" in result:
+            raise result["error"]
+        if result["ocr"]["cancelled"]:
+            return {"ocr": result["ocr"], "xlsx": None}
+
+        # TXT, których ten przebieg OCR nie zgłosił (np. z wcześniejszych uruchomień)
+        files = list_ocr_txt(out_txt_folder)
+        extracted = streamed + update_manifest(manifest, out_txt_folder, files, profiler=profiler)
+
+        output_file = output_file or xlsx_output_path(output_dir)
+        source = manifest.iter_rows()
+        store, own_store = open_store(store)
+        if store is not None:
+            source = store.sync(out_txt_folder, source, version)
+        try:
+            count = write_rows(source, output_file, stream, profiler)
+        finally:
+            if own_store:
+                store.close()
+    finally:
+        manifest.close()
+
+    return {
+        "ocr": result["ocr"],
+        "xlsx": {
+            "output_file": output_file,
+            "files": len(files),
+            "rows": count,
+            "skipped": len(files) - count,
+            "extracted": extracted,
+            "seconds": round(time.perf_counter() - t0, 3),
+        },
+    }
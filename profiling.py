@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# jeden współdzielony "pusty" kontekst - wyłączony profiler nic nie alokuje
+_NULL_CONTEXT = nullcontext()
+_END = object()
+
+
+class Profiler:
+    """
+    Czasy etapów (wall + CPU wątku) per plik dla OCR i ekstrakcji.
+    Zdarzenie = (etap, plik, start, wall, cpu, pid, tid); start to time.perf_counter(),
+    który jest wspólny dla procesów na jednej maszynie, więc zdarzenia z procesów puli
+    (events zwrócone przez worker -> merge) lądują na tej samej osi czasu.
+    stats() -> statystyki zbiorcze, write_chrome_trace() -> plik do chrome://tracing / Perfetto.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+        self.t0 = time.perf_counter()
+
+    def _record(self, name: str, file, w0: float, c0: float):
+        self.events.append((
+            name, file, w0, time.perf_counter() - w0, time.thread_time() - c0,
+            os.getpid(), threading.get_ident(),
+        ))
+
+    @contextmanager
+    def stage(self, name: str, file: str | None = None):
+        w0 = time.perf_counter()
+        c0 = time.thread_time()
+        try:
+            yield
+        finally:
+            self._record(name, file, w0, c0)
+
+    def call(self, fn, *args, file: str | None = None):
+        """fn(*args) jako etap o nazwie funkcji (np. kolejne ekstraktory)."""
+        with self.stage(fn.__name__, file):
+            return fn(*args)
+
+    def iter(self, name: str, iterable, file: str | None = None):
+        """Mierzy każde pobranie elementu (np. render kolejnej strony z generatora)."""
+        it = iter(iterable)
+        while True:
+            w0 = time.perf_counter()
+            c0 = time.thread_time()
+            item = next(it, _END)
+            if item is _END:
+                return
+            self._record(name, file, w0, c0)
+            yield item
+
+    def merge(self, events, file: str | None = None):
+        """Zdarzenia z procesu puli; file nadpisuje nazwę pliku (np. PDF zamiast strony)."""
+        if file is None:
+            self.events.extend(events)
+        else:
+            self.events.extend((e[0], file) + tuple(e[2:]) for e in events)
+
+    def stats(self) -> dict:
+        """
+        {"stages": {etap: {"count", "wall", "cpu"}}, "files": {plik: {etap: wall}}}.
+        Etapy zagnieżdżone (np. xlsx_write w trybie strumieniowym obejmuje ekstrakcję) liczą się osobno.
+        """
+        stages = {}
+        files = {}
+        for name, file, _, wall, cpu, _, _ in self.events:
+            s = stages.setdefault(name, {"count": 0, "wall": 0.0, "cpu": 0.0})
+            s["count"] += 1
+            s["wall"] += wall
+            s["cpu"] += cpu
+            if file is not None:
+                f = files.setdefault(file, {})
+                f[name] = f.get(name, 0.0) + wall
+
+        return {
+            "stages": {
+                k: {"count": v["count"], "wall": round(v["wall"], 4), "cpu": round(v["cpu"], 4)}
+                for k, v in sorted(stages.items(), key=lambda kv: -kv[1]["wall"])
+            },
+            "files": {f: {k: round(v, 4) for k, v in st.items()} for f, st in files.items()},
+        }
+
+    def chrome_trace(self) -> dict:
+        """Format Trace Event (zdarzenia "X" w mikrosekundach)."""
+        events = []
+        for name, file, start, wall, cpu, pid, tid in self.events:
+            args = {"cpu_ms": round(cpu * 1000, 3)}
+            if file is not None:
+                args["file"] = file
+            events.append({
+                "name": name, "cat": "invoice", "ph": "X",
+                "ts": round((start - self.t0) * 1e6, 1), "dur": round(wall * 1e6, 1),
+                "pid": pid, "tid": tid, "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+
+class NullProfiler:
+    """Wyłączony profiler: ten sam interfejs, praktycznie zerowy koszt."""
+
+    enabled = False
+    events = ()
+
+    def stage(self, name: str, file: str | None = None):
+        return _NULL_CONTEXT
+
+    def call(self, fn, *args, file: str | None = None):
+        return fn(*args)
+
+    def iter(self, name: str, iterable, file: str | None = None):
+        return iterable
+
+    def merge(self, events, file: str | None = None):
+        pass
+
+    def stats(self) -> dict:
+        return {"stages": {}, "files": {}}
+
+
+NULL_PROFILER = NullProfiler()
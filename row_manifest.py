@@ -0,0 +1,106 @@
+import os
+import json
+import sqlite3
+
+from ocr_cache import file_sha256
+
+
+class RowManifest:
+    """
+    Manifest trybu przyrostowego generate_xlsx w SQLite:
+    plik TXT -> (rozmiar, mtime, sha256, wersja reguł) + wyciągnięty wiersz (JSON).
+    Wiersz jest aktualny, dopóki plik i wersja ekstrakcji się nie zmienią.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                filename TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                version TEXT NOT NULL,
+                row TEXT
+            );
+            """
+        )
+        self.conn.commit()
+
+    def stale_files(self, ocr_txt_dir: str, files: list, version: str) -> list:
+        """
+        Zwraca pliki do (ponownej) ekstrakcji: nowe, zmienione albo z inną wersją reguł.
+        Wpisy plików, których już nie ma w folderze, są usuwane.
+        Sam "touch" (inny mtime, ta sama treść) nie wymusza ekstrakcji - tylko odświeża stempel.
+        """
+        known = {
+            name: (size, mtime_ns, sha, ver)
+            for name, size, mtime_ns, sha, ver in self.conn.execute(
+                "SELECT filename, size, mtime_ns, sha256, version FROM rows"
+            )
+        }
+
+        present = set(files)
+        gone = [(name,) for name in known if name not in present]
+        if gone:
+            self.conn.executemany("DELETE FROM rows WHERE filename = ?", gone)
+
+        stale = [f for f in files if not self._check(ocr_txt_dir, f, version, known.get(f))]
+        self.conn.commit()
+        return stale
+
+    def is_fresh(self, ocr_txt_dir: str, filename: str, version: str) -> bool:
+        """Czy zapisany wiersz pliku jest aktualny (pojedynczy plik, np. w pipeline.py)."""
+        entry = self.conn.execute(
+            "SELECT size, mtime_ns, sha256, version FROM rows WHERE filename = ?", (filename,)
+        ).fetchone()
+        return self._check(ocr_txt_dir, filename, version, entry)
+
+    def _check(self, ocr_txt_dir: str, filename: str, version: str, entry) -> bool:
+        if entry is None or entry[3] != version:
+            return False
+
+        path = os.path.join(ocr_txt_dir, filename)
+        st = os.stat(path)
+        if (st.st_size, st.st_mtime_ns) == tuple(entry[:2]):
+            return True
+
+        if st.st_size == entry[0] and file_sha256(path) == entry[2]:
+            self.conn.execute(
+                "UPDATE rows SET mtime_ns = ? WHERE filename = ?", (st.st_mtime_ns, filename)
+            )
+            return True
+
+        return False
+
+    def put(self, ocr_txt_dir: str, filename: str, version: str, row):
+        """row = dict albo None (plik pominięty, np. zła nazwa) - też zapamiętujemy."""
+        path = os.path.join(ocr_txt_dir, filename)
+        st = os.stat(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO rows (filename, size, mtime_ns, sha256, version, row) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                filename, st.st_size, st.st_mtime_ns, file_sha256(path), version,
+                json.dumps(row, ensure_ascii=False) if row is not None else None,
+            ),
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def iter_rows(self):
+        """Wiersze w kolejności nazw plików (jak files.sort() - SQLite porównuje UTF-8 bajtowo)."""
+        for (row,) in self.conn.execute(
+            "SELECT row FROM rows WHERE row IS NOT NULL ORDER BY filename"
+        ):
+            yield json.loads(row)
+
+    def close(self):
+        self.conn.close()
+
+
+def default_manifest_path(ocr_txt_dir: str) -> str:
+    return os.path.join(ocr_txt_dir, ".xlsx_manifest.sqlite")
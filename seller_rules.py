@@ -0,0 +1,379 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+
+# zmiana struktury skompilowanego cache -> podbić, stare pliki cache zostaną zignorowane
+CACHE_FORMAT = 1
+
+# nazwy strategii; implementacje są w generate_excel.py
+DATE_STRATEGIES = ("default", "data_label", "poczta", "none")
+AMOUNT_STRATEGIES = ("default", "none")
+
+RULE_FIELDS = {"name", "keywords", "invoice_re", "date", "amounts", "currency"}
+# globalne flagi inline: (?i), (?ms) itd. - ale nie (?i:...) ani \(?i)
+INLINE_GLOBAL_FLAGS_RE = re.compile(r"(?<!\\)\(\?[aiLmsux]+\)")
+
+
+def _trie_pattern(node: dict) -> str:
+    """Trie -> regex; dłuższe dopasowanie ma pierwszeństwo (gałęzie przed końcem słowa)."""
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in node.items() if ch != ""]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # koniec słowa w tym węźle -> dalsza część opcjonalna
+        return "(?:" + body + ")?" if len(branches) == 1 else body + "?"
+    return body
+
+
+class KeywordMatcher:
+    """
+    Wszystkie keywordy skompilowane do jednego regexa (trie) - jedno przejście po tekście
+    zamiast osobnego `kw in t` dla każdego wpisu mapy.
+    Priorytet jak w pętli po dict: wygrywa wpis występujący w mapie najwcześniej.
+    Dla małych map (<= linear_max) zwykłe `in` w C jest szybsze niż regex - wtedy zostaje pętla.
+    """
+
+    def __init__(self, mapping: dict, linear_max: int = 150, _state: dict = None):
+        self.keywords = list(mapping.keys())
+        self.values = list(mapping.values())
+
+        if _state is not None:
+            # stan z cache na dysku - bez ponownego budowania trie
+            self.linear = _state["linear"]
+            self.best = _state["best"]
+            pattern = _state["pattern"]
+        else:
+            self.linear = len(mapping) <= linear_max
+            pattern, self.best = self._build(self.keywords)
+
+        self.pattern = pattern
+        self.regex = None
+        if self.keywords and not self.linear:
+            self.regex = re.compile(pattern)
+
+    @staticmethod
+    def _build(keywords: list):
+        trie = {}
+        for kw in keywords:
+            node = trie
+            for ch in kw:
+                node = node.setdefault(ch, {})
+            node[""] = True
+
+        # regex zwraca najdłuższy keyword zaczynający się w danej pozycji;
+        # krótsze keywordy z tej samej pozycji to jego prefiksy -> liczymy ich min indeks z góry
+        first = {}
+        for i, kw in enumerate(keywords):
+            first.setdefault(kw, i)
+        best = {}
+        for kw in first:
+            best[kw] = min(first[kw[:n]] for n in range(len(kw) + 1) if kw[:n] in first)
+
+        return _trie_pattern(trie), best
+
+    def state(self) -> dict:
+        return {"linear": self.linear, "best": self.best, "pattern": self.pattern}
+
+    def match_index(self, text: str) -> int:
+        """Indeks (w kolejności mapy) pierwszego pasującego wpisu albo -1."""
+        if self.linear:
+            for i, kw in enumerate(self.keywords):
+                if kw in text:
+                    return i
+            return -1
+        if self.regex is None:
+            return -1
+        best = -1
+        search = self.regex.search
+        m = search(text)
+        while m is not None:
+            i = self.best[m.group()]
+            if best < 0 or i < best:
+                best = i
+                if best == 0:
+                    break
+            # keywordy mogą na siebie zachodzić -> następne szukanie od kolejnego znaku
+            m = search(text, m.start() + 1) if m.start() < len(text) else None
+        return best
+
+    def match(self, text: str, default=""):
+        i = self.match_index(text)
+        return self.values[i] if i >= 0 else default
+
+
+class SellerRule:
+    """Jedna reguła sprzedawcy z pliku reguł (po walidacji)."""
+
+    __slots__ = ("name", "keywords", "invoice_re", "date", "amounts", "currency")
+
+    def __init__(self, name, keywords=(), invoice_re="", date="default", amounts="default", currency=""):
+        self.name = name
+        self.keywords = list(keywords)
+        self.invoice_re = invoice_re
+        self.date = date
+        self.amounts = amounts
+        self.currency = currency
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"SellerRule({self.name!r})"
+
+
+def validate_rules(data) -> list:
+    """
+    Sprawdza strukturę pliku reguł i zwraca listę SellerRule.
+    Błędy -> ValueError z numerem reguły, żeby dało się je szybko znaleźć w pliku.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("sellers"), list):
+        raise ValueError('Plik reguł musi mieć postać {"sellers": [...]}')
+
+    rules = []
+    group_names = {}  # nazwana grupa -> reguła, która jej używa (wspólny regex nie zniesie powtórzeń)
+    for no, item in enumerate(data["sellers"], start=1):
+        where = f"reguła #{no}"
+        if not isinstance(item, dict):
+            raise ValueError(f"{where}: oczekiwano obiektu")
+
+        unknown = set(item) - RULE_FIELDS
+        if unknown:
+            raise ValueError(f"{where}: nieznane pola {sorted(unknown)}")
+
+        name = item.get("name")
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f"{where}: brak nazwy sprzedawcy (name)")
+        where = f"{where} ({name})"
+
+        keywords = item.get("keywords", [])
+        if not isinstance(keywords, list) or not all(isinstance(k, str) and k.strip() for k in keywords):
+            raise ValueError(f"{where}: keywords musi być listą niepustych napisów")
+
+        invoice_re = item.get("invoice_re", "")
+        if not isinstance(invoice_re, str):
+            raise ValueError(f"{where}: invoice_re musi być napisem")
+        if invoice_re:
+            try:
+                groups = re.compile(invoice_re).groupindex
+            except re.error as e:
+                raise ValueError(f"{where}: błędny invoice_re: {e}")
+            for group in groups:
+                if group in group_names:
+                    raise ValueError(
+                        f"{where}: grupa (?P<{group}>...) w invoice_re jest już użyta w {group_names[group]}"
+                    )
+                group_names[group] = where
+            # wzorce są łączone w jeden regex -> numerowane odwołania wsteczne by się przesunęły
+            if re.search(r"\\[1-9]|\(\?P=", invoice_re):
+                raise ValueError(f"{where}: invoice_re nie może zawierać odwołań wstecznych")
+            # (?i) itp. działałoby na wszystkie reguły naraz (albo wywróciło kompilację) -> tylko (?i:...)
+            if INLINE_GLOBAL_FLAGS_RE.search(invoice_re):
+                raise ValueError(
+                    f"{where}: invoice_re nie może zawierać globalnych flag typu (?i) - użyj (?i:...)"
+                )
+
+        if not keywords and not invoice_re:
+            raise ValueError(f"{where}: reguła musi mieć keywords albo invoice_re")
+
+        date = item.get("date", "default")
+        if date not in DATE_STRATEGIES:
+            raise ValueError(f"{where}: nieznana strategia daty {date!r} (dozwolone: {', '.join(DATE_STRATEGIES)})")
+
+        amounts = item.get("amounts", "default")
+        if amounts not in AMOUNT_STRATEGIES:
+            raise ValueError(f"{where}: nieznana strategia kwot {amounts!r} (dozwolone: {', '.join(AMOUNT_STRATEGIES)})")
+
+        currency = item.get("currency", "")
+        if not isinstance(currency, str):
+            raise ValueError(f"{where}: currency musi być napisem")
+
+        rules.append(SellerRule(
+            name=name.strip(),
+            # tekst OCR jest porównywany po upper()
+            keywords=[k.upper() for k in keywords],
+            invoice_re=invoice_re,
+            date=date,
+            amounts=amounts,
+            currency=currency.strip().upper(),
+        ))
+
+    # ostatecznie: wzorce muszą się skompilować razem, tak jak w SellerRules
+    joined = "|".join("(" + r.invoice_re + ")" for r in rules if r.invoice_re)
+    if joined:
+        try:
+            re.compile(joined)
+        except re.error as e:
+            raise ValueError(f"invoice_re reguł nie dają się połączyć w jeden regex: {e}")
+    return rules
+
+
+class SellerRules:
+    """
+    Skompilowane indeksy reguł:
+    - numer faktury: wszystkie invoice_re połączone w jeden regex (wygrywa pierwsza reguła w pliku)
+    - tekst: wszystkie keywordy w jednym KeywordMatcher (wygrywa pierwszy keyword w pliku)
+    """
+
+    def __init__(self, rules: list, version: str = "", _state: dict = None):
+        self.rules = rules
+        self.version = version
+
+        # keyword -> indeks reguły; duplikat keyworda: zostaje pierwsza reguła
+        kw_map = {}
+        for idx, rule in enumerate(rules):
+            for kw in rule.keywords:
+                kw_map.setdefault(kw, idx)
+        self.keyword_matcher = KeywordMatcher(kw_map, _state=_state["matcher"] if _state else None)
+
+        self.invoice_regex = None
+        self.invoice_groups = {}
+        parts = []
+        group = 1
+        for idx, rule in enumerate(rules):
+            if not rule.invoice_re:
+                continue
+            parts.append("(" + rule.invoice_re + ")")
+            self.invoice_groups[group] = idx
+            group += 1 + re.compile(rule.invoice_re).groups
+        if parts:
+            self.invoice_regex = re.compile("|".join(parts))
+
+    @property
+    def keyword_map(self) -> dict:
+        """keyword -> nazwa sprzedawcy, w kolejności priorytetu."""
+        return {kw: self.rules[idx].name for kw, idx in zip(self.keyword_matcher.keywords, self.keyword_matcher.values)}
+
+    def match_invoice(self, faktura: str):
+        if self.invoice_regex is None or not faktura:
+            return None
+        m = self.invoice_regex.match(faktura)
+        if m is None:
+            return None
+        # lastindex = zewnętrzna grupa alternatywy, która dopasowała (zamyka się ostatnia)
+        return self.rules[self.invoice_groups[m.lastindex]]
+
+    def match_text(self, upper_text: str):
+        if not upper_text:
+            return None
+        idx = self.keyword_matcher.match(upper_text, default=None)
+        return self.rules[idx] if idx is not None else None
+
+    def match(self, faktura: str, upper_text: str):
+        """Reguła po numerze faktury ma pierwszeństwo przed keywordami w treści."""
+        rule = self.match_invoice(faktura)
+        if rule is None:
+            rule = self.match_text(upper_text)
+        return rule
+
+    def state(self) -> dict:
+        return {
+            "format": CACHE_FORMAT,
+            "version": self.version,
+            "rules": [r.to_dict() for r in self.rules],
+            "matcher": self.keyword_matcher.state(),
+        }
+
+
+def default_cache_path(rules_path: str) -> str:
+    folder, name = os.path.split(rules_path)
+    return os.path.join(folder, "." + os.path.splitext(name)[0] + ".cache.json")
+
+
+def load_seller_rules(path: str, cache_path: str = None) -> SellerRules:
+    """
+    Wczytuje plik reguł. Wersja = hash treści pliku.
+    Jeśli cache na dysku ma tę samą wersję, pomijamy walidację i budowę trie
+    (same regexy i tak trzeba skompilować w tym procesie).
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    version = hashlib.sha256(raw).hexdigest()[:16]
+
+    if cache_path is None:
+        cache_path = default_cache_path(path)
+
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("format") == CACHE_FORMAT and state.get("version") == version:
+            rules = [SellerRule(**r) for r in state["rules"]]
+            return SellerRules(rules, version, _state=state)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass  # brak / uszkodzony cache -> budujemy od nowa
+
+    try:
+        data = json.loads(raw.decode("utf-8-sig"))
+    except ValueError as e:
+        raise ValueError(f"Błędny JSON w pliku reguł {path}: {e}")
+
+    compiled = SellerRules(validate_rules(data), version)
+
+    try:
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(compiled.state(), f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # folder tylko do odczytu - działamy bez cache
+
+    return compiled
+
+
+class SellerRulesStore:
+    """
+    Trzyma aktualne reguły i przeładowuje je, gdy plik się zmieni (mtime/rozmiar),
+    sprawdzając najwyżej raz na check_interval sekund - bez restartu procesu.
+    Błędny plik po zmianie: zostają poprzednie reguły, błąd w last_error.
+    """
+
+    def __init__(self, path: str, cache_path: str = None, check_interval: float = 2.0):
+        self.path = path
+        self.cache_path = cache_path
+        self.check_interval = check_interval
+        self.last_error = None
+        self._rules = None
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """True jeśli reguły zostały (prze)ładowane."""
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                stamp = self._file_stamp()
+            except OSError as e:
+                if self._rules is None:
+                    raise
+                self.last_error = str(e)
+                return False
+
+            if not force and stamp == self._stamp and self._rules is not None:
+                return False
+
+            try:
+                rules = load_seller_rules(self.path, self.cache_path)
+            except (OSError, ValueError, re.error) as e:
+                if self._rules is None:
+                    raise
+                self.last_error = str(e)
+                print("REGUŁY SPRZEDAWCÓW: błąd przeładowania, zostają poprzednie:", e)
+                return False
+
+            self._rules = rules
+            self._stamp = stamp
+            self.last_error = None
+            return True
+
+    def get(self) -> SellerRules:
+        if self._rules is None or time.monotonic() - self._checked >= self.check_interval:
+            self.reload_if_changed()
+        return self._rules
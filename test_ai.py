@@ -1,11 +1,119 @@
+"""
+Testy warstwy AI (ai_fallback) na lokalnym serve_stub - bez prawdziwego API i bez kosztów:
+cache, duplikaty w paczce, ponowienia po 429/5xx.
+
+    python -m pytest -q test_ai.py
+    python test_ai.py --real     # stary test dymny na prawdziwym API (OPENAI_API_KEY)
+"""
 import os
-from openai import OpenAI
+import sys
+
+import pytest
+
+pytest.importorskip("openai")
+
+from ai_fallback import AIFallback, serve_stub  # noqa: E402
+
+
+def make_fallback(server, tmp_path, **kwargs) -> AIFallback:
+    return AIFallback(
+        cache_path=str(tmp_path / "ai_cache.sqlite"),
+        base_url=f"http://127.0.0.1:{server.server_port}/v1",
+        api_key="test",
+        backoff=0.01,
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def stub():
+    server = serve_stub(port=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_cache_hit(stub, tmp_path):
+    ai = make_fallback(stub, tmp_path)
+    first = ai.extract("FAKTURA 1\nRazem 100,00 23,00")
+    assert first["seller_name"] == "STUB SP. Z O.O."
+    assert ai.extract("FAKTURA 1\nRazem 100,00 23,00") == first
+    assert len(stub.requests) == 1
+    assert ai.stats["cached"] == 1
+    ai.close()
+
+    # cache jest trwały: nowy obiekt, ten sam plik -> bez zapytania
+    ai = make_fallback(stub, tmp_path)
+    assert ai.extract_many(["FAKTURA 1\nRazem 100,00 23,00"]) == [first]
+    assert len(stub.requests) == 1
+    ai.close()
+
+
+def test_batch_dedupe(stub, tmp_path):
+    ai = make_fallback(stub, tmp_path)
+    out = ai.extract_many(["A razem 1,00", "B razem 2,00", "A razem 1,00", "B razem 2,00", "A razem 1,00"])
+    assert all(out)
+    assert sorted(r["input"] for r in stub.requests) == ["A razem 1,00", "B razem 2,00"]
+    assert ai.stats["calls"] == 2
+    ai.close()
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retry_sync(tmp_path, status):
+    server = serve_stub(port=0, fail_first=2, fail_status=status)
+    try:
+        ai = make_fallback(server, tmp_path)
+        assert ai.extract("C razem 3,00")["currency"] == "PLN"
+        assert len(server.requests) == 3
+        assert ai.stats["retries"] == 2
+        ai.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_retry_async(tmp_path):
+    server = serve_stub(port=0, fail_first=2, fail_status=500)
+    try:
+        ai = make_fallback(server, tmp_path, concurrency=1)
+        out = ai.extract_many(["D razem 4,00", "E razem 5,00"])
+        assert all(out)
+        assert ai.stats["retries"] == 2
+        assert ai.stats["failed"] == 0
+        ai.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_retry_gives_up(tmp_path):
+    server = serve_stub(port=0, fail_first=100, fail_status=429)
+    try:
+        ai = make_fallback(server, tmp_path, max_retries=2)
+        assert ai.extract_many(["F razem 6,00"]) == [None]
+        assert len(server.requests) == 3
+        assert ai.stats["failed"] == 1
+        # nieudane odpowiedzi nie trafiają do cache
+        assert ai.cache.get(ai.key("F razem 6,00")) is None
+        ai.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def smoke_real_api():
+    from openai import OpenAI
 
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    resp = client.responses.create(
+        model="gpt-4.1-mini",
+        input="Napisz dokładnie: dziala"
+    )
+    print(resp.output_text)
 
-resp = client.responses.create(
-    model="gpt-4.1-mini",
-    input="Napisz dokładnie: dziala"
-)
 
-print(resp.output_text)
+if __name__ == "__main__":
+    if "--real" in sys.argv:
+        smoke_real_api()
+    else:
+        sys.exit(pytest.main([__file__, "-q"]))
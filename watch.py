@@ -0,0 +1,265 @@
+import os
+import time
+import threading
+from datetime import datetime
+
+from pipeline import ocr_to_xlsx
+
+LIVE_XLSX_NAME = "wynik_na_zywo.xlsx"
+
+# ile czekać na stabilny rozmiar/mtime, zanim uznamy, że skaner/kopiowanie skończyło zapis
+DEFAULT_SETTLE = 3.0
+# polling bez watchdoga; z watchdogiem rzadkie skanowanie kontrolne (zdarzenia potrafią zginąć, np. na udziałach sieciowych)
+POLL_INTERVAL = 2.0
+SAFETY_SCAN_INTERVAL = 30.0
+# partia zakończona błędem (np. plik zablokowany) wraca do kolejki po tylu sekundach
+RETRY_DELAY = 30.0
+
+
+def scan_pdfs(pdf_folder: str) -> dict:
+    """{nazwa_pdf: (rozmiar, mtime_ns)} - sam stat, bez czytania plików."""
+    out = {}
+    with os.scandir(pdf_folder) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.lower().endswith(".pdf"):
+                st = entry.stat()
+                out[entry.name] = (st.st_size, st.st_mtime_ns)
+    return out
+
+
+def looks_complete(path: str) -> bool:
+    """Kompletny PDF kończy się znacznikiem %%EOF (plik w trakcie kopiowania zwykle nie)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 2048))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False  # np. plik zablokowany przez kopiującego
+
+
+class ChangeDetector:
+    """
+    Debounce nowych/zmienionych PDF-ów: plik jest gotowy, gdy jego (rozmiar, mtime) nie zmienił się
+    przez `settle` sekund i wygląda na kompletny PDF (albo stoi bez zmian 5x dłużej - uszkodzony PDF
+    też ma trafić do OCR, żeby błąd znalazł się w dzienniku zamiast wisieć w nieskończoność).
+    """
+
+    def __init__(self, pdf_folder: str, settle: float = DEFAULT_SETTLE):
+        self.pdf_folder = pdf_folder
+        self.settle = settle
+        self.known = {}  # przetworzone: nazwa -> (rozmiar, mtime_ns)
+        self.pending = {}  # czekające: nazwa -> ((rozmiar, mtime_ns), od kiedy bez zmian)
+        self.taken = {}  # oddane do OCR, czekają na done(): nazwa -> (rozmiar, mtime_ns)
+
+    def poll(self, now: float | None = None) -> list:
+        """
+        Jedno skanowanie folderu; zwraca posortowaną listę PDF-ów gotowych do OCR.
+        Po przetworzeniu partii trzeba zawołać done() - dopiero wtedy pliki są "znane".
+        """
+        now = time.monotonic() if now is None else now
+        snapshot = scan_pdfs(self.pdf_folder)
+
+        for name in list(self.pending):
+            if name not in snapshot:
+                del self.pending[name]  # usunięty/przeniesiony w trakcie kopiowania
+        for name in list(self.known):
+            if name not in snapshot:
+                del self.known[name]
+
+        for name, stamp in snapshot.items():
+            if self.known.get(name) == stamp:
+                continue
+            seen = self.pending.get(name)
+            if seen is None or seen[0] != stamp:
+                self.pending[name] = (stamp, now)
+
+        ready = []
+        for name, (stamp, since) in self.pending.items():
+            stable = now - since
+            if stable < self.settle:
+                continue
+            if stable >= self.settle * 5 or looks_complete(os.path.join(self.pdf_folder, name)):
+                ready.append(name)
+
+        for name in ready:
+            self.taken[name] = self.pending.pop(name)[0]
+        return sorted(ready)
+
+    def done(self, names: list, ok: bool, now: float | None = None):
+        """
+        Wynik partii z poll(): ok -> pliki znane (wrócą tylko po zmianie), inaczej wracają
+        do oczekujących i będą gotowe ponownie po RETRY_DELAY sekundach.
+        """
+        now = time.monotonic() if now is None else now
+        for name in names:
+            stamp = self.taken.pop(name, None)
+            if stamp is None:
+                continue
+            if ok:
+                self.known[name] = stamp
+            else:
+                self.pending[name] = (stamp, now + RETRY_DELAY - self.settle)
+
+    def next_wait(self, interval: float) -> float:
+        # gdy coś się "uspokaja", sprawdzamy częściej niż co interval
+        return min(interval, self.settle / 2) if self.pending else interval
+
+
+def _start_observer(pdf_folder: str, wake: threading.Event):
+    """Zdarzenia systemu plików przez watchdog (opcjonalny); None = brak pakietu -> sam polling."""
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            paths = (getattr(event, "src_path", ""), getattr(event, "dest_path", ""))
+            if any(str(p).lower().endswith(".pdf") for p in paths):
+                wake.set()
+
+    observer = Observer()
+    observer.schedule(Handler(), pdf_folder, recursive=False)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
+def _wait(wake: threading.Event, stop: threading.Event, timeout: float):
+    # czekamy na zdarzenie z watchdoga albo timeout, ale stop ma działać od razu
+    deadline = time.monotonic() + timeout
+    while not stop.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or wake.wait(min(remaining, 0.5)):
+            break
+    wake.clear()
+
+
+def watch_folder(
+    pdf_folder: str,
+    output_dir: str,
+    out_txt_folder: str | None = None,
+    settle: float = DEFAULT_SETTLE,
+    interval: float | None = None,
+    use_events: bool = True,
+    stop=None,
+    on_batch=None,
+    **ocr_kwargs,
+):
+    """
+    Tryb ciągły: pilnuje folderu i każdą partię nowych/zmienionych PDF-ów od razu przepuszcza
+    przez OCR + ekstrakcję (pipeline.ocr_to_xlsx z pdf_files=partia), a plik
+    output_dir/wynik_na_zywo.xlsx jest po każdej partii podmieniany atomowo (wszystkie faktury z folderu).
+    Zdarzenia systemu plików z watchdog (jeśli jest zainstalowany), inaczej polling co `interval` s.
+    Gotowe pliki z poprzednich uruchomień przechodzą przez dziennik OCR i manifest wierszy bez ponownej pracy.
+
+    stop (threading.Event) kończy pętlę (przerywając też trwające OCR na granicy pliku),
+    on_batch(info) po każdej partii: {"files", "rows", "output_file", "seconds", "ocr", "error"}.
+    ocr_kwargs - reszta parametrów ocr_to_xlsx / ocr_folder_pdfs (store, poppler_path, dpi, workers, low_dpi, ...).
+    """
+    stop = stop or threading.Event()
+    if out_txt_folder is None:
+        out_txt_folder = os.path.join(pdf_folder, "ocr_txt")
+    os.makedirs(output_dir, exist_ok=True)
+    live_file = os.path.join(output_dir, LIVE_XLSX_NAME)
+    tmp_file = live_file + ".tmp.xlsx"
+
+    wake = threading.Event()
+    observer = _start_observer(pdf_folder, wake) if use_events else None
+    if interval is None:
+        interval = SAFETY_SCAN_INTERVAL if observer is not None else POLL_INTERVAL
+
+    detector = ChangeDetector(pdf_folder, settle)
+    unpublished = False  # xlsx gotowy, ale nie udało się go podmienić (np. otwarty w Excelu)
+
+    try:
+        while not stop.is_set():
+            ready = detector.poll()
+
+            if ready:
+                t0 = time.perf_counter()
+                info = {"files": ready, "rows": None, "output_file": live_file, "ocr": None, "error": ""}
+                ok = False
+                try:
+                    result = ocr_to_xlsx(
+                        pdf_folder, output_dir, out_txt_folder=out_txt_folder,
+                        output_file=tmp_file, stream=True, cancel=stop, pdf_files=ready, **ocr_kwargs,
+                    )
+                    info["ocr"] = result["ocr"]
+                    if result["xlsx"] is not None:
+                        info["rows"] = result["xlsx"]["rows"]
+                        unpublished = True
+                        ok = True
+                except Exception as e:
+                    info["error"] = repr(e)
+                # przerwana albo nieudana partia (zablokowany plik, brak wierszy) - ponowimy ją
+                detector.done(ready, ok)
+                info["seconds"] = round(time.perf_counter() - t0, 3)
+            else:
+                info = None
+
+            if unpublished:
+                try:
+                    os.replace(tmp_file, live_file)
+                    unpublished = False
+                except OSError as e:
+                    if info is not None and not info["error"]:
+                        info["error"] = f"Nie można podmienić {live_file} (otwarty?): {e!r}"
+
+            if info is not None and on_batch:
+                on_batch(info)
+
+            _wait(wake, stop, detector.next_wait(interval))
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join(timeout=5)
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Obserwuj folder z PDF-ami: OCR + ekstrakcja nowych faktur na bieżąco, xlsx na żywo"
+    )
+    parser.add_argument("--input", required=True, help="folder z PDF-ami (tu skaner zrzuca pliki)")
+    parser.add_argument("--output", required=True, help="folder na wynik_na_zywo.xlsx")
+    parser.add_argument("--txt", default=None, help="folder TXT (domyślnie <input>/ocr_txt)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE, help="sekundy bez zmian pliku przed OCR")
+    parser.add_argument("--interval", type=float, default=None, help="co ile sekund skanować folder")
+    parser.add_argument("--poll", action="store_true", help="bez watchdog - sam polling")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--low-dpi", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=0, help="0 = wszystkie rdzenie")
+    parser.add_argument("--poppler", default=None, help="folder bin Popplera")
+    parser.add_argument("--tesseract", default=None, help="ścieżka do tesseract(.exe)")
+    parser.add_argument("--tessdata", default=None, help="folder tessdata (TESSDATA_PREFIX)")
+    parser.add_argument("--store", default=None, help="baza faktur SQLite, do której trafiają wiersze")
+    args = parser.parse_args()
+
+    if args.tessdata:
+        os.environ["TESSDATA_PREFIX"] = args.tessdata
+
+    def print_batch(info):
+        stamp = datetime.now().strftime("%H:%M:%S")
+        if info["error"]:
+            print(f"[{stamp}] {len(info['files'])} PDF - BŁĄD: {info['error']}", file=sys.stderr, flush=True)
+        else:
+            print(f"[{stamp}] {len(info['files'])} PDF w {info['seconds']} s, wierszy w xlsx: {info['rows']}",
+                  flush=True)
+
+    stop = threading.Event()
+    print(f"Obserwuję {args.input} (Ctrl+C kończy)", flush=True)
+    try:
+        watch_folder(
+            args.input, args.output, out_txt_folder=args.txt,
+            settle=args.settle, interval=args.interval, use_events=not args.poll,
+            stop=stop, on_batch=print_batch,
+            poppler_path=args.poppler, tesseract_cmd=args.tesseract,
+            dpi=args.dpi, low_dpi=args.low_dpi, workers=args.workers, store=args.store,
+        )
+    except KeyboardInterrupt:
+        stop.set()